@@ -0,0 +1,72 @@
+import os
+import time
+import random
+
+from cocotb.decorators import coroutine
+
+from src.utils import *
+
+""" Adapter benchmark
+Simulated cycles per second of the RTL simulation with the TileLink
+adapter in one clock handler against one coroutine per channel. The same
+generated inputs are run in both modes, alternating the order per input.
+"""
+@coroutine
+def Benchmark(dut, toplevel,
+              num_iter=20, template='Template', out='output', debug=False):
+
+    assert toplevel in ['RocketTile', 'BoomTile' ], \
+        '{} is not toplevel'.format(toplevel)
+    random.seed(0)
+
+    (mutator, preprocessor, isaHost, rtlHost, checker) = \
+        setup(dut, toplevel, template, out, 0, debug)
+
+    modes = [ ('per_channel', True), ('clock_handler', False) ]
+    stats = { name: [ 0, 0.0, 0 ] for (name, per_channel) in modes } # cycles, seconds, runs
+
+    print('Start Benchmark')
+
+    for it in range(1, num_iter + 1):
+        (sim_input, data) = mutator.get(it)
+        (isa_input, rtl_input, symbols) = preprocessor.process(sim_input, data, False, it, None)
+        if not (isa_input and rtl_input):
+            continue
+
+        order = modes if it % 2 else modes[::-1]
+        rets = []
+        for (name, per_channel) in order:
+            rtlHost.adapter.per_channel = per_channel
+
+            start = time.time()
+            ret = yield rtlHost.run_test(rtl_input, False, it)
+            seconds = time.time() - start
+
+            stats[name][0] += rtlHost.cycles
+            stats[name][1] += seconds
+            stats[name][2] += 1
+            rets.append((ret[0], rtlHost.cycles))
+
+        if rets[0] != rets[1]:
+            print('Iteration {}: modes differ, {} vs {}'.format(it, rets[0], rets[1]))
+
+        input_files = out + '/tests/.input_{}{}'.format(it, sim_input.name_suffix)
+        for ext in [ '.symbols', '.hex', '.S', '.elf' ]:
+            if os.path.isfile(input_files + ext): os.remove(input_files + ext)
+        if os.path.isfile(out + '/trace/rtl_{}.log'.format(it)):
+            os.remove(out + '/trace/rtl_{}.log'.format(it))
+
+    isaHost.close()
+
+    lines = [ '{:<14}\t{:<10}\t{:<10}\t{:<10}'.format('mode', 'runs', 'cycles', 'cycles/s') ]
+    for (name, per_channel) in modes:
+        (cycles, seconds, runs) = stats[name]
+        lines.append('{:<14}\t{:<10}\t{:<10}\t{:<10.1f}'.
+                     format(name, runs, cycles, cycles / max(seconds, 1e-9)))
+
+    (base, new) = [ stats[name] for (name, per_channel) in modes ]
+    if base[1] and new[1]:
+        lines.append('speedup: {:.2f}x'.format((new[0] / new[1]) / max(base[0] / base[1], 1e-9)))
+
+    save_file(out + '/benchmark.txt', 'w', '\n'.join(lines) + '\n')
+    print('\n'.join(lines))
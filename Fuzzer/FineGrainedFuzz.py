@@ -11,6 +11,7 @@ from src.multicore_manager import proc_state, procManager
 
 from Fuzzer import Run
 from Minimizer import Minimize
+from Benchmark import Benchmark
 
 ### Multicore Fuzzing ###
 
@@ -49,12 +50,19 @@ parser.add_option('record', 0, 'Record the result')
 parser.add_option('multicore', 0, 'The number of cores to use')
 parser.add_option('debug', 0, 'Debugging?')
 parser.add_option('minimize', 0, 'Minimizing?')
+parser.add_option('benchmark', 0, 'Benchmark the simulated cycles/s of the TileLink adapter modes over num_iter inputs')
 parser.add_option('prob_intr', 0, 'Probability of asserting interrupt')
 parser.add_option('no_guide', 0, 'Only random testing?')
 parser.add_option('run_elf', None, 'ELF file to run')
 parser.add_option('seed_dir', None, 'seed directory for running a specific set of seeds')
 parser.add_option('ALL_CSR', 0, 'Enable ALL_CSR configuration, Spike version must be set to ALL_CSR version for this to work')
 parser.add_option('FP_CSR', 0, 'Enable FP_CSR configuration')
+parser.add_option('fast_build', 0, 'Build p-m/p-s/p-u tests in-process instead of gcc/elf2hex/nm')
+parser.add_option('build_check', 0, 'Cross-check every in-process build against gcc')
+parser.add_option('spike_server', 0, 'Keep spike running as a server (--server) instead of one spike per test')
+parser.add_option('pipeline', 0, 'Number of iterations compiled and run on spike ahead of the RTL simulation (0: off)')
+parser.add_option('native', 0, 'Run the tile in the native Verilator harness (make native) instead of through cocotb')
+parser.add_option('transition_log', 0, 'Keep seen CSR transitions in a binary log (transition.bin) reloaded at startup and shared by the workers')
 
 parser.print_help()
 parser.parse_option()
@@ -64,6 +72,8 @@ record = parser.arg_map['record'][0]
 multicore = min(parser.arg_map['multicore'][0], 40)
 minimize = parser.arg_map['minimize'][0]
 parser.arg_map.pop('minimize', None)
+benchmark = parser.arg_map['benchmark'][0]
+parser.arg_map.pop('benchmark', None)
 
 toplevel = parser.arg_map['toplevel'][0]
 template = parser.arg_map['template'][0]
@@ -105,7 +115,15 @@ if (multicore or record) and not os.path.isfile(cov_log):
 start_time = time.time()
 
 if not multicore:
-    if minimize:
+    if benchmark:
+        factory = TestFactory(Benchmark)
+        factory.add_option('toplevel', [toplevel])
+        factory.add_option('num_iter', [parser.arg_map['num_iter'][0]])
+        factory.add_option('template', [template])
+        factory.add_option('out', [out])
+        factory.add_option('debug', [debug])
+
+    elif minimize:
         factory = TestFactory(Minimize)
         factory.add_option('toplevel', [toplevel])
         factory.add_option('template', [template])
@@ -15,7 +15,11 @@ from src.multicore_manager import proc_state
 RISCVDV_SCRIPTS = os.path.abspath("src/scripts/")
 sys.path = ( [ RISCVDV_SCRIPTS ] + sys.path)
 
-from spike_log_to_trace_csv import process_spike_sim_log
+from spike_log_to_trace_csv import read_spike_commits, split_spike_trace, write_spike_commits
+from src.pipeline import rvPipeline
+
+# Iterations between two dumps of the scheduler and data seed statistics
+SCHED_DUMP = 100
 
 # debugpy.listen(("0.0.0.0", 4000))
 # print("Ready For Connections.")
@@ -27,17 +31,27 @@ def Run(dut, toplevel,
 		num_iter=1, template='Template', in_file=None,
 		out='output', record=True, cov_log=None,
 		multicore=0, manager=None, proc_num=0, start_time=0, start_iter=0, start_cov=0,
-		prob_intr=0, no_guide=False, seed_dir=None, debug=True, run_elf=None, ALL_CSR=False, FP_CSR=False):
+		prob_intr=0, no_guide=False, seed_dir=None, debug=True, run_elf=None, ALL_CSR=False, FP_CSR=False,
+		pipeline=0, fast_build=False, build_check=False, spike_server=False, transition_log=False,
+		native=False):
 
 	assert toplevel in ['RocketTile', 'BoomTile' ], \
 		'{} is not toplevel'.format(toplevel)
+	# The covmaps of the workers are stored and restored through the cocotb DUT
+	assert not (native and multicore), 'NATIVE=1 does not support MULTICORE'
 	random.seed(time.time() * (proc_num + 1))
 
 	(mutator, preprocessor, isaHost, rtlHost, checker) = \
-		setup(dut, toplevel, template, out, proc_num, debug, no_guide=no_guide)
+		setup(dut, toplevel, template, out, proc_num, debug, no_guide=no_guide,
+			  fast_build=fast_build, build_check=build_check,
+			  spike_server=spike_server, native=native)
 
 	if in_file or run_elf: num_iter = 1
 
+	if transition_log:
+		num_trns = trns_db.open(out + '/transition.bin')
+		debug_print('[Fuzzer] {} transitions loaded'.format(num_trns), debug)
+
 	if seed_dir:
 		seed_list = glob.glob(seed_dir+'/.input_*.si')
 		num_iter = len(seed_list)
@@ -52,19 +66,33 @@ def Run(dut, toplevel,
 	print('Start Fuzzing', debug)
 
 	if multicore:
+		manager.P('covMap')
 		yield manager.cov_restore(dut)
+		# Round trip of the restored map through the RTL
+		yield manager.cov_store(dut, proc_num)
+		manager.check_covmap(proc_num)
+		manager.V('covMap')
 
 	now = datetime.now()
 	ct = datetime.now()
 
+	pipe = None
+	if pipeline and not (in_file or seed_dir or run_elf):
+		pipe = rvPipeline(preprocessor, isaHost, out, proc_num, pipeline,
+						  ISA_TIME_LIMIT, debug)
+	prep = None
+
+	corpus_seq = 0
 	for it in range(1, num_iter+1):
 		print('Iteration [{}]'.format(it), debug)
+		iter_start = time.time()
 
 		if multicore:
-			if it == 0:
-				mutator.update_corpus(out + '/corpus', 1000)
-			elif it % 1000 == 0:
-				mutator.update_corpus(out + '/corpus')
+			# Corpus entries the other workers found since the last iteration
+			(corpus_seq, entries) = manager.pull_corpus(corpus_seq)
+			for entry in entries:
+				(shared_input, shared_data) = manager.load_corpus(entry)
+				mutator.add_shared_corpus(shared_input, shared_data)
 
 		assert_intr = False
 
@@ -75,6 +103,9 @@ def Run(dut, toplevel,
 			if len(seed_i)==0:
 				continue
 			(sim_input, data, assert_intr) = mutator.read_siminput(seed_i[0])
+		elif pipe:
+			prep = pipe.pop(it, num_iter, lambda n: mutator.get(n, False))
+			(sim_input, data) = (prep.sim_input, prep.data)
 		else: 
 			(sim_input, data) = mutator.get(it, assert_intr)
 
@@ -83,13 +114,17 @@ def Run(dut, toplevel,
 			for inst, INT in zip(sim_input.get_insts(), sim_input.ints + [0]):
 				print('{:<50}{:04b}'.format(inst, INT))
 
-		(isa_input, rtl_input, symbols) = preprocessor.process(sim_input, data, assert_intr, it, run_elf)
+		if pipe:
+			(isa_input, rtl_input, symbols) = (prep.isa_input, prep.rtl_input, prep.symbols)
+		else:
+			(isa_input, rtl_input, symbols) = preprocessor.process(sim_input, data, assert_intr, it, run_elf)
 
 		if seed_dir:
+			# Not written by the in-process build
 			input_files = out + '/tests/.input_{}{}.symbols'.format(it, sim_input.name_suffix)
-			os.remove(input_files)
+			if os.path.isfile(input_files): os.remove(input_files)
 			input_files = out + '/tests/.input_{}{}.hex'.format(it, sim_input.name_suffix)
-			os.remove(input_files)
+			if os.path.isfile(input_files): os.remove(input_files)
 			input_files = out + '/tests/.input_{}{}.S'.format(it, sim_input.name_suffix)
 			os.remove(input_files)
 			input_files = out + '/tests/.input_{}{}.si'.format(it, sim_input.name_suffix)
@@ -102,23 +137,44 @@ def Run(dut, toplevel,
 			name = str(sim_input.it)+sim_input.name_suffix
 			
 			try:
-				(ret, coverage, visit_path) = yield rtlHost.run_test(rtl_input, assert_intr, it)
-				ret = run_isa_test(isaHost, isa_input, stop, out, proc_num, assert_intr, isa_log, name)
-				trns = extract_transitions(isa_log, out, it, ALL_CSR, FP_CSR)
-				process_spike_sim_log(isa_log, isa_csv)
+				if pipe and prep.exc: raise prep.exc
+				run_start = time.time()
+				if native:
+					(ret, coverage, visit_path) = rtlHost.run_test(rtl_input, assert_intr, it)
+				else:
+					(ret, coverage, visit_path) = yield rtlHost.run_test(rtl_input, assert_intr, it)
+				sim_input.exec_time = time.time() - run_start
+				if pipe:
+					# Spike and the log parsing already ran on a pipeline worker
+					ret = prep.isa_ret
+					commits = prep.commits
+				else:
+					ret = run_isa_test(isaHost, isa_input, stop, out, proc_num, assert_intr, isa_log, name)
+					commits = read_spike_commits(isa_log)
+				# One pass over the spike log feeds both the transitions and the trace
+				isa_trace = []
+				trns = extract_transitions(split_spike_trace(commits, isa_trace), out, it, ALL_CSR, FP_CSR)
+				if debug:
+					write_spike_commits(isa_trace, isa_csv)
 			except:
 				stop[0] = proc_state.ERR_RTL_SIM
 				print("ERROR: Test run failed")
 				continue
 
 			sim_input.set_visit_path(visit_path, mutator.CFG)
-			mutator.accumulate_coverage(sim_input.visited_path)
+			new_blocks = mutator.accumulate_coverage(sim_input.visited_path)
+			mutator.report(sim_input, new_blocks + trns, time.time() - iter_start)
+
+			if multicore:
+				# Share this iteration's coverage with the other workers
+				yield manager.cov_store(dut, proc_num)
+				global_coverage = manager.merge_covmap(proc_num)
 			
 			
 
 			rtl_log = out+"/trace/rtl_"+str(it)+".log"
 			
-			chk = trace_compare(isa_csv, rtl_log, toplevel)
+			(chk, num_delayed) = trace_compare(isa_trace, rtl_log, toplevel)
 			if chk==-1: mis_count += 1
 
 			if assert_intr and ret == SUCCESS:
@@ -136,11 +192,13 @@ def Run(dut, toplevel,
 			ct = datetime.now()
 			# print("Iteration: {}, ElapsedTime: {}, Coverage: {}, Transitions: {}".format(it, ct-now, coverage, trns))
    
-			print("Iteration: {}, ElapsedTime: {}, Coverage: {}".format(it, ct-now, coverage))
+			print("Iteration: {}, ElapsedTime: {}, Coverage: {}, DelayedWB: {}".format(it, ct-now, coverage, num_delayed))
+			if multicore:
+				print("GlobalCoverage: {}".format(global_coverage))
 			cause = '-'
 			match = False
 			if ret == SUCCESS:
-				match = checker.check(symbols)
+				match = checker.check(symbols, isa_input.sigfile)
 			elif ret == ILL_MEM:
 				match = True
 				debug_print('Memory access outside DRAM -- {}'. \
@@ -178,15 +236,19 @@ def Run(dut, toplevel,
 							  format(time.time() - start_time, start_iter + it,
 									 start_cov + coverage))
 					sim_input.save(out + '/corpus/id_{}.si'.format(cNum))
+				if multicore:
+					manager.publish_corpus(proc_num, cNum, sim_input, data, trns, coverage)
 
 				cNum += 1
-			mutator.add_corpus(sim_input)
+			# Only inputs reaching new blocks or transitions join the corpus
+			if new_blocks or trns > 0:
+				mutator.add_corpus(sim_input)
 			last_coverage = coverage
-			# Remove symbols and hex files to save storage
+			# Remove symbols and hex files to save storage (not written by the in-process build)
 			input_files = out + '/tests/.input_{}{}.symbols'.format(it, sim_input.name_suffix)
-			os.remove(input_files)
+			if os.path.isfile(input_files): os.remove(input_files)
 			input_files = out + '/tests/.input_{}{}.hex'.format(it, sim_input.name_suffix)
-			os.remove(input_files)
+			if os.path.isfile(input_files): os.remove(input_files)
 			input_files = out + '/tests/.input_{}{}.S'.format(it, sim_input.name_suffix)
 			os.remove(input_files)
 			input_files = out + '/tests/.input_{}{}.elf'.format(it, sim_input.name_suffix)
@@ -197,7 +259,11 @@ def Run(dut, toplevel,
 			# os.remove(input_files)
 			input_files = out + '/trace/rtl_{}.log'.format(it)
 			os.remove(input_files)
+			if isa_input.sigfile and os.path.isfile(isa_input.sigfile):
+				os.remove(isa_input.sigfile)
 			mutator.update_phase(it)
+			if record and it % SCHED_DUMP == 0:
+				mutator.dump_stats(out, proc_num)
 
 		else:
 			stop[0] = proc_state.ERR_COMPILE
@@ -205,6 +271,17 @@ def Run(dut, toplevel,
 			print("ERROR: Compile failed")
 			continue
 
+	if pipe:
+		pipe.shutdown()
+	isaHost.close()
+	if record:
+		mutator.dump_stats(out, proc_num)
+	trns_db.close()
+
+	if fast_build:
+		print('In-process builds: {}, gcc fallbacks: {}, cross-check failures: {}'. \
+			  format(preprocessor.num_fast, preprocessor.num_fallback, preprocessor.num_check_fail))
+
 	if multicore:
 		save_err(out, proc_num, manager, stop[0])
 		manager.set_state(proc_num, stop[0])
@@ -1,31 +1,135 @@
 import sys
 import os
+import time
+import select
+import queue
 import subprocess
 
 class isaInput():
-    def __init__(self, binary, intrfile):
+    def __init__(self, binary, intrfile, sigfile=None):
         self.binary = binary
         self.intrfile = intrfile
+        self.sigfile = sigfile
+
+SERVER_REPLY = b'spike-server: '
+
+""" Spike server
+Long-lived spike (--server) running one test per request line on its stdin.
+Each test is simulated on a freshly reset simulator instance inside the
+same process, so only the spike startup is saved, not the isolation.
+"""
+class spikeServer():
+    def __init__(self, spike, spike_args):
+        self.args = [ spike, '--server' ] + spike_args
+        self.proc = subprocess.Popen(self.args, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE)
+        self.buf = b''
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def readline(self, deadline):
+        while b'\n' not in self.buf:
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0: return None
+
+            (ready, _, _) = select.select([ self.proc.stdout ], [], [], wait)
+            if not ready: return None
+
+            chunk = os.read(self.proc.stdout.fileno(), 4096)
+            if not chunk: return b''
+            self.buf += chunk
+
+        (line, self.buf) = self.buf.split(b'\n', 1)
+        return line + b'\n'
+
+    def run(self, log, intrfile, sigfile, binary, timeout=None):
+        request = '\t'.join([ log, intrfile, sigfile, binary ]) + '\n'
+        try:
+            self.proc.stdin.write(request.encode())
+            self.proc.stdin.flush()
+        except BrokenPipeError:
+            return self.proc.wait()
+
+        deadline = None
+        if timeout: deadline = time.time() + timeout
+
+        while True:
+            line = self.readline(deadline)
+            if line is None:
+                # Only this server is killed, the pool starts a new one
+                self.kill()
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            if not line:
+                return self.proc.wait()
+
+            if line.startswith(SERVER_REPLY):
+                return int(line[len(SERVER_REPLY):])
+
+            # Console output of the test program
+            sys.stdout.write(line.decode(errors='replace'))
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.wait()
+
+    def close(self):
+        if self.alive():
+            self.proc.stdin.close()
+            try: self.proc.wait(timeout=1)
+            except subprocess.TimeoutExpired: self.kill()
 
 class rvISAhost():
-    def __init__(self, spike, spike_args, isa_sigfile, debug=True):
+    def __init__(self, spike, spike_args, isa_sigfile, debug=True, server=False):
         self.spike = spike
         self.spike_args = spike_args
         self.isa_sigfile = isa_sigfile
 
         self.debug= debug
 
+        # Idle spike servers, one is taken per concurrent run_test
+        self.server = server
+        self.servers = queue.Queue()
+
     def debug_print(self, message):
         if self.debug:
             print(message)
 
-    def run_test(self, isa_input: isaInput, assert_intr=False, log='spike.log'):
+    def run_test(self, isa_input: isaInput, assert_intr=False, log='spike.log', timeout=None):
         binary = isa_input.binary
         if assert_intr: intr = [ '--intr={}'.format(isa_input.intrfile) ]
         else: intr = []
 
+        sigfile = self.isa_sigfile
+        if isa_input.sigfile: sigfile = isa_input.sigfile
+
+        if self.server:
+            return self.run_server(isa_input, assert_intr, log, sigfile, timeout)
+
         args = [ self.spike ] + ["-l", "--log="+log, "--log-commits"] + self.spike_args + intr + \
-            [ '+signature={}'.format(self.isa_sigfile), binary ] 
+            [ '+signature={}'.format(sigfile), binary ]
         self.debug_print('[ISAHost] Start ISA simulation')
         #print(args)
-        return subprocess.call(args)
+        # With timeout, only this spike is killed and TimeoutExpired is raised
+        return subprocess.call(args, timeout=timeout)
+
+    def run_server(self, isa_input, assert_intr, log, sigfile, timeout):
+        try: server = self.servers.get_nowait()
+        except queue.Empty:
+            server = spikeServer(self.spike, [ "-l", "--log-commits" ] + self.spike_args)
+
+        intrfile = isa_input.intrfile if assert_intr else ''
+
+        self.debug_print('[ISAHost] Start ISA simulation')
+        try:
+            ret = server.run(log, intrfile, sigfile, isa_input.binary, timeout)
+        finally:
+            if server.alive(): self.servers.put(server)
+
+        return ret
+
+    def close(self):
+        while not self.servers.empty():
+            self.servers.get_nowait().close()
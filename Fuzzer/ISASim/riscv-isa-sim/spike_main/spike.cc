@@ -58,6 +58,9 @@ static void help(int exit_code = 1)
   fprintf(stderr, "  --initrd=<path>       Load kernel initrd into memory\n");
   fprintf(stderr, "  --bootargs=<args>     Provide custom bootargs for kernel [default: console=hvc0 earlycon=sbi]\n");
   fprintf(stderr, "  --real-time-clint     Increment clint time at real-time rate\n");
+  fprintf(stderr, "  --server              Run tests requested on stdin, one per line:\n");
+  fprintf(stderr, "                          <log>\\t<intr>\\t<signature>\\t<target program>\n");
+  fprintf(stderr, "                          and reply \"spike-server: <exit code>\" on stdout\n");
   fprintf(stderr, "  --dm-progsize=<words> Progsize for the debug module [default 2]\n");
   fprintf(stderr, "  --dm-sba=<bits>       Debug bus master supports up to "
       "<bits> wide accesses [default 0]\n");
@@ -222,17 +225,13 @@ int main(int argc, char** argv)
   bool dump_dts = false;
   bool dtb_enabled = true;
   bool real_time_clint = false;
+  bool server = false;
   const char* intr = NULL;
-  std::map<reg_t, reg_t> intrs;
-  reg_t intr_offset, intr_size;
   size_t nprocs = 1;
   const char* kernel = NULL;
-  reg_t kernel_offset, kernel_size;
-  size_t initrd_size;
-  reg_t initrd_start = 0, initrd_end = 0;
   const char* bootargs = NULL;
   reg_t start_pc = reg_t(-1);
-  std::vector<std::pair<reg_t, mem_t*>> mems;
+  const char* mem_spec = "2048";
   std::vector<std::pair<reg_t, abstract_device_t*>> plugin_devices;
   std::unique_ptr<icache_sim_t> ic;
   std::unique_ptr<dcache_sim_t> dc;
@@ -324,7 +323,7 @@ int main(int argc, char** argv)
   parser.option('l', 0, 0, [&](const char* s){log = true;});
   parser.option(0, "intr", 1, [&](const char* s){intr = s;});
   parser.option('p', 0, 1, [&](const char* s){nprocs = atoi(s);});
-  parser.option('m', 0, 1, [&](const char* s){mems = make_mems(s);});
+  parser.option('m', 0, 1, [&](const char* s){mem_spec = s;});
   // I wanted to use --halted, but for some reason that doesn't work.
   parser.option('H', 0, 0, [&](const char* s){halted = true;});
   parser.option(0, "rbb-port", 1, [&](const char* s){use_rbb = true; rbb_port = atoi(s);});
@@ -346,6 +345,7 @@ int main(int argc, char** argv)
   parser.option(0, "initrd", 1, [&](const char* s){initrd = s;});
   parser.option(0, "bootargs", 1, [&](const char* s){bootargs = s;});
   parser.option(0, "real-time-clint", 0, [&](const char *s){real_time_clint = true;});
+  parser.option(0, "server", 0, [&](const char *s){server = true;});
   parser.option(0, "extlib", 1, [&](const char *s){
     void *lib = dlopen(s, RTLD_NOW | RTLD_GLOBAL);
     if (lib == NULL) {
@@ -378,78 +378,127 @@ int main(int argc, char** argv)
 
   auto argv1 = parser.parse(argv);
   std::vector<std::string> htif_args(argv1, (const char*const*)argv + argc);
-  if (mems.empty())
-    mems = make_mems("2048");
 
-  if (!*argv1)
+  if (!server && !*argv1)
     help();
 
-  if (intr && check_file_exists(intr)) {
-    intr_size = get_file_size(intr);
-    intrs = read_intr(intr, intr_offset);
-  }
+  // Everything a test modifies (memories, harts, devices, log) is created
+  // per test, so the server mode starts each test from the reset state
+  auto run_test = [&](const char* test_log, const char* test_intr,
+                      const std::vector<std::string>& test_args) -> int {
+    std::map<reg_t, reg_t> intrs;
+    reg_t intr_offset, intr_size;
+    reg_t kernel_offset, kernel_size;
+    size_t initrd_size;
+    reg_t initrd_start = 0, initrd_end = 0;
+    std::vector<std::pair<reg_t, mem_t*>> mems = make_mems(mem_spec);
+
+    if (test_intr && check_file_exists(test_intr)) {
+      intr_size = get_file_size(test_intr);
+      intrs = read_intr(test_intr, intr_offset);
+    }
 
-  if (kernel && check_file_exists(kernel)) {
-    kernel_size = get_file_size(kernel);
-    if (isa[2] == '6' && isa[3] == '4')
-      kernel_offset = 0x200000;
-    else
-      kernel_offset = 0x400000;
-    for (auto& m : mems) {
-      if (kernel_size && (kernel_offset + kernel_size) < m.second->size()) {
-         read_file_bytes(kernel, 0, m.second->contents() + kernel_offset, kernel_size);
-         break;
+    if (kernel && check_file_exists(kernel)) {
+      kernel_size = get_file_size(kernel);
+      if (isa[2] == '6' && isa[3] == '4')
+        kernel_offset = 0x200000;
+      else
+        kernel_offset = 0x400000;
+      for (auto& m : mems) {
+        if (kernel_size && (kernel_offset + kernel_size) < m.second->size()) {
+           read_file_bytes(kernel, 0, m.second->contents() + kernel_offset, kernel_size);
+           break;
+        }
       }
     }
-  }
 
-  if (initrd && check_file_exists(initrd)) {
-    initrd_size = get_file_size(initrd);
-    for (auto& m : mems) {
-      if (initrd_size && (initrd_size + 0x1000) < m.second->size()) {
-         initrd_end = m.first + m.second->size() - 0x1000;
-         initrd_start = initrd_end - initrd_size;
-         read_file_bytes(initrd, 0, m.second->contents() + (initrd_start - m.first), initrd_size);
-         break;
+    if (initrd && check_file_exists(initrd)) {
+      initrd_size = get_file_size(initrd);
+      for (auto& m : mems) {
+        if (initrd_size && (initrd_size + 0x1000) < m.second->size()) {
+           initrd_end = m.first + m.second->size() - 0x1000;
+           initrd_start = initrd_end - initrd_size;
+           read_file_bytes(initrd, 0, m.second->contents() + (initrd_start - m.first), initrd_size);
+           break;
+        }
       }
     }
-  }
 
-  sim_t s(isa, priv, varch, nprocs, intrs, halted, real_time_clint,
-      initrd_start, initrd_end, bootargs, start_pc, mems, plugin_devices, htif_args,
-      std::move(hartids), dm_config, log_path, dtb_enabled, dtb_file);
-  std::unique_ptr<remote_bitbang_t> remote_bitbang((remote_bitbang_t *) NULL);
-  std::unique_ptr<jtag_dtm_t> jtag_dtm(
-      new jtag_dtm_t(&s.debug_module, dmi_rti));
-  if (use_rbb) {
-    remote_bitbang.reset(new remote_bitbang_t(rbb_port, &(*jtag_dtm)));
-    s.set_remote_bitbang(&(*remote_bitbang));
-  }
+    int return_code = 0;
+    {
+      sim_t s(isa, priv, varch, nprocs, intrs, halted, real_time_clint,
+          initrd_start, initrd_end, bootargs, start_pc, mems, plugin_devices, test_args,
+          hartids, dm_config, test_log, dtb_enabled, dtb_file);
+      std::unique_ptr<remote_bitbang_t> remote_bitbang((remote_bitbang_t *) NULL);
+      std::unique_ptr<jtag_dtm_t> jtag_dtm(
+          new jtag_dtm_t(&s.debug_module, dmi_rti));
+      if (use_rbb) {
+        remote_bitbang.reset(new remote_bitbang_t(rbb_port, &(*jtag_dtm)));
+        s.set_remote_bitbang(&(*remote_bitbang));
+      }
 
-  if (dump_dts) {
-    printf("%s", s.get_dts());
-    return 0;
-  }
+      if (dump_dts) {
+        printf("%s", s.get_dts());
+      } else {
+        if (ic && l2) ic->set_miss_handler(&*l2);
+        if (dc && l2) dc->set_miss_handler(&*l2);
+        if (ic) ic->set_log(log_cache);
+        if (dc) dc->set_log(log_cache);
+        for (size_t i = 0; i < nprocs; i++)
+        {
+          if (ic) s.get_core(i)->get_mmu()->register_memtracer(&*ic);
+          if (dc) s.get_core(i)->get_mmu()->register_memtracer(&*dc);
+          if (extension) s.get_core(i)->register_extension(extension());
+        }
+
+        s.set_debug(debug);
+        s.configure_log(log, log_commits);
+        s.set_histogram(histogram);
+
+        return_code = s.run();
+      }
+    }
 
-  if (ic && l2) ic->set_miss_handler(&*l2);
-  if (dc && l2) dc->set_miss_handler(&*l2);
-  if (ic) ic->set_log(log_cache);
-  if (dc) dc->set_log(log_cache);
-  for (size_t i = 0; i < nprocs; i++)
-  {
-    if (ic) s.get_core(i)->get_mmu()->register_memtracer(&*ic);
-    if (dc) s.get_core(i)->get_mmu()->register_memtracer(&*dc);
-    if (extension) s.get_core(i)->register_extension(extension());
-  }
+    for (auto& mem : mems)
+      delete mem.second;
 
-  s.set_debug(debug);
-  s.configure_log(log, log_commits);
-  s.set_histogram(histogram);
+    return return_code;
+  };
 
-  auto return_code = s.run();
+  int return_code = 0;
+  if (server) {
+    std::string line;
+    while (std::getline(std::cin, line)) {
+      std::vector<std::string> fields;
+      std::istringstream stream(line);
+      std::string field;
+      while (std::getline(stream, field, '\t'))
+        fields.push_back(field);
+
+      int ret = -1;
+      if (fields.size() == 4) {
+        std::vector<std::string> args(htif_args);
+        if (!fields[2].empty())
+          args.push_back("+signature=" + fields[2]);
+        args.push_back(fields[3]);
+
+        try {
+          ret = run_test(fields[0].empty() ? log_path : fields[0].c_str(),
+                         fields[1].empty() ? NULL : fields[1].c_str(), args);
+        } catch (std::exception& e) {
+          fprintf(stderr, "spike-server: %s\n", e.what());
+        }
+      } else {
+        fprintf(stderr, "spike-server: malformed request '%s'\n", line.c_str());
+      }
 
-  for (auto& mem : mems)
-    delete mem.second;
+      fflush(stderr);
+      printf("spike-server: %d\n", ret);
+      fflush(stdout);
+    }
+  } else {
+    return_code = run_test(log_path, intr, htif_args);
+  }
 
   for (auto& plugin_device : plugin_devices)
     delete plugin_device.second;
@@ -1,25 +1,31 @@
 import sys
 import cocotb
+import numpy as np
 
 from cocotb.decorators import coroutine
-from cocotb.triggers import Timer, RisingEdge
+from cocotb.triggers import Timer, RisingEdge, ClockCycles, First
+from cocotb.utils import get_sim_time
 from reader.tile_reader import tileSrcReader
 from adapters.tile_adapter import tileAdapter
+from mem_model import pageMemory, DRAM_BASE
 
 SUCCESS = 0
 ASSERTION_FAIL = 1
 TIME_OUT = 2
 ILL_MEM = -1
 
-DRAM_BASE = 0x80000000
+# Simulation steps per clock cycle
+CLK_PERIOD = 2
 
 class rtlInput():
-    def __init__(self, hexfile, intrfile, data, symbols, max_cycles):
+    def __init__(self, hexfile, intrfile, data, symbols, max_cycles, image=None):
         self.hexfile = hexfile
         self.intrfile = intrfile
         self.data = data
         self.symbols = symbols
         self.max_cycles = max_cycles
+        # Text words from _start, set when built in-process (no hexfile)
+        self.image = image
 
 class rvRTLhost():
     def __init__(self, dut, toplevel, rtl_sig_file, debug=False):
@@ -42,13 +48,18 @@ class rvRTLhost():
         self.dut = dut
         self.adapter = tileAdapter(dut, port_names, monitor, self.debug)
 
+        self.cov_signals = self.get_cov_signals()
+        self.set_cov_layout([ len(sig) for sig in self.cov_signals ])
+
+        # Clock cycles simulated by the last run_test
+        self.cycles = 0
+
     def debug_print(self, message):
         if self.debug:
             print(message)
 
     def set_bootrom(self):
-        bootrom_addrs = []
-        memory = {}
+        memory = pageMemory()
         bootrom = [ 0x00000297, # auipc t0, 0x0
                     0x02028593, # addi a1, t0, 32
                     0xf1402573, # csrr a0, mhartid
@@ -66,14 +77,13 @@ class rvRTLhost():
                     0x00000000,
                     0x00000000 ] # no data
 
-        for i in range(0, len(bootrom), 2):
-            bootrom_addrs.append(0x10000 + i * 4)
-            memory[0x10000 + i * 4] = (bootrom[i+1] << 32) | bootrom[i]
+        words = [ (bootrom[i+1] << 32) | bootrom[i] for i in range(0, len(bootrom), 2) ]
+        memory.load(0x10000, words, rom=True)
 
-        return (bootrom_addrs, memory)
+        return memory
 
     @coroutine
-    def clock_gen(self, clock, period=2):
+    def clock_gen(self, clock, period=CLK_PERIOD):
         while True:
             clock <= 1
             yield Timer(period / 2)
@@ -96,54 +106,70 @@ class rvRTLhost():
         reset <= 0
 
     def save_signature(self, memory, sig_start, sig_end, data_addrs, sig_file):
-        fd = open(sig_file, 'w')
-        for i in range(sig_start, sig_end, 16):
-            dump = '{:016x}{:016x}\n'.format(memory[i+8], memory[i])
-            fd.write(dump)
-
+        lines = memory.dump_lines(sig_start, sig_end)
         for (data_start, data_end) in data_addrs:
-            for i in range(data_start, data_end, 16):
-                dump = '{:016x}{:016x}\n'.format(memory[i+8], memory[i])
-                fd.write(dump)
+            lines += memory.dump_lines(data_start, data_end)
 
+        fd = open(sig_file, 'w')
+        fd.write(''.join([ line + '\n' for line in lines ]))
         fd.close()
 
     def get_covsum(self):
         cov_mask = (1 << len(self.dut.io_covSum)) - 1
         return self.dut.io_covSum.value & cov_mask
 
-    def get_path(self):
-        # Iterate all coverages with coverage{i}
-        path_list = []
-        for i in range(0,200):
-            # if getattr(dut, "coverage{i}") is exist
-            if hasattr(self.dut, "coverage{}".format(i)):
-                visit_path = getattr(self.dut, "coverage{}".format(i)).value
-                for j in range(0, len(visit_path)):
-                    if visit_path[j]==1:
-                        path_list.append((i,j))
-            else:
+    def get_cov_signals(self):
+        # Coverages are coverage0, coverage1, ... up to the first missing one
+        signals = []
+        for i in range(0, 200):
+            name = "coverage{}".format(i)
+            if not hasattr(self.dut, name):
                 break
-        return path_list
-    
-    @coroutine
-    def run_test(self, rtl_input: rtlInput, assert_intr: bool, iteration):
+            signals.append(getattr(self.dut, name))
+        return signals
 
-        self.debug_print('[RTLHost] Start RTL simulation')
+    def set_cov_layout(self, widths):
+        """ (i, j) of every bit of the concatenated big-endian coverage bytes,
+        j counts from the MSB as the bit index of the signal value """
+        self.cov_bytes = [ (width + 7) // 8 for width in widths ]
 
-        fd = open(rtl_input.hexfile, 'r')
-        lines = fd.readlines()
-        fd.close()
+        cov_sig = []
+        cov_bit = []
+        for (i, width) in enumerate(widths):
+            pad = self.cov_bytes[i] * 8 - width
+            cov_sig.append(np.full(self.cov_bytes[i] * 8, i, dtype=np.int64))
+            cov_bit.append(np.arange(self.cov_bytes[i] * 8, dtype=np.int64) - pad)
 
-        max_cycles = rtl_input.max_cycles
+        self.cov_sig = np.concatenate(cov_sig + [ np.zeros(0, dtype=np.int64) ])
+        self.cov_bit = np.concatenate(cov_bit + [ np.zeros(0, dtype=np.int64) ])
+
+    def cov_path(self, cov):
+        """ (i, j) rows of the set bits of the coverage bytes """
+        bits = np.flatnonzero(np.unpackbits(np.frombuffer(cov, dtype=np.uint8)))
+        return np.stack([ self.cov_sig[bits], self.cov_bit[bits] ], axis=1)
+
+    def get_path(self):
+        cov = b''.join([ sig.value.integer.to_bytes(num, 'big')
+                         for (sig, num) in zip(self.cov_signals, self.cov_bytes) ])
+        return self.cov_path(cov)
+
+    def load_input(self, rtl_input: rtlInput, assert_intr: bool):
+        """ DUT memory and interrupts of rtl_input, with the symbols the run
+        needs: (memory, ints, tohost_addr, sig_start, sig_end, data_addrs) """
+        if rtl_input.image:
+            lines = rtl_input.image
+        else:
+            fd = open(rtl_input.hexfile, 'r')
+            lines = [ int(line, 16) for line in fd.readlines() ]
+            fd.close()
 
         symbols = rtl_input.symbols
         _start = symbols['_start']
         _end = symbols['_end_main']
 
-        (bootrom_addrs, memory) = self.set_bootrom()
-        for (i, addr) in enumerate(range(_start, _end + 36, 8)):
-            memory[addr] = int(lines[i], 16)
+        memory = self.set_bootrom()
+        num = len(range(_start, _end + 36, 8))
+        memory.load(_start, lines[:num])
 
         '''
         tohost 是一个特殊地址，用于与仿真器或测试环境进行通信。在 RISC-V 的测试和仿真环境中，典型的用法如下：
@@ -155,9 +181,8 @@ class rvRTLhost():
         sig_start = symbols['begin_signature']
         sig_end = symbols['end_signature']
 
-        memory[tohost_addr] = 0
-        for addr in range(sig_start // 8 * 8, sig_end, 8):
-            memory[addr] = 0
+        memory.load(tohost_addr, [ 0 ])
+        memory.fill(sig_start // 8 * 8, (sig_end + 7) // 8 * 8)
 
         data = rtl_input.data
         data_addrs = []
@@ -167,9 +192,8 @@ class rvRTLhost():
             data_end = symbols['_end_data{}'.format(n)]
             data_addrs.append((data_start, data_end))
 
-            for i, addr in enumerate(range(data_start // 8 * 8, data_end // 8 * 8, 8)):
-                word = data[i + offset]
-                memory[addr] = word
+            num = len(range(data_start // 8 * 8, data_end // 8 * 8, 8))
+            memory.load(data_start // 8 * 8, data[offset:offset + num])
 
             offset += (data_end - data_start) // 8
 
@@ -182,39 +206,41 @@ class rvRTLhost():
             for pair in intr_pairs:
                 ints[int(pair[0], 16)] = int(pair[1], 2)
 
+        return (memory, ints, tohost_addr, sig_start, sig_end, data_addrs)
+
+    @coroutine
+    def run_test(self, rtl_input: rtlInput, assert_intr: bool, iteration):
+
+        self.debug_print('[RTLHost] Start RTL simulation')
+
+        max_cycles = rtl_input.max_cycles
+        (memory, ints, tohost_addr, sig_start, sig_end, data_addrs) = \
+            self.load_input(rtl_input, assert_intr)
+
         clk = self.dut.clock
         clk_driver = cocotb.fork(self.clock_gen(clk))
-        clkedge = RisingEdge(clk)
         self.dut.iteration = iteration
         yield self.reset(clk, self.dut.metaReset, self.dut.reset)
         self.dut.eos = 0
+        # Set by the adapter on the cycle tohost reaches the memory
+        tohost = self.adapter.watch_tohost(memory, tohost_addr)
         self.adapter.start(memory, ints)
-        for i in range(max_cycles):
-            yield clkedge
-
-            if i % 100 == 0:
-                tohost = memory[tohost_addr]
-                if tohost:
-                    self.dut.eos = 1  # chath: set end of sim
-                    break
-                else:
-                    self.adapter.probe_tohost(tohost_addr)
+        start = get_sim_time()
+        yield First(tohost.wait(), ClockCycles(clk, max_cycles))
+        self.cycles = (get_sim_time() - start) // CLK_PERIOD
 
-        self.dut.eos = 1
+        self.dut.eos = 1  # chath: set end of sim
         yield self.adapter.stop()
         clk_driver.kill()
 
-        # Check all the CPU's memory access operations occurs in DRAM
-        mem_check = True
-        for addr in memory.keys():
-            if addr not in bootrom_addrs and addr < DRAM_BASE:
-                print("{:08x}".format(addr))
-                mem_check = False
+        # All the CPU's memory accesses must be in DRAM, checked on access
+        for addr in memory.ill_addrs:
+            print("{:08x}".format(addr))
 
-        if not mem_check:
+        if memory.ill_addrs:
             return (ILL_MEM, self.get_covsum())
 
-        if i == max_cycles - 1:
+        if not tohost.fired:
             self.debug_print('[RTLHost] Timeout, max_cycle={}'.format(max_cycles))
             return (TIME_OUT, self.get_covsum())
 
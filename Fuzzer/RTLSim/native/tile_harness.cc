@@ -0,0 +1,424 @@
+// Native tile harness.
+//
+// The Verilated tile (RocketTile/BoomTile) driven from C++: the TileLink
+// slave memory (tl_slave.h), the interrupts on the committed PCs and the
+// tohost check of tile_adapter.py/host.py run next to the model instead of
+// through VPI. RTLSim/native_host.py loads the library with ctypes, hands
+// it the memory image and the interrupt schedule of a run and reads back
+// the status, the coverage and the memory. The commit trace is written by
+// the RTL itself (+TRACE), as in the cocotb run.
+//
+// Signals are looked up by name in the public scopes of the model
+// (verilator --public-flat-rw), the names cocotb uses.
+
+#include <cstdio>
+
+#include <verilated.h>
+#include <verilated_syms.h>
+
+#define STR(x) #x
+#define XSTR(x) STR(x)
+#define HEADER(x) XSTR(x.h)
+#include HEADER(VTOP)
+
+#include "tl_slave.h"
+
+using tl::sig_t;
+using tl::ensure;
+
+#define TH_API extern "C" __attribute__((visibility("default")))
+
+// tile_adapter.py
+enum { INT_MTIP = 0x1, INT_MSIP = 0x2, INT_MEIP = 0x4, INT_SEIP = 0x8 };
+
+// host.py reset
+const int RESET_CYCLES = 5;
+
+// Cycles for the DUT to give its blocks back after the run, where the
+// cocotb run would wait forever
+const uint64_t STOP_CYCLES = 100000;
+
+#if !VL_CONTEXT
+// Simulation time of the models before VerilatedContext
+static uint64_t main_time = 0;
+double sc_time_stamp() { return main_time; }
+#endif
+
+class tile_harness_t {
+public:
+    std::string error;
+
+    tile_harness_t(const char* toplevel, int argc, const char** argv)
+        : scope(std::string("TOP.") + toplevel)
+    {
+#if VL_CONTEXT
+        contextp = new VerilatedContext;
+        contextp->commandArgs(argc, argv);
+        top = new VTOP(contextp);
+#else
+        Verilated::commandArgs(argc, argv);
+        top = new VTOP;
+#endif
+
+        ensure(find("clock", clock) && find("reset", reset) && find("metaReset", meta_reset),
+               scope + " has no clock/reset/metaReset");
+        find("eos", eos);
+
+        // Coverages are coverage0, coverage1, ... up to the first missing one
+        for (int i = 0; i < 200; i++) {
+            sig_t sig;
+            if (!find(("coverage" + std::to_string(i)).c_str(), sig))
+                break;
+            coverage.push_back(sig);
+        }
+    }
+
+    ~tile_harness_t()
+    {
+        top->final();
+        delete top;
+#if VL_CONTEXT
+        delete contextp;
+#endif
+    }
+
+    // The variable of name in the toplevel scope (or its dotted subscope)
+    bool find(const char* name, sig_t& sig)
+    {
+        std::string path = scope, var = name;
+        size_t dot = var.rfind('.');
+        if (dot != std::string::npos) {
+            path += "." + var.substr(0, dot);
+            var = var.substr(dot + 1);
+        }
+
+        for (const std::string& scope_name : { path, std::string("TOP") }) {
+            const VerilatedScope* scopep = scope_find(scope_name.c_str());
+            VerilatedVar* varp = scopep ? scopep->varFind(var.c_str()) : nullptr;
+            if (!varp)
+                continue;
+
+            switch (varp->vltype()) {
+            case VLVT_UINT8: sig.bytes = 1; break;
+            case VLVT_UINT16: sig.bytes = 2; break;
+            case VLVT_UINT32: sig.bytes = 4; break;
+            case VLVT_UINT64: sig.bytes = 8; break;
+            case VLVT_WDATA: sig.bytes = 0; break;
+            default: return false;
+            }
+            sig.p = varp->datap();
+            sig.width = varp->packed().elements();
+            return true;
+        }
+        return false;
+    }
+
+    // field is <channel>_<attr> of a TileLink port, int_<seip|meip|msip|mtip>,
+    // pc or pc_valid
+    int bind(const char* field, const char* name)
+    {
+        sig_t* sig = field_sig(field);
+        if (!sig)
+            return -2;
+        if (!find(name, *sig))
+            return -1;
+
+        std::string attr = field;
+        if (attr.size() > 2 && attr[1] == '_' && attr != "pc_valid" &&
+            attr.substr(2) != "valid" && attr.substr(2) != "ready")
+            channel(attr[0])->bits.push_back(sig);
+        return 0;
+    }
+
+    void set_ints(const uint64_t* pcs, const uint32_t* vals, int num)
+    {
+        ints.clear();
+        for (int i = 0; i < num; i++)
+            ints[pcs[i]] = vals[i];
+    }
+
+    // host.py run_test: reset, serve the tile until tohost is written or
+    // max_cycles, then take the blocks back. The cycles from the reset.
+    uint64_t run(uint64_t tohost_addr, uint64_t max_cycles)
+    {
+        slave.init();
+        slave.watch_tohost(tohost_addr);
+
+        do_reset();
+        if (eos.p)
+            eos.set(0);
+
+        slave.start();
+        intr = 0;
+        drive = true;
+        uint64_t cycles = 0;
+        step();
+        while (!slave.tohost_fired && cycles < max_cycles) {
+            cycle();
+            cycles++;
+            step();
+        }
+
+        // Closes the trace of the RTL
+        if (eos.p)
+            eos.set(1);
+        top->eval();
+
+        // tile_adapter.py stop
+        drive = false;
+        uint64_t stop_cycles = 0;
+        while (slave.on_going()) {
+            cycle();
+            step();
+            ensure(++stop_cycles < STOP_CYCLES, "TileLink transactions still ongoing after the run");
+        }
+        slave.stop();
+        while (slave.drive) {
+            cycle();
+            step();
+            ensure(++stop_cycles < STOP_CYCLES, "the DUT did not give its blocks back after the run");
+        }
+        slave.close_ports();
+
+        intr = 0;
+        for (sig_t* port : { &seip, &meip, &msip, &mtip })
+            if (port->p)
+                port->set(0);
+        top->eval();
+
+        return cycles;
+    }
+
+    // Big-endian bytes of coverage0, coverage1, ...
+    int cov(uint8_t* out)
+    {
+        int num = 0;
+        for (const sig_t& sig : coverage) {
+            if (out)
+                sig.get_bytes(out + num);
+            num += (sig.width + 7) / 8;
+        }
+        return num;
+    }
+
+    int cov_widths(int* out, int max)
+    {
+        for (int i = 0; i < (int)coverage.size() && i < max; i++)
+            out[i] = coverage[i].width;
+        return coverage.size();
+    }
+
+    tl::tl_slave_t slave;
+
+private:
+#if VL_CONTEXT
+    VerilatedContext* contextp;
+#endif
+    VTOP* top;
+    std::string scope;
+
+    sig_t clock, reset, meta_reset, eos;
+    sig_t seip, meip, msip, mtip, pc, pc_valid;
+    std::vector<sig_t> coverage;
+
+    std::unordered_map<uint64_t, uint32_t> ints;
+    uint32_t intr = 0;
+    bool drive = false;
+
+    tl::channel_t* channel(char name)
+    {
+        switch (name) {
+        case 'a': return &slave.a;
+        case 'b': return &slave.b;
+        case 'c': return &slave.c;
+        case 'd': return &slave.d;
+        case 'e': return &slave.e;
+        }
+        return nullptr;
+    }
+
+    sig_t* field_sig(const std::string& field)
+    {
+        if (field == "pc") return &pc;
+        if (field == "pc_valid") return &pc_valid;
+        if (field == "int_seip") return &seip;
+        if (field == "int_meip") return &meip;
+        if (field == "int_msip") return &msip;
+        if (field == "int_mtip") return &mtip;
+
+        tl::channel_t* ch = field.size() > 2 && field[1] == '_' ? channel(field[0]) : nullptr;
+        if (!ch)
+            return nullptr;
+
+        std::string attr = field.substr(2);
+        if (attr == "opcode") return &ch->opcode;
+        if (attr == "param") return &ch->param;
+        if (attr == "size") return &ch->size;
+        if (attr == "source") return &ch->source;
+        if (attr == "address") return &ch->address;
+        if (attr == "mask") return &ch->mask;
+        if (attr == "data") return &ch->data;
+        if (attr == "corrupt") return &ch->corrupt;
+        if (attr == "denied") return &ch->denied;
+        if (attr == "sink") return &ch->sink;
+        if (attr == "valid") return &ch->valid;
+        if (attr == "ready") return &ch->ready;
+        return nullptr;
+    }
+
+    const VerilatedScope* scope_find(const char* name)
+    {
+#if VL_CONTEXT
+        return contextp->scopeFind(name);
+#else
+        return Verilated::scopeFind(name);
+#endif
+    }
+
+    void time_inc()
+    {
+#if VL_CONTEXT
+        contextp->timeInc(1);
+#else
+        main_time++;
+#endif
+    }
+
+    // A rising edge, the model evaluated after the inputs of the last step
+    void cycle()
+    {
+        clock.set(0);
+        top->eval();
+        time_inc();
+        clock.set(1);
+        top->eval();
+        time_inc();
+    }
+
+    void do_reset()
+    {
+        meta_reset.set(1);
+        for (int i = 0; i < RESET_CYCLES; i++)
+            cycle();
+        meta_reset.set(0);
+        reset.set(1);
+        for (int i = 0; i < RESET_CYCLES; i++)
+            cycle();
+        reset.set(0);
+        top->eval();
+    }
+
+    // tile_adapter.py check_intr after the TileLink steps of the cycle
+    void step()
+    {
+        slave.step();
+
+        if (drive && !ints.empty() && pc_valid.get()) {
+            auto it = ints.find(pc.get());
+            if (it != ints.end())
+                assert_intr(it->second);
+        }
+    }
+
+    void assert_intr(uint32_t value)
+    {
+        if (value == intr)
+            return;
+
+        intr = value;
+        seip.set((value & INT_SEIP) == INT_SEIP);
+        meip.set((value & INT_MEIP) == INT_MEIP);
+        msip.set((value & INT_MSIP) == INT_MSIP);
+        mtip.set((value & INT_MTIP) == INT_MTIP);
+    }
+};
+
+#define HARNESS ((tile_harness_t*)h)
+
+TH_API void* th_create(const char* toplevel, int argc, const char** argv)
+{
+    try {
+        return new tile_harness_t(toplevel, argc, argv);
+    } catch (const std::exception& e) {
+        fprintf(stderr, "[NativeHost] %s\n", e.what());
+        return nullptr;
+    }
+}
+
+TH_API void th_destroy(void* h) { delete HARNESS; }
+
+TH_API const char* th_error(void* h) { return HARNESS->error.c_str(); }
+
+TH_API int th_bind(void* h, const char* field, const char* name) { return HARNESS->bind(field, name); }
+
+TH_API int th_poke(void* h, const char* name, uint64_t value)
+{
+    sig_t sig;
+    if (!HARNESS->find(name, sig))
+        return -1;
+    sig.set(value);
+    return 0;
+}
+
+TH_API int th_peek(void* h, const char* name, uint64_t* value)
+{
+    sig_t sig;
+    if (!HARNESS->find(name, sig))
+        return -1;
+    *value = sig.get();
+    return 0;
+}
+
+TH_API void th_seed(void* h, uint64_t seed) { HARNESS->slave.rng.seed(seed); }
+
+TH_API void th_mem_clear(void* h) { HARNESS->slave.memory.clear(); }
+
+TH_API void th_mem_rom(void* h, uint64_t start, uint64_t end)
+{
+    HARNESS->slave.memory.rom(start, end);
+}
+
+TH_API void th_mem_load(void* h, uint64_t addr, const uint64_t* words, uint64_t num)
+{
+    HARNESS->slave.memory.load(addr, words, num);
+}
+
+TH_API void th_mem_words(void* h, uint64_t start, uint64_t* out, uint64_t num)
+{
+    HARNESS->slave.memory.words(start, out, num);
+}
+
+TH_API int th_ill_addrs(void* h, uint64_t* out, int max)
+{
+    const std::vector<uint64_t>& ill_addrs = HARNESS->slave.memory.ill_addrs;
+    for (int i = 0; i < (int)ill_addrs.size() && i < max; i++)
+        out[i] = ill_addrs[i];
+    return ill_addrs.size();
+}
+
+TH_API void th_set_ints(void* h, const uint64_t* pcs, const uint32_t* vals, int num)
+{
+    HARNESS->set_ints(pcs, vals, num);
+}
+
+// The cycles of the run, -1 on a failed assertion (th_error)
+TH_API int64_t th_run(void* h, uint64_t tohost_addr, uint64_t max_cycles)
+{
+    try {
+        HARNESS->error.clear();
+        return HARNESS->run(tohost_addr, max_cycles);
+    } catch (const std::exception& e) {
+        HARNESS->error = e.what();
+        return -1;
+    }
+}
+
+TH_API int th_tohost(void* h, uint64_t* value)
+{
+    *value = HARNESS->slave.tohost_value;
+    return HARNESS->slave.tohost_fired;
+}
+
+TH_API int th_cov_widths(void* h, int* out, int max) { return HARNESS->cov_widths(out, max); }
+
+TH_API int th_cov(void* h, uint8_t* out) { return HARNESS->cov(out); }
@@ -0,0 +1,924 @@
+// TileLink slave memory of the native tile harness.
+//
+// A cycle-for-cycle port of adapters/tilelink/adapter.py (tlAdapter) and
+// mem_model.py (pageMemory), the cocotb adapter staying the reference:
+// the channels are stepped in the same order, the D/B messages are queued
+// and popped the same way, and the block permissions, probes, sinks and
+// sources follow the same rules. Nothing here depends on Verilator, the
+// harness hands in the ports as sig_t views of the model's variables.
+
+#ifndef _TL_SLAVE_H
+#define _TL_SLAVE_H
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <deque>
+#include <functional>
+#include <map>
+#include <memory>
+#include <random>
+#include <stdexcept>
+#include <string>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+namespace tl {
+
+// adapters/tilelink/definitions.py
+enum { PUT_FULL_DATA = 0x0, PUT_PARTIAL_DATA = 0x1, ARITHMETIC_DATA = 0x2, LOGICAL_DATA = 0x3,
+       GET = 0x4, INTENT = 0x5, ACQUIRE_BLOCK = 0x6, ACQUIRE_PERM = 0x7 };               // A
+enum { PROBE_ACK = 0x4, PROBE_ACK_DATA = 0x5, RELEASE = 0x6, RELEASE_DATA = 0x7 };       // C
+enum { ACCESS_ACK = 0x0, ACCESS_ACK_DATA = 0x1, HINT_ACK = 0x2, GRANT = 0x4,
+       GRANT_DATA = 0x5, RELEASE_ACK = 0x6 };                                             // D
+enum { PROBE_BLOCK = 0x6, PROBE_PERM = 0x7 };                                             // B
+enum { MIN = 0x0, MAX = 0x1, MINU = 0x2, MAXU = 0x3, ADD = 0x4 };
+enum { XOR = 0x0, OR = 0x1, AND = 0x2, SWAP = 0x3 };
+enum { TRUNK = 0x2, TIP = 0x3 };
+enum { toT = 0x0, toB = 0x1, toN = 0x2 };
+enum { NtoB = 0x0 };
+enum { TtoB = 0x0, TtoN = 0x1 };
+
+// adapter.py TOHOST_PROBE_DELAY
+const int TOHOST_PROBE_DELAY = 16;
+
+// A failed assertion of the reference adapter
+struct tl_error : std::runtime_error {
+    explicit tl_error(const std::string& msg) : std::runtime_error(msg) {}
+};
+
+static inline void ensure(bool cond, const std::string& msg)
+{
+    if (!cond)
+        throw tl_error(msg);
+}
+
+// A port of the model: bytes is 1/2/4/8 for the scalar variables and 0 for
+// the wide ones (32-bit words, least significant first)
+struct sig_t {
+    void* p = nullptr;
+    int bytes = 0;
+    int width = 0;
+
+    uint64_t mask() const { return width >= 64 ? ~0ULL : (1ULL << width) - 1; }
+
+    uint64_t get() const
+    {
+        switch (bytes) {
+        case 1: return *(uint8_t*)p;
+        case 2: return *(uint16_t*)p;
+        case 4: return *(uint32_t*)p;
+        case 8: return *(uint64_t*)p;
+        default: return ((uint32_t*)p)[0] | ((uint64_t)((uint32_t*)p)[1] << 32);
+        }
+    }
+
+    void set(uint64_t v) const
+    {
+        v &= mask();
+        switch (bytes) {
+        case 1: *(uint8_t*)p = v; break;
+        case 2: *(uint16_t*)p = v; break;
+        case 4: *(uint32_t*)p = v; break;
+        case 8: *(uint64_t*)p = v; break;
+        default:
+            memset(p, 0, (width + 31) / 32 * 4);
+            ((uint32_t*)p)[0] = v;
+            ((uint32_t*)p)[1] = v >> 32;
+        }
+    }
+
+    // Big-endian bytes of the value, as int.to_bytes((width + 7) // 8, 'big')
+    void get_bytes(uint8_t* out) const
+    {
+        int num = (width + 7) / 8;
+        for (int i = 0; i < num; i++) {
+            int byte = num - 1 - i;
+            uint32_t word = bytes ? (uint32_t)(get() >> (byte / 4 % 2 * 32)) : ((uint32_t*)p)[byte / 4];
+            out[i] = word >> (byte % 4 * 8);
+        }
+    }
+};
+
+// mem_model.py pageMemory
+class page_memory_t {
+public:
+    static const uint64_t DRAM_BASE = 0x80000000;
+    static const int PAGE_SHIFT = 12;
+    static const uint64_t PAGE_WORDS = (1 << PAGE_SHIFT) / 8;
+    static const uint64_t WORD_MASK = PAGE_WORDS - 1;
+
+    std::vector<uint64_t> ill_addrs;
+
+    void clear()
+    {
+        pages.clear();
+        order.clear();
+        roms.clear();
+        ill_addrs.clear();
+        watch_addr = 0;
+        on_watch = nullptr;
+    }
+
+    uint64_t* page(uint64_t addr)
+    {
+        uint64_t num = addr >> PAGE_SHIFT;
+        auto it = pages.find(num);
+        if (it == pages.end()) {
+            it = pages.emplace(num, std::vector<uint64_t>(PAGE_WORDS, 0)).first;
+            order.push_back(num);
+        }
+        return it->second.data();
+    }
+
+    void check(uint64_t addr)
+    {
+        if (addr < DRAM_BASE) {
+            for (auto& rom : roms)
+                if (rom.first <= addr && addr < rom.second)
+                    return;
+            ill_addrs.push_back(addr);
+        }
+    }
+
+    uint64_t read(uint64_t addr)
+    {
+        check(addr);
+        return page(addr)[(addr >> 3) & WORD_MASK];
+    }
+
+    void write(uint64_t addr, uint64_t data)
+    {
+        check(addr);
+        page(addr)[(addr >> 3) & WORD_MASK] = data;
+        if (on_watch && addr == watch_addr && data)
+            on_watch(data);
+    }
+
+    void write_masked(uint64_t addr, uint64_t bit_mask, uint64_t data)
+    {
+        uint64_t old = page(addr)[(addr >> 3) & WORD_MASK];
+        write(addr, (old & ~bit_mask) | (data & bit_mask));
+    }
+
+    void watch(uint64_t addr, std::function<void(uint64_t)> callback)
+    {
+        watch_addr = addr;
+        on_watch = callback;
+    }
+
+    // Accesses to [start, end) below DRAM_BASE are legal
+    void rom(uint64_t start, uint64_t end) { roms.emplace_back(start, end); }
+
+    // Bulk store of words from addr, without the DRAM check
+    void load(uint64_t addr, const uint64_t* words, uint64_t num)
+    {
+        for (uint64_t i = 0; i < num; i++) {
+            uint64_t cur = addr + i * 8;
+            page(cur)[(cur >> 3) & WORD_MASK] = words[i];
+        }
+    }
+
+    // Words of [start, start + num * 8), without the DRAM check
+    void words(uint64_t start, uint64_t* out, uint64_t num)
+    {
+        for (uint64_t i = 0; i < num; i++) {
+            uint64_t cur = start + i * 8;
+            auto it = pages.find(cur >> PAGE_SHIFT);
+            out[i] = it == pages.end() ? 0 : it->second[(cur >> 3) & WORD_MASK];
+        }
+    }
+
+    // Block addresses of the allocated pages, in allocation order
+    std::vector<uint64_t> block_addrs(uint64_t block_size)
+    {
+        std::vector<uint64_t> blocks;
+        for (uint64_t num : order)
+            for (uint64_t addr = num << PAGE_SHIFT; addr < (num + 1) << PAGE_SHIFT; addr += block_size)
+                blocks.push_back(addr);
+        return blocks;
+    }
+
+private:
+    std::unordered_map<uint64_t, std::vector<uint64_t>> pages;
+    std::vector<uint64_t> order;
+    std::vector<std::pair<uint64_t, uint64_t>> roms;
+    uint64_t watch_addr = 0;
+    std::function<void(uint64_t)> on_watch;
+};
+
+// utils.py FreeList, get picks at random like random.choice
+class free_list_t {
+public:
+    free_list_t(const char* name, int num) : name(name), num(num) { reset(); }
+
+    void reset()
+    {
+        free_list.clear();
+        for (int i = 0; i < num; i++)
+            free_list.push_back(i);
+        event_queue.clear();
+    }
+
+    int get(std::mt19937_64& rng)
+    {
+        ensure(!free_list.empty(), std::string(name) + " is empty");
+        size_t i = std::uniform_int_distribution<size_t>(0, free_list.size() - 1)(rng);
+        int ret = free_list[i];
+        free_list.erase(free_list.begin() + i);
+        return ret;
+    }
+
+    bool empty() const { return free_list.empty(); }
+
+    void reserve(std::function<void()> callback) { event_queue.push_back(callback); }
+
+    void release(int ret)
+    {
+        ensure(0 <= ret && ret < num, std::to_string(ret) + " not in " + name + " init_list");
+        for (int free : free_list)
+            ensure(free != ret, std::to_string(ret) + " already in " + name + " free_list");
+
+        free_list.push_back(ret);
+
+        if (!event_queue.empty()) {
+            auto event = event_queue.front();
+            event_queue.pop_front();
+            event();
+        }
+    }
+
+private:
+    const char* name;
+    int num;
+    std::vector<int> free_list;
+    std::deque<std::function<void()>> event_queue;
+};
+
+// The fields of a channel, valid and ready apart (utils.py Ports)
+struct channel_t {
+    sig_t opcode, param, size, source, address, mask, data, corrupt, denied, sink;
+    sig_t valid, ready;
+    std::vector<sig_t*> bits;
+
+    bool fire() const { return ready.get() & valid.get(); }
+
+    void clear()
+    {
+        for (sig_t* bit : bits)
+            bit->set(0);
+    }
+};
+
+// tlDMessage (a bubble when !msg) with its callback, and tlBMessage
+struct d_entry_t {
+    bool msg = true;
+    int opcode = 0, param = 0, size = 0, source = 0, sink = 0;
+    uint64_t data = 0;
+    std::function<void()> callback;
+};
+
+struct b_msg_t {
+    int opcode = 0, param = 0, size = 0, source = 0;
+    uint64_t address = 0, mask = 0, data = 0;
+};
+
+// addr -> (bit_mask, data) of the beats of a PUT waiting for a probe
+typedef std::map<uint64_t, std::pair<uint64_t, uint64_t>> burst_t;
+
+class tl_slave_t {
+public:
+    channel_t a, b, c, d, e;
+
+    page_memory_t memory;
+    std::mt19937_64 rng;
+
+    // Cleared once the blocks held by the DUT are probed back after stop
+    bool drive = false;
+    bool retrieve = false;
+
+    bool tohost_fired = false;
+    uint64_t tohost_value = 0;
+
+    uint64_t block_size = 64;
+
+    // Decode tables and widths, once the ports are bound (utils.py)
+    void init()
+    {
+        ensure(a.data.width == 64 && d.data.width == 64 && c.data.width == 64,
+               "pageMemory holds 64-bit words, the data ports must be 64-bit");
+        data_bytes = 8;
+        b_datalen = b.data.width / 8;
+        block_mask = ~(block_size - 1);
+        block_log = 0;
+        while ((1ULL << block_log) < block_size)
+            block_log++;
+
+        byte_masks.assign(1 << data_bytes, 0);
+        mask_shifts.assign(1 << data_bytes, 0);
+        for (int mask = 0; mask < 1 << data_bytes; mask++) {
+            for (int byte = 0; byte < data_bytes; byte++)
+                if (mask >> byte & 1)
+                    byte_masks[mask] |= 0xffULL << (byte * 8);
+            if (mask)
+                mask_shifts[mask] = __builtin_ctz(mask) * 8;
+        }
+        a_burst_lens = burst_lens(a.size.width);
+        c_burst_lens = burst_lens(c.size.width);
+    }
+
+    // tlAdapter.watch_tohost
+    void watch_tohost(uint64_t addr)
+    {
+        tohost_addr = addr;
+        tohost_block = addr & block_mask;
+        tohost_fired = false;
+        tohost_value = 0;
+
+        probe = 0;
+        probe_en = 1;
+        probe_wait = 0;
+
+        memory.watch(addr, [this](uint64_t value) {
+            if (!tohost_fired) {
+                tohost_fired = true;
+                tohost_value = value;
+            }
+        });
+    }
+
+    // tlAdapter.start and drive_input
+    void start()
+    {
+        drive = true;
+        retrieve = false;
+
+        block_perm.clear();
+        perm_order.clear();
+        for (uint64_t addr : memory.block_addrs(block_size))
+            perm(addr) = TIP;
+
+        b_queue.clear();
+        d_queue.clear();
+        d_sinks.reset();
+        b_srcs.reset();
+        b_callback.assign(1, nullptr);
+
+        a_ongoings.clear();
+        c_ongoings.clear();
+        a_burst_data = std::make_shared<burst_t>();
+        ongoing_tlc.clear();
+        d_busy = false;
+        b_busy = false;
+        retrieved = false;
+
+        open_ports();
+    }
+
+    void stop() { retrieve = true; }
+
+    bool on_going() const { return a.valid.get() | c.valid.get(); }
+
+    // Everything the adapter does in a cycle, in the order of tlAdapter.step
+    void step()
+    {
+        a_step();
+        c_step();
+        e_step();
+        d_step();
+        b_step();
+        retrieve_step();
+        host_step();
+    }
+
+    void open_ports()
+    {
+        a.ready.set(1);
+        c.ready.set(1);
+        e.ready.set(1);
+        d.clear();
+        b.clear();
+    }
+
+    void close_ports()
+    {
+        a.ready.set(0);
+        c.ready.set(0);
+        e.ready.set(0);
+        d.clear();
+        b.clear();
+    }
+
+private:
+    int data_bytes = 8;
+    int b_datalen = 8;
+    uint64_t block_mask = ~63ULL;
+    int block_log = 6;
+    std::vector<uint64_t> byte_masks;
+    std::vector<int> mask_shifts;
+    std::vector<int> a_burst_lens, c_burst_lens;
+
+    std::unordered_map<uint64_t, int> block_perm;
+    std::vector<uint64_t> perm_order;
+
+    std::deque<d_entry_t> d_queue;
+    std::deque<b_msg_t> b_queue;
+
+    free_list_t d_sinks{"d_sinks", 4};
+    free_list_t b_srcs{"b_srcs", 1};
+    std::vector<std::function<void()>> b_callback;
+
+    std::map<int, int> a_ongoings, c_ongoings;
+    std::shared_ptr<burst_t> a_burst_data;
+    std::map<int, uint64_t> ongoing_tlc;
+
+    bool d_busy = false, b_busy = false, retrieved = false;
+
+    int probe = 0, probe_en = 1, probe_wait = 0;
+    uint64_t probe_addr = 0;
+    uint64_t tohost_addr = 0, tohost_block = ~0ULL;
+
+    std::vector<uint64_t> probe_list;
+
+    std::vector<int> burst_lens(int size_len)
+    {
+        std::vector<int> lens;
+        for (int size = 0; size < 1 << size_len; size++)
+            lens.push_back(std::max<uint64_t>((1ULL << size) / data_bytes, 1));
+        return lens;
+    }
+
+    // block_perm[addr], inserted in order as the dict of the reference
+    int& perm(uint64_t block_addr)
+    {
+        auto it = block_perm.find(block_addr);
+        if (it == block_perm.end()) {
+            perm_order.push_back(block_addr);
+            it = block_perm.emplace(block_addr, TIP).first;
+        }
+        return it->second;
+    }
+
+    static int get_count(std::map<int, int>& ongoings, int source, int init)
+    {
+        auto it = ongoings.find(source);
+        return it == ongoings.end() ? init : it->second;
+    }
+
+    void push_d(int opcode, int param, int size, int source, int sink, uint64_t data,
+                std::function<void()> callback = nullptr)
+    {
+        d_entry_t entry;
+        entry.opcode = opcode;
+        entry.param = param;
+        entry.size = size;
+        entry.source = source;
+        entry.sink = sink;
+        entry.data = data;
+        entry.callback = callback;
+        d_queue.push_back(entry);
+    }
+
+    void push_bubble()
+    {
+        d_entry_t entry;
+        entry.msg = false;
+        d_queue.push_back(entry);
+    }
+
+    // get_d_messages, the callback on the first beat
+    void push_d_data(int opcode, int burst_len, uint64_t addr_aligned, int param, int sink,
+                     int size, int source, std::function<void()> callback = nullptr)
+    {
+        for (int n = 0; n < burst_len; n++) {
+            uint64_t data = memory.read(addr_aligned + n * 8);
+            push_d(opcode, param, size, source, sink, data, n ? nullptr : callback);
+        }
+    }
+
+    void update_mem(std::shared_ptr<burst_t> burst_data)
+    {
+        for (auto& beat : *burst_data)
+            memory.write_masked(beat.first, beat.second.first, beat.second.second);
+    }
+
+    void update_perm(uint64_t block_addr, int param)
+    {
+        if (param == toT) {
+            perm(block_addr) = TRUNK;
+
+            // The CPU can store to tohost in its cache now, probe the block
+            // back so the store reaches the memory
+            if (block_addr == tohost_block)
+                probe_block(tohost_addr, TOHOST_PROBE_DELAY);
+        }
+    }
+
+    void probe_block(uint64_t addr, int wait)
+    {
+        probe = 1;
+        probe_addr = addr;
+        probe_wait = wait;
+    }
+
+    void retrieve_block(std::function<void()> callback, int param, int size, uint64_t addr,
+                        uint64_t mask, int opcode = PROBE_BLOCK)
+    {
+        auto retrieve_cb = [this, callback, param, size, addr, mask, opcode]() {
+            int b_src = b_srcs.get(rng);
+            ensure(!b_callback[b_src], "b_callback duplicate callback setup");
+            b_callback[b_src] = callback;
+
+            b_msg_t msg;
+            msg.opcode = opcode;
+            msg.param = param;
+            msg.size = size;
+            msg.source = b_src;
+            msg.address = addr;
+            msg.mask = mask;
+            b_queue.push_back(msg);
+        };
+
+        if (!b_srcs.empty())
+            retrieve_cb();
+        else
+            b_srcs.reserve(retrieve_cb);
+    }
+
+    void call_b_callback(int src)
+    {
+        ensure(0 <= src && src < (int)b_callback.size(), std::to_string(src) + " not in b_callback srcs");
+        if (b_callback[src]) {
+            auto callback = b_callback[src];
+            b_callback[src] = nullptr;
+            callback();
+        }
+    }
+
+    void probe_blocks()
+    {
+        probe_list.clear();
+        for (uint64_t addr : perm_order)
+            if (block_perm[addr] != TIP)
+                probe_list.push_back(addr);
+
+        probe_next();
+    }
+
+    void probe_next()
+    {
+        if (!probe_list.empty()) {
+            uint64_t addr = probe_list.front();
+            probe_list.erase(probe_list.begin());
+
+            retrieve_block([this]() { probe_next(); }, toN, block_log, addr, (1ULL << b_datalen) - 1);
+        } else {
+            drive = false;
+        }
+    }
+
+    static uint64_t arithmetic_op(int param, uint64_t operand1, uint64_t operand2, int mask)
+    {
+        int size_op = __builtin_popcount(mask) * 8;
+        ensure(size_op > 0, "ARITHMETIC_DATA with an empty mask");
+        uint64_t sign = 1ULL << (size_op - 1);
+        uint64_t op_mask = size_op >= 64 ? ~0ULL : (1ULL << size_op) - 1;
+        int64_t signed_op1 = (int64_t)(operand1 & sign ? operand1 | ~op_mask : operand1);
+        int64_t signed_op2 = (int64_t)(operand2 & sign ? operand2 | ~op_mask : operand2);
+
+        switch (param) {
+        case MIN: return std::min(signed_op1, signed_op2);
+        case MAX: return std::max(signed_op1, signed_op2);
+        case MINU: return std::min(operand1, operand2);
+        case MAXU: return std::max(operand1, operand2);
+        case ADD: return (uint64_t)signed_op1 + (uint64_t)signed_op2;
+        }
+        throw tl_error("ARITHMETIC_DATA: param must be lower than 5");
+    }
+
+    static uint64_t logical_op(int param, uint64_t operand1, uint64_t operand2)
+    {
+        switch (param) {
+        case XOR: return operand1 ^ operand2;
+        case OR: return operand1 | operand2;
+        case AND: return operand1 & operand2;
+        case SWAP: return operand1;
+        }
+        throw tl_error("LOGICAL_DATA: param must be lower than 4");
+    }
+
+    // The atomics of a block held by the DUT, once probed back
+    void atomic_cb(int opcode, int param, uint64_t operand1, int burst_len, uint64_t addr_aligned,
+                   uint64_t bit_mask, int offset, int mask, int size, int source)
+    {
+        uint64_t operand2 = (memory.read(addr_aligned) & bit_mask) >> offset;
+        uint64_t result = opcode == ARITHMETIC_DATA ? arithmetic_op(param, operand1, operand2, mask)
+                                                    : logical_op(param, operand1, operand2);
+
+        ensure(burst_len == 1, "atomic callback, burst_len should be 1");
+
+        memory.write_masked(addr_aligned, bit_mask, result << offset);
+        push_d_data(ACCESS_ACK_DATA, burst_len, addr_aligned, 0, 0, size, source);
+    }
+
+    void put_beat(int source, int size, int burst_len, uint64_t addr, uint64_t get_addr,
+                  uint64_t block_addr, int mask, uint64_t bit_mask, uint64_t data)
+    {
+        int count = get_count(a_ongoings, source, 0);
+        get_addr += count * data_bytes;
+
+        // TODO, Block_perm should not change during burst
+        if (perm(block_addr) != TIP) {
+            if (count == 0) {
+                auto burst_data = a_burst_data = std::make_shared<burst_t>();
+                retrieve_block([this, burst_len, burst_data, size, source]() {
+                    // TODO, source in ongoings can collide
+                    int remain_clks = burst_len - get_count(a_ongoings, source, burst_len);
+                    for (int clk = 0; clk < remain_clks; clk++)
+                        push_bubble();
+                    push_d(ACCESS_ACK, 0, size, source, 0, 0, [this, burst_data]() { update_mem(burst_data); });
+                }, toN, size, addr, mask);
+            }
+
+            (*a_burst_data)[get_addr] = std::make_pair(bit_mask, data);
+        } else {
+            memory.write_masked(get_addr, bit_mask, data);
+
+            if (count + 1 == burst_len) {
+                push_d(ACCESS_ACK, 0, size, source, 0, 0);
+                if (count)
+                    a_ongoings.erase(source);
+            } else {
+                a_ongoings[source] = count + 1;
+            }
+        }
+    }
+
+    void a_step()
+    {
+        if (!a.fire())
+            return;
+
+        int opcode = a.opcode.get(), param = a.param.get(), size = a.size.get();
+        int source = a.source.get(), mask = a.mask.get();
+        uint64_t addr = a.address.get(), data = a.data.get();
+
+        ensure(a_ongoings.empty() || a_ongoings.count(source),
+               "Messages in A channel can not be interleaved");
+
+        uint64_t addr_aligned = addr & ~(uint64_t)(data_bytes - 1);
+        uint64_t block_addr = addr & block_mask;
+        int burst_len = a_burst_lens[size];
+        uint64_t bit_mask = byte_masks[mask];
+
+        perm(block_addr);
+
+        switch (opcode) {
+        case GET:
+            if (perm(block_addr) != TIP)
+                retrieve_block([this, burst_len, addr_aligned, size, source]() {
+                    push_d_data(ACCESS_ACK_DATA, burst_len, addr_aligned, 0, 0, size, source);
+                }, toT, size, addr, mask);
+            else
+                push_d_data(ACCESS_ACK_DATA, burst_len, addr_aligned, 0, 0, size, source);
+            break;
+
+        case PUT_FULL_DATA:
+        case PUT_PARTIAL_DATA:
+            put_beat(source, size, burst_len, addr, addr_aligned, block_addr, mask, bit_mask, data);
+            break;
+
+        case ARITHMETIC_DATA:
+        case LOGICAL_DATA: {
+            int count = get_count(a_ongoings, source, 0);
+
+            // TODO, extend to multiple block
+            ensure(burst_len == 1, "atomics can not span over multiple block");
+
+            int offset = mask_shifts[mask];
+            uint64_t get_addr = addr_aligned + count * data_bytes;
+            uint64_t operand1 = (data & bit_mask) >> offset;
+
+            if (perm(block_addr) != TIP) {
+                retrieve_block([=]() {
+                    atomic_cb(opcode, param, operand1, burst_len, addr_aligned, bit_mask, offset,
+                              mask, size, source);
+                }, toN, size, addr, mask);
+            } else {
+                uint64_t operand2 = (memory.read(get_addr) & bit_mask) >> offset;
+                uint64_t result = opcode == ARITHMETIC_DATA ? arithmetic_op(param, operand1, operand2, mask)
+                                                            : logical_op(param, operand1, operand2);
+
+                memory.write_masked(get_addr, bit_mask, result << offset);
+                push_d(ACCESS_ACK_DATA, 0, size, source, 0, operand2);
+            }
+            break;
+        }
+
+        case INTENT:
+            push_d(HINT_ACK, 0, size, source, 0, 0);
+            break;
+
+        case ACQUIRE_BLOCK:
+        case ACQUIRE_PERM: {
+            int d_sink = d_sinks.get(rng);
+            int d_param = param == NtoB ? toB : toT;
+            bool block = opcode == ACQUIRE_BLOCK;
+
+            if (perm(block_addr) != TIP) {
+                int b_param = param == NtoB ? toB : toN;
+
+                retrieve_block([=]() {
+                    auto callback_d = [this, block_addr, d_param]() { update_perm(block_addr, d_param); };
+                    ongoing_tlc[d_sink] = block_addr;
+                    if (block)
+                        push_d_data(GRANT_DATA, burst_len, addr_aligned, d_param, d_sink, size, source, callback_d);
+                    else
+                        push_d(GRANT, d_param, size, source, d_sink, 0, callback_d);
+                }, b_param, size, addr, mask, block ? PROBE_BLOCK : PROBE_PERM);
+            } else {
+                auto callback_d = [this, block_addr, d_param]() { update_perm(block_addr, d_param); };
+                ongoing_tlc[d_sink] = block_addr;
+                if (block)
+                    push_d_data(GRANT_DATA, burst_len, addr_aligned, d_param, d_sink, size, source, callback_d);
+                else
+                    push_d(GRANT, d_param, size, source, d_sink, 0, callback_d);
+            }
+            break;
+        }
+        }
+    }
+
+    void c_step()
+    {
+        if (!c.fire())
+            return;
+
+        int opcode = c.opcode.get(), param = c.param.get(), size = c.size.get();
+        int source = c.source.get();
+        uint64_t addr = c.address.get(), data = c.data.get();
+
+        ensure(c_ongoings.empty() || c_ongoings.count(source),
+               "Messages in C channel can not be interleaved");
+
+        uint64_t addr_aligned = addr & ~(uint64_t)(data_bytes - 1);
+        uint64_t block_addr = addr & block_mask;
+        int burst_len = c_burst_lens[size];
+        bool prune = param == TtoB || param == TtoN;
+
+        switch (opcode) {
+        case ACCESS_ACK:
+        case ACCESS_ACK_DATA:
+        case HINT_ACK:
+            throw tl_error("C channel opcode " + std::to_string(opcode) + " is not implemented");
+
+        case PROBE_ACK:
+            if (prune)
+                perm(block_addr) = TIP;
+
+            call_b_callback(source);
+            b_srcs.release(source);
+            break;
+
+        case PROBE_ACK_DATA:
+        case RELEASE_DATA: {
+            int count = get_count(c_ongoings, source, 0);
+            memory.write(addr_aligned + count * data_bytes, data);
+
+            if (count + 1 == burst_len) {
+                if (prune)
+                    perm(block_addr) = TIP;
+
+                if (opcode == PROBE_ACK_DATA) {
+                    call_b_callback(source);
+                    b_srcs.release(source);
+                } else {
+                    push_d(RELEASE_ACK, 0, size, source, 0, 0);
+                }
+
+                if (count)
+                    c_ongoings.erase(source);
+            } else {
+                c_ongoings[source] = count + 1;
+            }
+            break;
+        }
+
+        case RELEASE:
+            if (prune)
+                perm(block_addr) = TIP;
+
+            push_d(RELEASE_ACK, 0, size, source, 0, 0);
+            break;
+        }
+    }
+
+    void e_step()
+    {
+        if (!e.fire())
+            return;
+
+        int sink = e.sink.get();
+        d_sinks.release(sink);
+        ensure(ongoing_tlc.erase(sink), std::to_string(sink) + " not in ongoing_tlc");
+    }
+
+    // Hold the current message until it fires, then the next queued one
+    // (a bubble takes a cycle)
+    void d_step()
+    {
+        if (d_busy) {
+            if (!d.fire())
+                return;
+            d.clear();
+            d.valid.set(0);
+            d_busy = false;
+        }
+
+        if (!d_queue.empty()) {
+            d_entry_t entry = d_queue.front();
+            d_queue.pop_front();
+            if (entry.msg) {
+                if (entry.callback)
+                    entry.callback();
+
+                d.opcode.set(entry.opcode);
+                d.param.set(entry.param);
+                d.size.set(entry.size);
+                d.source.set(entry.source);
+                d.sink.set(entry.sink);
+                d.data.set(entry.data);
+                d.corrupt.set(0);
+                d.denied.set(0);
+
+                d.valid.set(1);
+                d_busy = true;
+            }
+        }
+    }
+
+    void b_step()
+    {
+        if (b_busy) {
+            if (!b.fire())
+                return;
+            b.clear();
+            b.valid.set(0);
+            b_busy = false;
+        }
+
+        if (!b_queue.empty()) {
+            b_msg_t msg = b_queue.front();
+            b_queue.pop_front();
+
+            b.opcode.set(msg.opcode);
+            b.param.set(msg.param);
+            b.size.set(msg.size);
+            b.source.set(msg.source);
+            b.address.set(msg.address);
+            b.mask.set(msg.mask);
+            b.data.set(msg.data);
+
+            b.valid.set(1);
+            b_busy = true;
+        }
+    }
+
+    void retrieve_step()
+    {
+        if (retrieve && !retrieved) {
+            retrieved = true;
+            probe_blocks();
+        }
+    }
+
+    void host_step()
+    {
+        bool tlc_addr = false;
+        for (auto& tlc : ongoing_tlc)
+            tlc_addr |= tlc.second == probe_addr;
+
+        if (probe_wait) {
+            probe_wait--;
+        } else if ((probe & probe_en) && !tlc_addr) {
+            uint64_t block_addr = probe_addr & block_mask;
+
+            ensure(block_perm.count(block_addr), "probe block not in block_perm");
+
+            if (block_perm[block_addr] != TIP) {
+                retrieve_block([this]() { probe_en = 1; }, toN, block_log, probe_addr,
+                               (1ULL << b_datalen) - 1);
+                probe_en = 0;
+            }
+
+            // Nothing to probe back once the DUT gave the block up itself
+            probe = 0;
+            probe_addr = 0;
+        }
+    }
+};
+
+} // namespace tl
+
+#endif
@@ -0,0 +1,206 @@
+import os
+import random
+import ctypes
+import numpy as np
+
+from reader.tile_reader import tileSrcReader
+from adapters.tilelink.definitions import *
+from mem_model import PAGE_SHIFT, PAGE_WORDS
+from RTLSim.host import rvRTLhost, SUCCESS, ASSERTION_FAIL, TIME_OUT, ILL_MEM
+
+# Harness libraries, built with make -C RTLSim/native TOPLEVEL=<toplevel>
+NATIVE_DIR = os.path.dirname(os.path.abspath(__file__)) + '/native'
+
+TH_FUNCS = {
+    'th_create':     (ctypes.c_void_p, [ ctypes.c_char_p, ctypes.c_int, ctypes.POINTER(ctypes.c_char_p) ]),
+    'th_destroy':    (None, [ ctypes.c_void_p ]),
+    'th_error':      (ctypes.c_char_p, [ ctypes.c_void_p ]),
+    'th_bind':       (ctypes.c_int, [ ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p ]),
+    'th_poke':       (ctypes.c_int, [ ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint64 ]),
+    'th_peek':       (ctypes.c_int, [ ctypes.c_void_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_uint64) ]),
+    'th_seed':       (None, [ ctypes.c_void_p, ctypes.c_uint64 ]),
+    'th_mem_clear':  (None, [ ctypes.c_void_p ]),
+    'th_mem_rom':    (None, [ ctypes.c_void_p, ctypes.c_uint64, ctypes.c_uint64 ]),
+    'th_mem_load':   (None, [ ctypes.c_void_p, ctypes.c_uint64, ctypes.c_void_p, ctypes.c_uint64 ]),
+    'th_mem_words':  (None, [ ctypes.c_void_p, ctypes.c_uint64, ctypes.c_void_p, ctypes.c_uint64 ]),
+    'th_ill_addrs':  (ctypes.c_int, [ ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int ]),
+    'th_set_ints':   (None, [ ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int ]),
+    'th_run':        (ctypes.c_int64, [ ctypes.c_void_p, ctypes.c_uint64, ctypes.c_uint64 ]),
+    'th_tohost':     (ctypes.c_int, [ ctypes.c_void_p, ctypes.POINTER(ctypes.c_uint64) ]),
+    'th_cov_widths': (ctypes.c_int, [ ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int ]),
+    'th_cov':        (ctypes.c_int, [ ctypes.c_void_p, ctypes.c_void_p ]),
+}
+
+def load_harness(path):
+    lib = ctypes.CDLL(path)
+    for (name, (restype, argtypes)) in TH_FUNCS.items():
+        func = getattr(lib, name)
+        func.restype = restype
+        func.argtypes = argtypes
+    return lib
+
+""" Native RTL host
+Runs the tile in the Verilated harness of RTLSim/native instead of the
+cocotb DUT: the TileLink slave memory, the interrupts and the tohost check
+are C++ next to the model, so no signal crosses VPI during a run. A run
+hands the harness the memory image and the interrupt schedule and reads
+back the status, the coverage and the signature; the RTL writes the commit
+trace itself, as under cocotb. Same inputs and results as rvRTLhost, which
+stays the reference.
+"""
+class rvNativeHost(rvRTLhost):
+    def __init__(self, toplevel, rtl_sig_file, out, debug=False, lib=None):
+        source_info = 'infos/' + toplevel + '_info.txt'
+        reader = tileSrcReader(source_info)
+
+        paths = reader.return_map()
+
+        self.rtl_sig_file = rtl_sig_file
+        self.debug = debug
+
+        if lib is None:
+            lib = NATIVE_DIR + '/build_{0}/lib{0}_harness.so'.format(toplevel)
+        if not os.path.isfile(lib):
+            raise Exception('{} not found, build it with make -C RTLSim/native TOPLEVEL={}'.
+                            format(lib, toplevel))
+        self.lib = load_harness(lib)
+
+        # The plusargs of the Makefile
+        plusargs = [ '+DEBUG={}'.format(int(debug)), '+TRACE={}/trace/'.format(out) ]
+        argv = (ctypes.c_char_p * len(plusargs))(*[ arg.encode() for arg in plusargs ])
+        self.harness = self.lib.th_create(toplevel.encode(), len(plusargs), argv)
+        if not self.harness:
+            raise Exception('{} harness can not be created'.format(toplevel))
+
+        self.bind_ports(paths['port_names'], paths['monitor_pc'][0], paths['monitor_valid'][0])
+
+        num = self.lib.th_cov_widths(self.harness, None, 0)
+        widths = np.zeros(num, dtype=np.int32)
+        self.lib.th_cov_widths(self.harness, widths.ctypes.data, num)
+        self.set_cov_layout(widths.tolist())
+
+        # Clock cycles simulated by the last run_test
+        self.cycles = 0
+
+    def bind(self, field, name):
+        ret = self.lib.th_bind(self.harness, field.encode(), name.encode())
+        if ret:
+            raise Exception('Native harness can not bind {} to {}'.format(field, name))
+
+    def bind_ports(self, port_names, pc_name, valid_name):
+        """ The ports of tileAdapter, matched as Ports and tileAdapter do """
+        tl_port_names = [ name for name in port_names if '_tl_' in name ]
+        for (channel, fields) in [ ('a', TL_A_FIELDS), ('b', TL_B_FIELDS), ('c', TL_C_FIELDS),
+                                   ('d', TL_D_FIELDS), ('e', TL_E_FIELDS) ]:
+            for attr in fields:
+                bits_port = [ p for p in tl_port_names if '_{}_bits_{}'.format(channel, attr) in p ]
+                fire_port = [ p for p in tl_port_names if '_{}_{}'.format(channel, attr) in p ]
+
+                assert len(bits_port) < 2 and len(fire_port) < 2 and not (bits_port and fire_port), \
+                    'multiple attribute: ' + ', '.join([str(e) for e in bits_port + fire_port])
+                if not (bits_port or fire_port):
+                    raise Exception('Native harness has incomplete tl_{}_ports'.format(channel))
+
+                self.bind('{}_{}'.format(channel, attr), (bits_port + fire_port)[0])
+
+        for name in port_names:
+            if '_tl_' in name:
+                continue
+            if '_int' in name:
+                if 'in_2_sync_0' in name: self.bind('int_seip', name)
+                if 'in_1_sync_0' in name: self.bind('int_meip', name)
+                if 'in_0_sync_0' in name: self.bind('int_msip', name)
+                if 'in_0_sync_1' in name: self.bind('int_mtip', name)
+            elif 'reset_vector' in name:
+                self.poke(name, 0x10000)
+
+        self.bind('pc', pc_name)
+        self.bind('pc_valid', valid_name)
+
+    def poke(self, name, value):
+        return self.lib.th_poke(self.harness, name.encode(), value) == 0
+
+    def peek(self, name):
+        value = ctypes.c_uint64()
+        if self.lib.th_peek(self.harness, name.encode(), ctypes.byref(value)):
+            raise Exception('Native harness has no signal {}'.format(name))
+        return value.value
+
+    def get_covsum(self):
+        return self.peek('io_covSum')
+
+    def get_path(self):
+        cov = np.zeros(sum(self.cov_bytes), dtype=np.uint8)
+        self.lib.th_cov(self.harness, cov.ctypes.data)
+        return self.cov_path(cov.tobytes())
+
+    def load_memory(self, memory):
+        """ Hand the pages of memory to the harness, in their order """
+        self.lib.th_mem_clear(self.harness)
+        for (start, end) in memory.roms:
+            self.lib.th_mem_rom(self.harness, start, end)
+        for (num, page) in memory.pages.items():
+            self.lib.th_mem_load(self.harness, num << PAGE_SHIFT, page.ctypes.data, PAGE_WORDS)
+
+    def read_memory(self, memory, start, end):
+        """ Copy the words dump_lines reads of [start, end) back to memory """
+        end = start + (end - start + 15) // 16 * 16
+        start = start // 8 * 8
+        words = np.zeros((end - start + 7) // 8, dtype=np.uint64)
+        self.lib.th_mem_words(self.harness, start, words.ctypes.data, len(words))
+        memory.load(start, words)
+
+    def run_test(self, rtl_input, assert_intr: bool, iteration):
+        """ rvRTLhost.run_test without the simulator, not a coroutine """
+
+        self.debug_print('[NativeHost] Start RTL simulation')
+
+        max_cycles = rtl_input.max_cycles
+        (memory, ints, tohost_addr, sig_start, sig_end, data_addrs) = \
+            self.load_input(rtl_input, assert_intr)
+
+        self.load_memory(memory)
+        pcs = np.array(list(ints.keys()), dtype=np.uint64)
+        vals = np.array(list(ints.values()), dtype=np.uint32)
+        self.lib.th_set_ints(self.harness, pcs.ctypes.data, vals.ctypes.data, len(pcs))
+
+        self.poke('iteration', iteration)
+        # The sinks of the grants, random.choice of the adapter
+        self.lib.th_seed(self.harness, random.getrandbits(64))
+
+        cycles = self.lib.th_run(self.harness, tohost_addr, max_cycles)
+        if cycles < 0:
+            raise Exception('[NativeHost] {}'.format(self.lib.th_error(self.harness).decode()))
+        self.cycles = cycles
+
+        num = self.lib.th_ill_addrs(self.harness, None, 0)
+        ill_addrs = np.zeros(num, dtype=np.uint64)
+        self.lib.th_ill_addrs(self.harness, ill_addrs.ctypes.data, num)
+
+        # All the CPU's memory accesses must be in DRAM, checked on access
+        for addr in ill_addrs.tolist():
+            print("{:08x}".format(addr))
+
+        if num:
+            return (ILL_MEM, self.get_covsum())
+
+        tohost = ctypes.c_uint64()
+        if not self.lib.th_tohost(self.harness, ctypes.byref(tohost)):
+            self.debug_print('[NativeHost] Timeout, max_cycle={}'.format(max_cycles))
+            return (TIME_OUT, self.get_covsum())
+
+        if self.peek('metaAssert'):
+            self.debug_print('[NativeHost] Assertion Failure')
+            return (ASSERTION_FAIL, self.get_covsum())
+
+        for (start, end) in [ (sig_start, sig_end) ] + data_addrs:
+            self.read_memory(memory, start, end)
+        self.save_signature(memory, sig_start, sig_end, data_addrs, self.rtl_sig_file)
+        self.debug_print('[NativeHost] Stop RTL simulation')
+
+        return (SUCCESS, self.get_covsum(), self.get_path())
+
+    def close(self):
+        if self.harness:
+            self.lib.th_destroy(self.harness)
+            self.harness = None
@@ -6,6 +6,7 @@ from cocotb.triggers import RisingEdge
 
 from adapters.tilelink.adapter import tlAdapter
 from adapters.tilelink.definitions import *
+from mem_model import pageMemory
 
 INT_MEIP = 0x4
 INT_SEIP = 0x8
@@ -63,7 +64,12 @@ class tileAdapter():
         self.monitor_pc = getattr(self.dut, pc_name)
         self.monitor_valid = getattr(self.dut, valid_name)
 
+        self.pc_mask = (1 << len(self.monitor_pc)) - 1
+
         self.intr = 0
+        self.ints = {}
+        # One coroutine per TileLink channel instead of the clock handler
+        self.per_channel = False
 
     def debug_print(self, message):
         if self.debug:
@@ -87,34 +93,28 @@ class tileAdapter():
     def pc_valid(self):
         return self.monitor_valid.value
 
-    @coroutine
-    def interrupt_handler(self, ints):
-        if not ints:
-            return
-
-        while self.drive:
-            if self.pc_valid():
-                pc = self.monitor_pc.value & ((1 << len(self.monitor_pc.value)) - 1)
-                if pc in ints.keys():
-                    self.debug_print('[RTLHost] interrupt_handler, pc: {:016x}, INT: {:01x}'.
-                                     format(pc, ints[pc]))
-                    self.assert_intr(ints[pc])
-            yield RisingEdge(self.dut.clock)
-
+    def check_intr(self):
+        """ Per-cycle interrupt check, run by the TileLink clock handler """
+        if self.drive and self.pc_valid():
+            pc = self.monitor_pc.value & self.pc_mask
+            if pc in self.ints:
+                self.debug_print('[RTLHost] interrupt_handler, pc: {:016x}, INT: {:01x}'.
+                                 format(pc, self.ints[pc]))
+                self.assert_intr(self.ints[pc])
 
-    def probe_tohost(self, tohost_addr):
-        self.tl_adapter.probe_block(tohost_addr)
+    def watch_tohost(self, memory, tohost_addr):
+        return self.tl_adapter.watch_tohost(memory, tohost_addr)
 
     def check_assert(self):
         return self.dut.metaAssert.value
 
     def start(self, memory, ints):
-        if memory.__class__.__name__ != 'dict':
-            raise Exception('RocketTile Adapter must receive address map to drive DUT')
+        if not isinstance(memory, pageMemory):
+            raise Exception('RocketTile Adapter must receive pageMemory to drive DUT')
 
         self.drive = True
-        self.tl_adapter.start(memory)
-        self.intr_handler = cocotb.fork(self.interrupt_handler(ints))
+        self.ints = ints
+        self.tl_adapter.start(memory, self.check_intr if ints else None, self.per_channel)
 
     @coroutine
     def stop(self):
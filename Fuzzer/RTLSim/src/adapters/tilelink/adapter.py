@@ -4,10 +4,15 @@ import math
 import random
 import queue
 from cocotb.decorators import coroutine
-from cocotb.triggers import Timer, RisingEdge, Edge
+from cocotb.triggers import Timer, RisingEdge, Edge, Event, First
 
 from adapters.tilelink.definitions import *
 from adapters.tilelink.utils import *
+from mem_model import pageMemory
+
+# Cycles between a write grant of the tohost block and its probe, for the
+# store waiting on the grant to land in the cache
+TOHOST_PROBE_DELAY = 16
 
 """ Tilelink adapter
 , which acts as a tilelink slave 
@@ -92,6 +97,11 @@ class tlAdapter():
             if self.a_datalen != self.c_datalen:
                 raise Exception('{} a_data and d_data must have same width'.format(dut.name))
 
+        self.byte_masks = byte_masks(self.a_datalen)
+        self.mask_shifts = mask_shifts(self.a_datalen)
+        self.a_burst_lens = burst_lens(self.d_datalen, self.a_ports.size_len)
+        self.c_burst_lens = burst_lens(self.c_ports.data_len // 8, self.c_ports.size_len)
+
         self.d_queue = tlDQueue()
         self.b_queue = tlBQueue()
 
@@ -102,6 +112,11 @@ class tlAdapter():
         self.probe = 0
         self.probe_en = 1
         self.probe_addr = 0
+        self.probe_wait = 0
+
+        self.tohost_addr = None
+        self.tohost_block = None
+        self.tohost = None
 
     def set_src_msgs(self, src_msgs, src, msgs):
         assert src not in src_msgs.keys(), \
@@ -119,13 +134,7 @@ class tlAdapter():
         sink = kwargs.get('sink', 0)
         #print("REQ: {:08x}".format(addr_aligned))
         d_msgs = []
-        for i in range(burst_len):
-            get_addr = addr_aligned + i * self.d_datalen
-            if get_addr not in memory.keys():
-                memory[get_addr] = self.nop_data
-
-            get_data = memory[get_addr]
-            #print("{:08x}: {:08x}".format(get_addr,get_data))
+        for get_data in memory.read_burst(addr_aligned, burst_len):
             d_msgs.append(tlDMessage(message, param=param, size=size, source=source, \
                                      sink=sink, data=get_data))
 
@@ -136,18 +145,18 @@ class tlAdapter():
 
 
     def updateMem(self, memory, burst_data):
-        for addr, value in burst_data:
-            bit_mask = value[0]
-            data = value[1]
-
-            memory[addr] = (memory.get(get_addr, 0) & (~bit_mask)) | (get_data & bit_mask)
-
-        memory.update(burst_data)
+        for (addr, (bit_mask, data)) in burst_data.items():
+            memory.write_masked(addr, bit_mask, data)
 
     def updatePerm(self, block_perm, block_addr, param):
         if param == toT:
             block_perm[block_addr] = TRUNK
 
+            # The CPU can store to tohost in its cache now, probe the
+            # block back so the store reaches the memory
+            if block_addr == self.tohost_block:
+                self.probe_block(self.tohost_addr, TOHOST_PROBE_DELAY)
+
     def retrieveBlock(self, b_srcs, b_callback, callback, param, size, addr, mask, msg='ProbeBlock'):
         if not b_srcs.empty():
             self.retrieveBlock_cb(msg, b_srcs, b_callback, callback, param, \
@@ -180,23 +189,23 @@ class tlAdapter():
         self.d_queue.push_msgs(d_msgs)
 
     def ArithmeticAck_cb(self, operand1, memory, burst_len, addr_aligned, bit_mask, offset, size, source):
-        operand2 = (memory[addr_aligned] & bit_mask) >> offset
+        operand2 = (memory.read(addr_aligned) & bit_mask) >> offset
         result = (self._arithmetic_op(param, operand1, operand2, mask) << offset) & \
             self.a_ports.data_mask
 
         assert burst_len == 1, 'ArithmeticAck_cb, burst_len should be 1'
 
-        memory[addr_aligned] = (memory.get(addr_aligned, 0) & (~bit_mask)) | (result & bit_mask)
+        memory.write_masked(addr_aligned, bit_mask, result)
         self.AccessAckData_cb(memory, burst_len, addr_aligned, size, source)
 
     def LogicalAck_cb(self, operand1, memory, burst_len, addr_aligned, bit_mask, offset, size, source):
-        operand2 = (memory[addr_aligned] & bit_mask) >> offset
+        operand2 = (memory.read(addr_aligned) & bit_mask) >> offset
         result = (self._logical_op(param, operand1, operand2, mask) << offset) & \
             self.a_ports.data_mask
 
         assert burst_len == 1, 'LogicalAck_cb, burst_len should be 1'
 
-        memory[addr_aligned] = (memory.get(addr_aligned, 0) & (~bit_mask)) | (result & bit_mask)
+        memory.write_masked(addr_aligned, bit_mask, result)
         self.AccessAckData_cb(memory, burst_len, addr_aligned, size, source)
 
     def Grant_cb(self, param, sink, size, source, block_perm, block_addr):
@@ -280,12 +289,14 @@ class tlAdapter():
 
 
     def drive_input(self, memory):
-        assert memory.__class__.__name__ == 'dict', \
-            'tlAdapter.drive_input need dict'
+        assert isinstance(memory, pageMemory), \
+            'tlAdapter.drive_input need pageMemory'
+        assert self.d_datalen == 8, \
+            'pageMemory holds 64-bit words, d_data is {} bytes'.format(self.d_datalen)
 
         block_perm = {}
         # TODO, check the resolution of block permissions
-        for addr in set([i & self.block_mask for i in memory.keys()]):
+        for addr in memory.block_addrs(self.block_size):
             block_perm[addr] = TIP
 
         self.b_queue.clear()
@@ -298,485 +309,504 @@ class tlAdapter():
 
         b_callback = srcToCallback('b_callback', b_src_list)
 
-        self.a_monitor = cocotb.fork(self.a_port_monitor(memory, block_perm, d_sinks, \
-                                                         b_srcs, b_callback))
-        self.c_monitor = cocotb.fork(self.c_port_monitor(memory, block_perm, b_srcs, \
-                                                         b_callback))
-        self.e_monitor = cocotb.fork(self.e_port_monitor(memory, d_sinks))
-
-        self.d_driver = cocotb.fork(self.d_port_driver())
-        self.b_driver = cocotb.fork(self.b_port_driver())
-
-        self.retriever = cocotb.fork(self.data_retriever(block_perm, b_srcs, b_callback))
-        self.host_if = cocotb.fork(self.host_interface(block_perm, b_srcs, b_callback))
-
-    @coroutine
-    def a_port_monitor(self, memory, block_perm, d_sinks, b_srcs, b_callback):
-
-        clkedge = RisingEdge(self.dut.clock)
+        self.tl_state = (memory, block_perm, d_sinks, b_srcs, b_callback)
+        self.a_fields = self.a_ports.decoder([ 'opcode', 'param', 'size', 'source', \
+                                               'address', 'mask', 'data' ])
+        self.c_fields = self.c_ports.decoder([ 'opcode', 'param', 'size', 'source', \
+                                               'address', 'data', 'corrupt' ])
+        self.a_ongoings = {} # On going TL-A transactions (src - count)
+        self.c_ongoings = {} # On going TL-C transactions (src - count)
+        self.a_burst_data = {}
+        self.d_busy = False
+        self.b_busy = False
+        self.retrieved = False
+
+    def a_step(self):
+        """ Serve the A channel beat of this cycle """
         a_ports = self.a_ports
+        (memory, block_perm, d_sinks, b_srcs, b_callback) = self.tl_state
+        byte_masks = self.byte_masks
+        a_burst_lens = self.a_burst_lens
+        ongoings = self.a_ongoings
 
-        ongoings = {} # On going TL-A transactions (src - count)
+        if a_ports.fire():
+            (opcode, param, size, source, addr, mask, data) = \
+                [ handle.value & field_mask for (handle, field_mask) in self.a_fields ]
 
-        a_ports.ready <= 1
-        while self.drive:
-            if a_ports.fire():
-                opcode = a_ports.get('opcode')
-                param = a_ports.get('param')
-                size = a_ports.get('size')
-                source = a_ports.get('source')
-                addr = a_ports.get('address')
-                mask = a_ports.get('mask')
-                data = a_ports.get('data')
-
-                A_assertions(opcode, param, size, addr, mask, self.debug)
-
-                assert not ongoings or source in ongoings.keys(), \
-                    'Messages in A channel can not be interleaved'
-
-                addr_aligned = addr & self.addr_mask_d
-                block_addr = addr & self.block_mask
-                burst_len = int(max(pow(2, size) / self.d_datalen, 1))
-                bit_mask = int(''.join([ '{:02x}'.format(0xff * int(i)) \
-                                        for i in ('{:0b}'.format(mask))]), 16)
-
-                block_perm[block_addr] = block_perm.get(block_addr, TIP)
-
-                " TL-UL "
-                if opcode == GET:
-                    " Check block permission "
-                    if block_perm[block_addr] != TIP:
-                        callback = CallBack(self.AccessAckData_cb, memory, burst_len, \
-                                                 addr_aligned, size, source)
-                        self.retrieveBlock(b_srcs, b_callback, callback, toT, size, \
-                                           addr, mask)
+            A_assertions(opcode, param, size, addr, mask, self.debug)
 
-                    else:
-                        d_msgs = self.get_d_messages('AccessAckData', memory, burst_len, addr_aligned, \
-                                                     size=size, source=source)
-                        self.d_queue.push_msgs(d_msgs)
-
-                if opcode == PUT_FULL_DATA:
-                    count = ongoings.get(source, 0)
-                    get_addr = addr_aligned + count * self.a_datalen
-
-                    # TODO, Block_perm should not change during burst
-                    if block_perm[block_addr] != TIP:
-                        if count == 0:
-                            burst_data = {}
-                            callback = CallBack(self.AccessAck_cb, memory, ongoings, \
-                                                burst_len, burst_data, size, source)
-                            self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
-                                               addr, mask)
-
-                        burst_data[get_addr] = (bit_mask, data)
-                    else:
-                        masked_data = memory.get(get_addr, 0) & (~bit_mask)
-                        get_data = masked_data | (data & bit_mask)
-
-                        memory[get_addr] = get_data
-
-                        if count + 1 == burst_len:
-                            self.d_queue.push('AccessAck', None, size=size, source=source)
-                            if count: ongoings.pop(source)
-                        else:
-                            ongoings[source] = count + 1
-
-                if opcode == PUT_PARTIAL_DATA:
-                    count = ongoings.get(source, 0)
-                    get_addr = addr_aligned + count * self.a_datalen
-
-                    # TODO, Block_perm should not change during burst
-                    if block_perm[block_addr] != TIP:
-                        if count == 0:
-                            burst_data = {}
-                            callback = CallBack(self.AccessAck_cb, memory, ongoings, \
-                                                burst_len, burst_data, size, source)
-                            self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
-                                               addr, mask)
-
-                        burst_data[get_addr] = (bit_mask, data)
-                    else:
-                        masked_data = memory.get(get_addr, 0) & (~bit_mask)
-                        get_data = masked_data | (data & bit_mask)
+            assert not ongoings or source in ongoings.keys(), \
+                'Messages in A channel can not be interleaved'
 
-                        memory[get_addr] = get_data
+            addr_aligned = addr & self.addr_mask_d
+            block_addr = addr & self.block_mask
+            burst_len = a_burst_lens[size]
+            bit_mask = byte_masks[mask]
 
-                        if count + 1 == burst_len:
-                            self.d_queue.push('AccessAck', None, size=size, source=source)
-                            if count: ongoings.pop(source)
-                        else:
-                            ongoings[source] = count + 1
+            block_perm[block_addr] = block_perm.get(block_addr, TIP)
 
-                " TL-UH "
-                if opcode == ARITHMETIC_DATA and \
-                   self.protocol >= TL_UH:
+            " TL-UL "
+            if opcode == GET:
+                " Check block permission "
+                if block_perm[block_addr] != TIP:
+                    callback = CallBack(self.AccessAckData_cb, memory, burst_len, \
+                                             addr_aligned, size, source)
+                    self.retrieveBlock(b_srcs, b_callback, callback, toT, size, \
+                                       addr, mask)
 
-                    count = ongoings.get(source, 0)
+                else:
+                    d_msgs = self.get_d_messages('AccessAckData', memory, burst_len, addr_aligned, \
+                                                 size=size, source=source)
+                    self.d_queue.push_msgs(d_msgs)
 
-                    # TODO, extend to multiple block
-                    assert burst_len == 1, \
-                        'ARITHMETIC_DATA can not span over multiple block'
+            if opcode == PUT_FULL_DATA:
+                count = ongoings.get(source, 0)
+                get_addr = addr_aligned + count * self.a_datalen
 
-                    total_mask = 0
-                    offset = int(math.log((mask & -mask), 2) * 8)
+                # TODO, Block_perm should not change during burst
+                if block_perm[block_addr] != TIP:
+                    if count == 0:
+                        self.a_burst_data = {}
+                        callback = CallBack(self.AccessAck_cb, memory, ongoings, \
+                                            burst_len, self.a_burst_data, size, source)
+                        self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
+                                           addr, mask)
 
-                    get_addr = addr_aligned + count * self.a_datalen
-                    get_data = data & bit_mask
+                    self.a_burst_data[get_addr] = (bit_mask, data)
+                else:
+                    memory.write_masked(get_addr, bit_mask, data)
 
-                    operand1 = get_data >> offset
+                    if count + 1 == burst_len:
+                        self.d_queue.push('AccessAck', None, size=size, source=source)
+                        if count: ongoings.pop(source)
+                    else:
+                        ongoings[source] = count + 1
+
+            if opcode == PUT_PARTIAL_DATA:
+                count = ongoings.get(source, 0)
+                get_addr = addr_aligned + count * self.a_datalen
 
-                    # TODO, Block_perm should not change during burst
-                    if block_perm[block_addr] != TIP:
-                        callback = CallBack(self.ArithmeticAck_cb, operand1, memory, burst_len, \
-                                            addr_aligned, bit_mask, offset, size, source)
+                # TODO, Block_perm should not change during burst
+                if block_perm[block_addr] != TIP:
+                    if count == 0:
+                        self.a_burst_data = {}
+                        callback = CallBack(self.AccessAck_cb, memory, ongoings, \
+                                            burst_len, self.a_burst_data, size, source)
                         self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
                                            addr, mask)
 
+                    self.a_burst_data[get_addr] = (bit_mask, data)
+                else:
+                    memory.write_masked(get_addr, bit_mask, data)
+
+                    if count + 1 == burst_len:
+                        self.d_queue.push('AccessAck', None, size=size, source=source)
+                        if count: ongoings.pop(source)
                     else:
-                        if get_addr not in memory.keys():
-                            memory[get_addr] = self.nop_data
-                        # TODO, operand2 offset?
-                        operand2 = (memory[get_addr] & bit_mask) >> offset
-                        result = (self._arithmetic_op(param, operand1, operand2, mask) << offset) & \
-                            self.a_ports.data_mask # TODO, check _arithmetic_op
+                        ongoings[source] = count + 1
 
-                        memory[get_addr] = (memory[get_addr] & (~bit_mask)) | (result & bit_mask)
-                        self.d_queue.push('AccessAckData', None, size=size, source=source, data=operand2)
+            " TL-UH "
+            if opcode == ARITHMETIC_DATA and \
+               self.protocol >= TL_UH:
 
-                if opcode == LOGICAL_DATA and \
-                   self.protocol >= TL_UH:
+                count = ongoings.get(source, 0)
 
-                    count = ongoings.get(source, 0)
+                # TODO, extend to multiple block
+                assert burst_len == 1, \
+                    'ARITHMETIC_DATA can not span over multiple block'
 
-                    # TODO, extend to multiple block
-                    assert burst_len == 1, \
-                        'LOGICAL_DATA can not span over multiple block'
+                total_mask = 0
+                offset = self.mask_shifts[mask]
 
-                    total_mask = 0
-                    offset = int(math.log((mask & -mask), 2) * 8)
+                get_addr = addr_aligned + count * self.a_datalen
+                get_data = data & bit_mask
 
-                    get_addr = addr_aligned + count * self.a_datalen
-                    get_data = data & bit_mask
+                operand1 = get_data >> offset
 
-                    operand1 = get_data >> offset
+                # TODO, Block_perm should not change during burst
+                if block_perm[block_addr] != TIP:
+                    callback = CallBack(self.ArithmeticAck_cb, operand1, memory, burst_len, \
+                                        addr_aligned, bit_mask, offset, size, source)
+                    self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
+                                       addr, mask)
 
-                    # TODO, Block_perm should not change during burst
-                    if block_perm[block_addr] != TIP:
+                else:
+                    # TODO, operand2 offset?
+                    operand2 = (memory.read(get_addr) & bit_mask) >> offset
+                    result = (self._arithmetic_op(param, operand1, operand2, mask) << offset) & \
+                        self.a_ports.data_mask # TODO, check _arithmetic_op
 
-                        callback = CallBack(self.LogicalAck_cb, operand1, memory, burst_len, \
-                                            addr_aligned, bit_mask, offset, size, source)
-                        self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
-                                           addr, mask)
+                    memory.write_masked(get_addr, bit_mask, result)
+                    self.d_queue.push('AccessAckData', None, size=size, source=source, data=operand2)
 
-                    else:
-                        if get_addr not in memory.keys():
-                            memory[get_addr] = self.nop_data
-                        operand2 = (memory[get_addr] & bit_mask) >> offset
-                        result = (self._logical_op(param, operand1, operand2) << offset) & \
-                            self.a_ports.data_mask # TODO, check _logical_op
+            if opcode == LOGICAL_DATA and \
+               self.protocol >= TL_UH:
 
-                        memory[get_addr] = (memory[get_addr] & (~bit_mask)) | (result & bit_mask)
-                        self.d_queue.push('AccessAckData', None, size=size, source=source, data=operand2)
+                count = ongoings.get(source, 0)
 
-                if opcode == INTENT and \
-                   self.protocol >= TL_UH:
+                # TODO, extend to multiple block
+                assert burst_len == 1, \
+                    'LOGICAL_DATA can not span over multiple block'
 
-                    self.d_queue.push('HintAck', None, size=size, source=source)
+                total_mask = 0
+                offset = self.mask_shifts[mask]
 
-                " TL-C "
-                if opcode == ACQUIRE_BLOCK and \
-                   self.protocol == TL_C:
+                get_addr = addr_aligned + count * self.a_datalen
+                get_data = data & bit_mask
 
-                    d_sink = d_sinks.get()
+                operand1 = get_data >> offset
 
-                    if param == NtoB: d_param = toB
-                    else: d_param = toT
+                # TODO, Block_perm should not change during burst
+                if block_perm[block_addr] != TIP:
 
-                    if block_perm[block_addr] != TIP:
-                        if param == NtoB: b_param = toB
-                        else: b_param = toN
+                    callback = CallBack(self.LogicalAck_cb, operand1, memory, burst_len, \
+                                        addr_aligned, bit_mask, offset, size, source)
+                    self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
+                                       addr, mask)
 
-                        callback = CallBack(self.GrantData_cb, memory, burst_len, addr_aligned, \
-                                                 d_param, d_sink, size, source, block_perm, block_addr)
-                        self.retrieveBlock(b_srcs, b_callback, callback, b_param, size, \
-                                           addr, mask)
+                else:
+                    operand2 = (memory.read(get_addr) & bit_mask) >> offset
+                    result = (self._logical_op(param, operand1, operand2) << offset) & \
+                        self.a_ports.data_mask # TODO, check _logical_op
 
-                    else:
-                        callback_d = CallBack(self.updatePerm, block_perm, block_addr, d_param)
-                        d_msgs = self.get_d_messages('GrantData', memory, burst_len, addr_aligned, \
-                                                param=d_param, size=size, source=source, sink=d_sink)
-                        cbs = [ callback_d ] + [ None for i in range(len(d_msgs) - 1) ]
+                    memory.write_masked(get_addr, bit_mask, result)
+                    self.d_queue.push('AccessAckData', None, size=size, source=source, data=operand2)
 
-                        self.ongoing_tlc[d_sink] = block_addr
-                        self.d_queue.push_msg_cbs(d_msgs, cbs)
+            if opcode == INTENT and \
+               self.protocol >= TL_UH:
 
-                if opcode == ACQUIRE_PERM and \
-                   self.protocol == TL_C:
+                self.d_queue.push('HintAck', None, size=size, source=source)
 
-                    d_sink = d_sinks.get()
+            " TL-C "
+            if opcode == ACQUIRE_BLOCK and \
+               self.protocol == TL_C:
 
-                    if param == NtoB: d_param = toB
-                    else: d_param = toT
+                d_sink = d_sinks.get()
 
-                    if block_perm[block_addr] != TIP:
-                        if param == NtoB: b_param = toB
-                        else: b_param = toN
+                if param == NtoB: d_param = toB
+                else: d_param = toT
 
-                        callback = CallBack(self.Grant_cb, d_param, d_sink, size, source, \
-                                                 block_perm, block_addr)
-                        self.retrievePerm(b_srcs, b_callback, callback, b_param, size, \
-                                           addr, mask, 'ProbePerm')
+                if block_perm[block_addr] != TIP:
+                    if param == NtoB: b_param = toB
+                    else: b_param = toN
 
-                    else:
-                        callback_d = CallBack(self.updatePerm, block_perm, block_addr, d_param)
+                    callback = CallBack(self.GrantData_cb, memory, burst_len, addr_aligned, \
+                                             d_param, d_sink, size, source, block_perm, block_addr)
+                    self.retrieveBlock(b_srcs, b_callback, callback, b_param, size, \
+                                       addr, mask)
 
-                        self.ongoing_tlc[d_sink] = block_addr
-                        self.d_queue.push('Grant', callback_d, param=d_param, size=size, \
-                                          source=source, sink=d_sink)
+                else:
+                    callback_d = CallBack(self.updatePerm, block_perm, block_addr, d_param)
+                    d_msgs = self.get_d_messages('GrantData', memory, burst_len, addr_aligned, \
+                                            param=d_param, size=size, source=source, sink=d_sink)
+                    cbs = [ callback_d ] + [ None for i in range(len(d_msgs) - 1) ]
 
-            yield clkedge
+                    self.ongoing_tlc[d_sink] = block_addr
+                    self.d_queue.push_msg_cbs(d_msgs, cbs)
 
-        a_ports.ready <= 0
+            if opcode == ACQUIRE_PERM and \
+               self.protocol == TL_C:
 
-    @coroutine
-    def c_port_monitor(self, memory, block_perm, b_srcs, b_callback):
+                d_sink = d_sinks.get()
 
-        clkedge = RisingEdge(self.dut.clock)
-        c_ports = self.c_ports
+                if param == NtoB: d_param = toB
+                else: d_param = toT
 
-        ongoings = {} # On going transactions (src - count)
+                if block_perm[block_addr] != TIP:
+                    if param == NtoB: b_param = toB
+                    else: b_param = toN
 
-        c_ports.ready <= 1
-        while self.drive:
-            if c_ports.fire():
-                opcode = c_ports.get('opcode')
-                param = c_ports.get('param')
-                size = c_ports.get('size')
-                source = c_ports.get('source')
-                addr = c_ports.get('address')
-                data = c_ports.get('data')
-                corrupt = c_ports.get('corrupt')
+                    callback = CallBack(self.Grant_cb, d_param, d_sink, size, source, \
+                                             block_perm, block_addr)
+                    self.retrievePerm(b_srcs, b_callback, callback, b_param, size, \
+                                       addr, mask, 'ProbePerm')
 
-                C_assertions(opcode, param, size, addr, corrupt, self.debug)
+                else:
+                    callback_d = CallBack(self.updatePerm, block_perm, block_addr, d_param)
 
-                assert not ongoings or source in ongoings.keys(), \
-                    'Messages in C channel can not be interleaved'
+                    self.ongoing_tlc[d_sink] = block_addr
+                    self.d_queue.push('Grant', callback_d, param=d_param, size=size, \
+                                      source=source, sink=d_sink)
 
-                addr_aligned = addr & self.addr_mask_c
-                block_addr = addr & self.block_mask
-                burst_len = int(max(pow(2, size) / self.c_datalen, 1))
+    def c_step(self):
+        """ Serve the C channel beat of this cycle """
+        c_ports = self.c_ports
+        (memory, block_perm, d_sinks, b_srcs, b_callback) = self.tl_state
+        c_burst_lens = self.c_burst_lens
+        ongoings = self.c_ongoings
 
-                if opcode == ACCESS_ACK:
-                    raise NotImplementedError()
+        if c_ports.fire():
+            (opcode, param, size, source, addr, data, corrupt) = \
+                [ handle.value & field_mask for (handle, field_mask) in self.c_fields ]
 
-                if opcode == ACCESS_ACK_DATA:
-                    raise NotImplementedError()
+            C_assertions(opcode, param, size, addr, corrupt, self.debug)
 
-                if opcode == HINT_ACK:
-                    raise NotImplementedError()
+            assert not ongoings or source in ongoings.keys(), \
+                'Messages in C channel can not be interleaved'
 
-                if opcode == PROBE_ACK:
-                    if param in [ TtoB, TtoN ]:
-                        block_perm[block_addr] = TIP
+            addr_aligned = addr & self.addr_mask_c
+            block_addr = addr & self.block_mask
+            burst_len = c_burst_lens[size]
 
-                    b_callback.call(source)
-                    b_srcs.release(source)
+            if opcode == ACCESS_ACK:
+                raise NotImplementedError()
 
-                if opcode == PROBE_ACK_DATA:
-                    count = ongoings.get(source, 0)
-                    get_addr = addr_aligned + count * self.c_datalen
+            if opcode == ACCESS_ACK_DATA:
+                raise NotImplementedError()
 
-                    memory[get_addr] = data
+            if opcode == HINT_ACK:
+                raise NotImplementedError()
 
-                    if count + 1 == burst_len:
-                        if param in [ TtoB, TtoN ]:
-                            block_perm[block_addr] = TIP
+            if opcode == PROBE_ACK:
+                if param in [ TtoB, TtoN ]:
+                    block_perm[block_addr] = TIP
 
-                        b_callback.call(source)
-                        b_srcs.release(source)
+                b_callback.call(source)
+                b_srcs.release(source)
 
-                        if count: ongoings.pop(source)
-                    else:
-                        ongoings[source] = count + 1
+            if opcode == PROBE_ACK_DATA:
+                count = ongoings.get(source, 0)
+                get_addr = addr_aligned + count * self.c_datalen
 
-                if opcode == RELEASE:
+                memory.write(get_addr, data)
+
+                if count + 1 == burst_len:
                     if param in [ TtoB, TtoN ]:
                         block_perm[block_addr] = TIP
 
-                    self.d_queue.push('ReleaseAck', None, size=size, source=source)
+                    b_callback.call(source)
+                    b_srcs.release(source)
 
-                if opcode == RELEASE_DATA:
-                    count = ongoings.get(source, 0)
-                    get_addr = addr_aligned + count * self.c_datalen
+                    if count: ongoings.pop(source)
+                else:
+                    ongoings[source] = count + 1
 
-                    memory[get_addr] = data
+            if opcode == RELEASE:
+                if param in [ TtoB, TtoN ]:
+                    block_perm[block_addr] = TIP
 
-                    if count + 1 == burst_len:
-                        if param in [ TtoB, TtoN ]:
-                            block_perm[block_addr] = TIP
+                self.d_queue.push('ReleaseAck', None, size=size, source=source)
 
-                        self.d_queue.push('ReleaseAck', None, size=size, source=source)
+            if opcode == RELEASE_DATA:
+                count = ongoings.get(source, 0)
+                get_addr = addr_aligned + count * self.c_datalen
 
-                        if count: ongoings.pop(source)
-                    else:
-                        ongoings[source] = count + 1
+                memory.write(get_addr, data)
 
-            yield clkedge
+                if count + 1 == burst_len:
+                    if param in [ TtoB, TtoN ]:
+                        block_perm[block_addr] = TIP
 
-        c_ports.ready <= 0
+                    self.d_queue.push('ReleaseAck', None, size=size, source=source)
 
-    @coroutine
-    def e_port_monitor(self, memory, d_sinks):
+                    if count: ongoings.pop(source)
+                else:
+                    ongoings[source] = count + 1
 
-        clkedge = RisingEdge(self.dut.clock)
+    def e_step(self):
+        """ Serve the E channel beat of this cycle """
         e_ports = self.e_ports
+        d_sinks = self.tl_state[2]
 
-        e_ports.ready <= 1
-        while self.drive:
-            if e_ports.fire():
-                sink = e_ports.get('sink')
-                d_sinks.release(sink)
-                self.ongoing_tlc.pop(sink)
+        if e_ports.fire():
+            sink = e_ports.get('sink')
+            d_sinks.release(sink)
+            self.ongoing_tlc.pop(sink)
 
-            yield clkedge
-
-        e_ports.ready <= 0
-
-    @coroutine
-    def d_port_driver(self):
-
-        clkedge = RisingEdge(self.dut.clock)
+    def d_step(self):
+        """ Drive the D channel: hold the current message until it fires,
+        then the next queued one (a bubble takes a cycle) """
         d_ports = self.d_ports
 
-        d_ports.clear()
-        while self.drive:
-            if not self.d_queue.empty():
-                msg_callback = self.d_queue.pop()
-                msg = msg_callback[0]
-                if msg:
-                    callback = msg_callback[1]
-                    if callback:
-                        callback.call()
-
-                    d_ports.opcode <= msg.opcode
-                    d_ports.param <= msg.param
-                    d_ports.size <= msg.size
-                    d_ports.source <= msg.source
-                    d_ports.sink <= msg.sink
-                    d_ports.data <= msg.data
-                    d_ports.corrupt <= msg.corrupt
-                    d_ports.denied <= msg.denied
-
-                    d_ports.valid <= 1
-                    yield clkedge
-                    while not d_ports.fire():
-                        yield clkedge
-
-                    d_ports.clear()
-                    d_ports.valid <= 0
-
-                else:
-                    yield clkedge
-            else:
-                yield clkedge
-
-        d_ports.clear()
-
-    @coroutine
-    def b_port_driver(self):
-
-        clkedge = RisingEdge(self.dut.clock)
+        if self.d_busy:
+            if not d_ports.fire():
+                return
+            d_ports.clear()
+            d_ports.valid <= 0
+            self.d_busy = False
+
+        if not self.d_queue.empty():
+            (msg, callback) = self.d_queue.pop()
+            if msg:
+                if callback:
+                    callback.call()
+
+                d_ports.opcode <= msg.opcode
+                d_ports.param <= msg.param
+                d_ports.size <= msg.size
+                d_ports.source <= msg.source
+                d_ports.sink <= msg.sink
+                d_ports.data <= msg.data
+                d_ports.corrupt <= msg.corrupt
+                d_ports.denied <= msg.denied
+
+                d_ports.valid <= 1
+                self.d_busy = True
+
+    def b_step(self):
+        """ Drive the B channel, as d_step """
         b_ports = self.b_ports
 
-        b_ports.clear()
-        while self.drive:
-            if not self.b_queue.empty():
-                msg = self.b_queue.pop()
-                if msg:
-                    b_ports.opcode <= msg.opcode
-                    b_ports.param <= msg.param
-                    b_ports.size <= msg.size
-                    b_ports.source <= msg.source
-                    b_ports.address <= msg.address
-                    b_ports.mask <= msg.mask
-                    b_ports.data <= msg.data
-
-                    b_ports.valid <= 1
-                    yield clkedge
-                    while not b_ports.fire():
-                        yield clkedge
-
-                    b_ports.clear()
-                    b_ports.valid <= 0
+        if self.b_busy:
+            if not b_ports.fire():
+                return
+            b_ports.clear()
+            b_ports.valid <= 0
+            self.b_busy = False
+
+        if not self.b_queue.empty():
+            msg = self.b_queue.pop()
+            if msg:
+                b_ports.opcode <= msg.opcode
+                b_ports.param <= msg.param
+                b_ports.size <= msg.size
+                b_ports.source <= msg.source
+                b_ports.address <= msg.address
+                b_ports.mask <= msg.mask
+                b_ports.data <= msg.data
+
+                b_ports.valid <= 1
+                self.b_busy = True
+
+    def retrieve_step(self):
+        """ Probe back the blocks held by the DUT once stop is requested """
+        if self.retrieve and not self.retrieved:
+            self.retrieved = True
+            (memory, block_perm, d_sinks, b_srcs, b_callback) = self.tl_state
+            self.probe_blocks(block_perm, b_srcs, b_callback)
+
+    def host_step(self):
+        """ Probe the block of probe_block """
+        (memory, block_perm, d_sinks, b_srcs, b_callback) = self.tl_state
+
+        if self.probe_wait:
+            self.probe_wait -= 1
+        elif (self.probe & self.probe_en) and self.probe_addr not in self.ongoing_tlc.values():
+            block_addr = self.probe_addr & self.block_mask
+            mask = (1 << self.b_datalen) - 1
+            size = int(math.log(self.block_size, 2))
+
+            assert block_addr in block_perm.keys(), \
+                '{:016x} not in block_perm.keys()'.format(block_addr)
+
+            if block_perm[block_addr] != TIP:
+                callback = CallBack(self.enableProbe)
+                self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
+                                   self.probe_addr, mask)
+
+                self.probe_en = 0
+
+            # Nothing to probe back once the DUT gave the block up itself
+            self.probe = 0
+            self.probe_addr = 0
+
+    def probe_block(self, probe_addr, wait=0):
+        self.probe = 1
+        self.probe_addr = probe_addr
+        self.probe_wait = wait
 
-                else:
-                    yield clkedge
-            else:
-                yield clkedge
+    def watch_tohost(self, memory, tohost_addr):
+        """ Event set with the value of the first nonzero write to
+        tohost_addr: a PUT, a release or the probe after a write grant of
+        its block, instead of polling the memory and probing the block """
+        self.tohost_addr = tohost_addr
+        self.tohost_block = tohost_addr & self.block_mask
+        self.tohost = Event('tohost')
 
-        b_ports.clear()
+        self.probe = 0
+        self.probe_en = 1
+        self.probe_wait = 0
+
+        memory.watch(tohost_addr, self.tohost.set)
+        return self.tohost
+
+    def step(self):
+        """ Everything the adapter does in a cycle, in the order of the
+        former per-channel coroutines """
+        self.a_step()
+        self.c_step()
+        self.e_step()
+        self.d_step()
+        self.b_step()
+        self.retrieve_step()
+        self.host_step()
+
+    def idle(self):
+        """ Nothing to serve until the DUT raises a valid """
+        return not (self.d_busy or self.b_busy or self.probe or self.probe_wait or \
+                    (self.retrieve and not self.retrieved) or \
+                    not self.d_queue.empty() or not self.b_queue.empty() or \
+                    self.a_ports.valid.value or self.c_ports.valid.value or \
+                    self.e_ports.valid.value)
+
+    def open_ports(self):
+        for ports in [ self.a_ports, self.c_ports, self.e_ports ]:
+            ports.ready <= 1
+        self.d_ports.clear()
+        self.b_ports.clear()
+
+    def close_ports(self):
+        for ports in [ self.a_ports, self.c_ports, self.e_ports ]:
+            ports.ready <= 0
+        self.d_ports.clear()
+        self.b_ports.clear()
 
     @coroutine
-    def data_retriever(self, block_perm, b_srcs, b_callback):
+    def clock_handler(self, tick):
+        """ Serve all the channels (and tick, e.g. the interrupts) in one
+        callback per cycle. When idle without a tick, sleep until a valid
+        rises or wake is set instead of waking up every cycle. The valids
+        change right after a rising edge, so a valid edge is served at
+        once, as the rising edge callback would have """
         clkedge = RisingEdge(self.dut.clock)
+        valids = [ Edge(ports.valid) for ports in [ self.a_ports, self.c_ports, self.e_ports ] ]
+
+        self.open_ports()
+        while self.drive:
+            self.step()
+            if tick:
+                tick()
+            elif self.drive and self.idle():
+                self.wake = Event('wake')
+                wake = self.wake.wait()
+                trigger = yield First(*(valids + [ wake ]))
+                if trigger is not wake:
+                    continue
 
-        while not self.retrieve:
             yield clkedge
 
-        self.probe_blocks(block_perm, b_srcs, b_callback)
+        self.close_ports()
 
     @coroutine
-    def host_interface(self, block_perm, b_srcs, b_callback):
+    def channel(self, step, close=None):
+        """ One coroutine per channel woken every cycle, the design before
+        clock_handler, kept to benchmark against it """
         clkedge = RisingEdge(self.dut.clock)
-
         while self.drive:
-            if (self.probe & self.probe_en) and self.probe_addr not in self.ongoing_tlc.values():
-                block_addr = self.probe_addr & self.block_mask
-                mask = (1 << self.b_datalen) - 1
-                size = int(math.log(self.block_size, 2))
-
-                assert block_addr in block_perm.keys(), \
-                    '{:016x} not in block_perm.keys()'.format(block_addr)
-
-                if block_perm[block_addr] != TIP:
-                    callback = CallBack(self.enableProbe)
-                    self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
-                                       self.probe_addr, mask)
-
-                    self.probe = 0
-                    self.probe_en = 0
-                    self.probe_addr = 0
-
+            step()
             yield clkedge
 
-    def probe_block(self, probe_addr):
-        self.probe = 1
-        self.probe_addr = probe_addr
+        if close:
+            close()
 
-    @coroutine
-    def monitor_signal(self):
-        signal = self.a_ports.valid
-        previous_value = signal.value
-        while True:
-            # 等待信号的任何边沿变化
-            yield Edge(signal)
-            
-            # 记录当前仿真时间和信号的新值
-            new_value = signal.value
-            
-            previous_value = new_value
-
-        
-
-    def start(self, memory):
+    def start(self, memory, tick=None, per_channel=False):
         self.drive = True
         self.retrieve = False
-        cocotb.fork(self.monitor_signal())
+        self.wake = Event('wake')
         self.drive_input(memory)
 
+        if per_channel:
+            self.open_ports()
+            steps = [ self.a_step, self.c_step, self.e_step, self.d_step, self.b_step, \
+                      self.retrieve_step, self.host_step ] + ([ tick ] if tick else [])
+            self.handlers = [ cocotb.fork(self.channel(steps[0], self.close_ports)) ] + \
+                            [ cocotb.fork(self.channel(step)) for step in steps[1:] ]
+        else:
+            self.handlers = [ cocotb.fork(self.clock_handler(tick)) ]
+
     def stop(self):
         self.retrieve = True
+        self.wake.set()
 
     def onGoing(self):
         return self.a_ports.valid.value | self.c_ports.valid.value
@@ -40,8 +40,18 @@ class Ports:
             attr_mask = (1 << attr_len) - 1
             setattr(self, attr + '_mask', attr_mask)
 
+        # attr -> (handle, mask), looked up once instead of per beat
+        self.handles = { attr: (getattr(self, attr), getattr(self, attr + '_mask'))
+                         for attr in fields }
+
     def get(self, attr):
-        return getattr(self, attr).value & getattr(self, attr + '_mask')
+        (handle, mask) = self.handles[attr]
+        return handle.value & mask
+
+    def decoder(self, attrs):
+        """ (handle, mask) of attrs, to read a beat as
+        [ handle.value & mask for (handle, mask) in decoder ] """
+        return [ self.handles[attr] for attr in attrs ]
 
     def fire(self):
         return self.ready.value & self.valid.value
@@ -52,6 +62,27 @@ class Ports:
             port <= 0
 
 
+""" Beat decode tables of a port data width
+  byte_masks:  byte mask -> bit mask, 0xff per set bit
+  mask_shifts: byte mask -> bit offset of its lowest set byte
+  burst_lens:  size -> number of beats of a 2^size byte message
+"""
+def byte_masks(data_bytes):
+    masks = [ 0 ]
+    for byte in range(data_bytes):
+        masks += [ mask | (0xff << (byte * 8)) for mask in masks ]
+    return masks
+
+def mask_shifts(data_bytes):
+    shifts = [ 0 ] * (1 << data_bytes)
+    for mask in range(1, 1 << data_bytes):
+        shifts[mask] = ((mask & -mask).bit_length() - 1) * 8
+    return shifts
+
+def burst_lens(data_bytes, size_len):
+    return [ max((1 << size) // data_bytes, 1) for size in range(1 << size_len) ]
+
+
 """ CallBack functions which tilelink adapter should run """
 class CallBack():
     def __init__(self, func, *args, **kwargs):
@@ -0,0 +1,116 @@
+import numpy as np
+
+DRAM_BASE = 0x80000000
+
+# 4KB pages of 64-bit words
+PAGE_SHIFT = 12
+PAGE_WORDS = (1 << PAGE_SHIFT) // 8
+WORD_MASK = PAGE_WORDS - 1
+
+""" Page memory
+Sparse memory of the DUT: a page table of numpy uint64 pages, allocated
+zeroed on first access (the nop data of the adapter). Accesses are
+64-bit words at 8-byte aligned addresses. An access below DRAM_BASE and
+outside the regions loaded with rom=True is recorded in ill_addrs when it
+happens, so the host does not scan the memory after the run. A watched
+address calls back on the writes of a nonzero value (see watch).
+"""
+class pageMemory():
+    def __init__(self):
+        self.pages = {}
+        self.roms = []
+        self.ill_addrs = []
+        self.watch_addr = None
+        self.on_watch = None
+
+    def page(self, addr):
+        num = addr >> PAGE_SHIFT
+        page = self.pages.get(num)
+        if page is None:
+            page = np.zeros(PAGE_WORDS, dtype=np.uint64)
+            self.pages[num] = page
+        return page
+
+    def check(self, addr):
+        if addr < DRAM_BASE:
+            for (start, end) in self.roms:
+                if start <= addr < end:
+                    return
+            self.ill_addrs.append(addr)
+
+    def read(self, addr):
+        self.check(addr)
+        return int(self.page(addr)[(addr >> 3) & WORD_MASK])
+
+    def read_burst(self, addr, num):
+        """ num consecutive words from addr """
+        i = (addr >> 3) & WORD_MASK
+        if i + num > PAGE_WORDS:
+            return [ self.read(addr + n * 8) for n in range(num) ]
+
+        for n in range(num):
+            self.check(addr + n * 8)
+        return self.page(addr)[i:i + num].tolist()
+
+    def write(self, addr, data):
+        self.check(addr)
+        self.page(addr)[(addr >> 3) & WORD_MASK] = data
+        if addr == self.watch_addr and data:
+            self.on_watch(data)
+
+    def write_masked(self, addr, bit_mask, data):
+        """ Only the bits of bit_mask take data """
+        old = int(self.page(addr)[(addr >> 3) & WORD_MASK])
+        self.write(addr, (old & ~bit_mask) | (data & bit_mask))
+
+    def watch(self, addr, callback):
+        """ callback(value) on every write of a nonzero value to addr """
+        self.watch_addr = addr
+        self.on_watch = callback
+
+    def load(self, addr, words, rom=False):
+        """ Bulk store of words from addr, without the DRAM check """
+        words = np.asarray(words, dtype=np.uint64)
+        end = addr + len(words) * 8
+        if rom:
+            self.roms.append((addr, end))
+
+        pos = 0
+        while pos < len(words):
+            cur = addr + pos * 8
+            i = (cur >> 3) & WORD_MASK
+            num = min(PAGE_WORDS - i, len(words) - pos)
+            self.page(cur)[i:i + num] = words[pos:pos + num]
+            pos += num
+
+    def fill(self, start, end, value=0):
+        """ Store value at the words of [start, end) """
+        self.load(start, np.full((end - start) // 8, value, dtype=np.uint64))
+
+    def words(self, start, end):
+        """ Words of [start, end) as a uint64 array, without the DRAM check """
+        out = np.zeros((end - start) // 8, dtype=np.uint64)
+        pos = 0
+        while pos < len(out):
+            cur = start + pos * 8
+            i = (cur >> 3) & WORD_MASK
+            num = min(PAGE_WORDS - i, len(out) - pos)
+            page = self.pages.get(cur >> PAGE_SHIFT)
+            if page is not None:
+                out[pos:pos + num] = page[i:i + num]
+            pos += num
+        return out
+
+    def block_addrs(self, block_size):
+        """ Block addresses of the allocated pages """
+        blocks = []
+        for num in self.pages:
+            blocks.extend(range(num << PAGE_SHIFT, (num + 1) << PAGE_SHIFT, block_size))
+        return blocks
+
+    def dump_lines(self, start, end):
+        """ 128-bit lines '{hi:016x}{lo:016x}' of the words of [start, end) """
+        num = (end - start + 15) // 16
+        pairs = self.words(start, start + num * 16).reshape(num, 2)[:, ::-1]
+        text = pairs.astype('>u8').tobytes().hex()
+        return [ text[i:i + 32] for i in range(0, len(text), 32) ]
@@ -0,0 +1,506 @@
+import re
+import struct
+
+from riscv_definitions import xreg_names, freg_names
+
+""" In-process RV64G assembler
+Encodes the instruction subset emitted by rvInstGenerator and Word
+(plus the few pseudo instructions they use) without invoking gcc.
+Anything outside of the subset raises asmError, the caller then falls
+back to the toolchain.
+"""
+
+class asmError(Exception):
+    pass
+
+""" Encoding tables """
+OP_LOAD     = 0x03
+OP_LOAD_FP  = 0x07
+OP_MISC_MEM = 0x0f
+OP_IMM      = 0x13
+OP_AUIPC    = 0x17
+OP_IMM_32   = 0x1b
+OP_STORE    = 0x23
+OP_STORE_FP = 0x27
+OP_AMO      = 0x2f
+OP_OP       = 0x33
+OP_LUI      = 0x37
+OP_OP_32    = 0x3b
+OP_MADD     = 0x43
+OP_MSUB     = 0x47
+OP_NMSUB    = 0x4b
+OP_NMADD    = 0x4f
+OP_OP_FP    = 0x53
+OP_BRANCH   = 0x63
+OP_JALR     = 0x67
+OP_JAL      = 0x6f
+OP_SYSTEM   = 0x73
+
+NOP = 0x00000013
+
+rounding_modes = { 'rne': 0, 'rtz': 1, 'rdn': 2, 'rup': 3, 'rmm': 4, 'dyn': 7 }
+
+csr_addrs = {
+    'ustatus': 0x000, 'uie': 0x004, 'utvec': 0x005, 'uscratch': 0x040,
+    'uepc': 0x041, 'ucause': 0x042, 'utval': 0x043, 'uip': 0x044,
+    'fflags': 0x001, 'frm': 0x002, 'fcsr': 0x003,
+    'cycle': 0xc00, 'time': 0xc01, 'instret': 0xc02,
+    'sstatus': 0x100, 'sedeleg': 0x102, 'sideleg': 0x103, 'sie': 0x104,
+    'stvec': 0x105, 'scounteren': 0x106, 'sscratch': 0x140, 'sepc': 0x141,
+    'scause': 0x142, 'stval': 0x143, 'sip': 0x144, 'satp': 0x180,
+    'mvendorid': 0xf11, 'marchid': 0xf12, 'mimpid': 0xf13, 'mhartid': 0xf14,
+    'mstatus': 0x300, 'misa': 0x301, 'medeleg': 0x302, 'mideleg': 0x303,
+    'mie': 0x304, 'mtvec': 0x305, 'mcounteren': 0x306, 'mscratch': 0x340,
+    'mepc': 0x341, 'mcause': 0x342, 'mtval': 0x343, 'mip': 0x344,
+    'mcycle': 0xb00, 'minstret': 0xb02, 'mcycleh': 0xb80, 'minstreth': 0xb82
+}
+for i in range(4):
+    csr_addrs['pmpcfg{}'.format(i)] = 0x3a0 + i
+for i in range(16):
+    csr_addrs['pmpaddr{}'.format(i)] = 0x3b0 + i
+
+# mnemonic: (funct3, funct7)
+r_ops = {
+    'add': (0, 0x00), 'sub': (0, 0x20), 'sll': (1, 0x00), 'slt': (2, 0x00),
+    'sltu': (3, 0x00), 'xor': (4, 0x00), 'srl': (5, 0x00), 'sra': (5, 0x20),
+    'or': (6, 0x00), 'and': (7, 0x00),
+    'mul': (0, 0x01), 'mulh': (1, 0x01), 'mulhsu': (2, 0x01), 'mulhu': (3, 0x01),
+    'div': (4, 0x01), 'divu': (5, 0x01), 'rem': (6, 0x01), 'remu': (7, 0x01)
+}
+
+r32_ops = {
+    'addw': (0, 0x00), 'subw': (0, 0x20), 'sllw': (1, 0x00), 'srlw': (5, 0x00),
+    'sraw': (5, 0x20), 'mulw': (0, 0x01), 'divw': (4, 0x01), 'divuw': (5, 0x01),
+    'remw': (6, 0x01), 'remuw': (7, 0x01)
+}
+
+# mnemonic: (opcode, funct3)
+i_ops = {
+    'addi': (OP_IMM, 0), 'slti': (OP_IMM, 2), 'sltiu': (OP_IMM, 3),
+    'xori': (OP_IMM, 4), 'ori': (OP_IMM, 6), 'andi': (OP_IMM, 7),
+    'addiw': (OP_IMM_32, 0)
+}
+
+# mnemonic: (opcode, funct3, imm[11:5], shamt width)
+shift_ops = {
+    'slli': (OP_IMM, 1, 0x00, 6), 'srli': (OP_IMM, 5, 0x00, 6),
+    'srai': (OP_IMM, 5, 0x20, 6), 'slliw': (OP_IMM_32, 1, 0x00, 5),
+    'srliw': (OP_IMM_32, 5, 0x00, 5), 'sraiw': (OP_IMM_32, 5, 0x20, 5)
+}
+
+# mnemonic: (opcode, funct3, fp)
+load_ops = {
+    'lb': (OP_LOAD, 0, False), 'lh': (OP_LOAD, 1, False), 'lw': (OP_LOAD, 2, False),
+    'ld': (OP_LOAD, 3, False), 'lbu': (OP_LOAD, 4, False), 'lhu': (OP_LOAD, 5, False),
+    'lwu': (OP_LOAD, 6, False), 'flw': (OP_LOAD_FP, 2, True), 'fld': (OP_LOAD_FP, 3, True)
+}
+
+store_ops = {
+    'sb': (OP_STORE, 0, False), 'sh': (OP_STORE, 1, False), 'sw': (OP_STORE, 2, False),
+    'sd': (OP_STORE, 3, False), 'fsw': (OP_STORE_FP, 2, True), 'fsd': (OP_STORE_FP, 3, True)
+}
+
+branch_ops = { 'beq': 0, 'bne': 1, 'blt': 4, 'bge': 5, 'bltu': 6, 'bgeu': 7 }
+
+csr_ops = { 'csrrw': 1, 'csrrs': 2, 'csrrc': 3, 'csrrwi': 5, 'csrrsi': 6, 'csrrci': 7 }
+
+amo_ops = {
+    'lr': 0x02, 'sc': 0x03, 'amoswap': 0x01, 'amoadd': 0x00, 'amoxor': 0x04,
+    'amoand': 0x0c, 'amoor': 0x08, 'amomin': 0x10, 'amomax': 0x14,
+    'amominu': 0x18, 'amomaxu': 0x1c
+}
+
+fixed_ops = {
+    'ecall': 0x00000073, 'ebreak': 0x00100073, 'uret': 0x00200073, 'sret': 0x10200073,
+    'mret': 0x30200073, 'wfi': 0x10500073, 'fence': 0x0ff0000f,
+    'fence.i': 0x0000100f, 'nop': NOP
+}
+
+# mnemonic: (funct7, funct3 or None for rm, rs2 or None for operand, operand types)
+fp_ops = {}
+for (fmt, sfx) in [ (0, 's'), (1, 'd') ]:
+    for (name, funct5) in [ ('fadd', 0x00), ('fsub', 0x01), ('fmul', 0x02), ('fdiv', 0x03) ]:
+        fp_ops['{}.{}'.format(name, sfx)] = (funct5 << 2 | fmt, None, None, 'fff')
+    fp_ops['fsqrt.' + sfx] = (0x0b << 2 | fmt, None, 0, 'ff')
+    for (name, f3) in [ ('fsgnj', 0), ('fsgnjn', 1), ('fsgnjx', 2) ]:
+        fp_ops['{}.{}'.format(name, sfx)] = (0x04 << 2 | fmt, f3, None, 'fff')
+    for (name, f3) in [ ('fmin', 0), ('fmax', 1) ]:
+        fp_ops['{}.{}'.format(name, sfx)] = (0x05 << 2 | fmt, f3, None, 'fff')
+    for (name, f3) in [ ('feq', 2), ('flt', 1), ('fle', 0) ]:
+        fp_ops['{}.{}'.format(name, sfx)] = (0x14 << 2 | fmt, f3, None, 'xff')
+    fp_ops['fclass.' + sfx] = (0x1c << 2 | fmt, 1, 0, 'xf')
+    for (itype, rs2) in [ ('w', 0), ('wu', 1), ('l', 2), ('lu', 3) ]:
+        fp_ops['fcvt.{}.{}'.format(itype, sfx)] = (0x18 << 2 | fmt, None, rs2, 'xf')
+        fp_ops['fcvt.{}.{}'.format(sfx, itype)] = (0x1a << 2 | fmt, None, rs2, 'fx')
+
+fp_ops['fmv.x.w'] = (0x1c << 2 | 0, 0, 0, 'xf')
+fp_ops['fmv.w.x'] = (0x1e << 2 | 0, 0, 0, 'fx')
+fp_ops['fmv.x.d'] = (0x1c << 2 | 1, 0, 0, 'xf')
+fp_ops['fmv.d.x'] = (0x1e << 2 | 1, 0, 0, 'fx')
+fp_ops['fcvt.s.d'] = (0x08 << 2 | 0, None, 1, 'ff')
+fp_ops['fcvt.d.s'] = (0x08 << 2 | 1, None, 0, 'ff')
+
+# Exact conversions default to rne in binutils, everything else to dyn
+fp_default_rne = [ 'fcvt.d.s', 'fcvt.d.w', 'fcvt.d.wu' ]
+
+r4_ops = {}
+for (fmt, sfx) in [ (0, 's'), (1, 'd') ]:
+    for (name, opcode) in [ ('fmadd', OP_MADD), ('fmsub', OP_MSUB),
+                            ('fnmsub', OP_NMSUB), ('fnmadd', OP_NMADD) ]:
+        r4_ops['{}.{}'.format(name, sfx)] = (opcode, fmt)
+
+""" Fixup kinds """
+FIX_BRANCH   = 0
+FIX_JAL      = 1
+FIX_PCREL_HI = 2
+FIX_PCREL_LO = 3
+
+mem_operand = re.compile(r'^(.*)\((\w+)\)$')
+
+""" Field encoders """
+def check_range(val, lo, hi, what):
+    if val < lo or val > hi:
+        raise asmError('{} {} out of range [{}, {}]'.format(what, val, lo, hi))
+
+def enc_r(opcode, rd, funct3, rs1, rs2, funct7):
+    return (funct7 << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+def enc_r4(opcode, rd, rm, rs1, rs2, rs3, fmt):
+    return (rs3 << 27) | (fmt << 25) | (rs2 << 20) | (rs1 << 15) | (rm << 12) | (rd << 7) | opcode
+
+def enc_i(opcode, rd, funct3, rs1, imm):
+    check_range(imm, -2048, 2047, 'I-immediate')
+    return ((imm & 0xfff) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+def enc_s(opcode, funct3, rs1, rs2, imm):
+    check_range(imm, -2048, 2047, 'S-immediate')
+    return (((imm >> 5) & 0x7f) << 25) | (rs2 << 20) | (rs1 << 15) | \
+        (funct3 << 12) | ((imm & 0x1f) << 7) | opcode
+
+def enc_b(opcode, funct3, rs1, rs2, offset):
+    check_range(offset, -4096, 4094, 'Branch offset')
+    return (((offset >> 12) & 0x1) << 31) | (((offset >> 5) & 0x3f) << 25) | \
+        (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | \
+        (((offset >> 1) & 0xf) << 8) | (((offset >> 11) & 0x1) << 7) | opcode
+
+def enc_u(opcode, rd, imm20):
+    return ((imm20 & 0xfffff) << 12) | (rd << 7) | opcode
+
+def enc_j(opcode, rd, offset):
+    check_range(offset, -(1 << 20), (1 << 20) - 2, 'Jump offset')
+    return (((offset >> 20) & 0x1) << 31) | (((offset >> 1) & 0x3ff) << 21) | \
+        (((offset >> 11) & 0x1) << 20) | (((offset >> 12) & 0xff) << 12) | \
+        (rd << 7) | opcode
+
+def split_pcrel(offset):
+    hi = ((offset + 0x800) >> 12) & 0xfffff
+    lo = offset - (((offset + 0x800) >> 12) << 12)
+    return (hi, lo)
+
+class rvAssembler():
+    def __init__(self):
+        self.xregs = {}
+        for i in range(32):
+            self.xregs['x{}'.format(i)] = i
+            self.xregs[xreg_names[i]] = i
+        self.xregs['fp'] = 8
+
+        self.fregs = {}
+        for i in range(32):
+            self.fregs['f{}'.format(i)] = i
+            self.fregs[freg_names[i]] = i
+
+    def xreg(self, name):
+        if name not in self.xregs:
+            raise asmError('Unknown integer register {}'.format(name))
+        return self.xregs[name]
+
+    def freg(self, name):
+        if name not in self.fregs:
+            raise asmError('Unknown floating point register {}'.format(name))
+        return self.fregs[name]
+
+    def imm(self, token):
+        try:
+            return int(token, 0)
+        except ValueError:
+            raise asmError('Bad immediate {}'.format(token))
+
+    def mem(self, token):
+        m = mem_operand.match(token)
+        if not m:
+            raise asmError('Bad memory operand {}'.format(token))
+        offset = m.group(1).strip()
+        return (self.imm(offset) if offset else 0, self.xreg(m.group(2)))
+
+    def rm(self, operands, n, mnemonic):
+        if len(operands) > n:
+            if operands[n] not in rounding_modes:
+                raise asmError('Bad rounding mode {}'.format(operands[n]))
+            return rounding_modes[operands[n]]
+        if mnemonic in fp_default_rne:
+            return 0
+        return rounding_modes['dyn']
+
+    def symbol(self, name, symbols):
+        if name not in symbols:
+            raise asmError('Undefined symbol {}'.format(name))
+        return symbols[name]
+
+    def parse(self, line):
+        """ Returns (labels, mnemonic, operands) of one assembly line """
+        line = line.split('#')[0].strip().rstrip(';').strip()
+
+        labels = []
+        while True:
+            m = re.match(r'^([A-Za-z_.$][\w.$]*):\s*', line)
+            if not m: break
+            labels.append(m.group(1))
+            line = line[m.end():]
+
+        if not line:
+            return (labels, None, [])
+
+        tokens = line.split(None, 1)
+        mnemonic = tokens[0]
+        operands = []
+        if len(tokens) > 1:
+            operands = [ op.strip() for op in tokens[1].split(',') ]
+
+        return (labels, mnemonic, operands)
+
+    def size(self, mnemonic, operands):
+        if mnemonic is None: return 0
+        if mnemonic == 'la': return 8
+        if mnemonic == '.word': return 4 * len(operands)
+        return 4
+
+    def encode_insn(self, mnemonic, operands):
+        """ Returns the (32-bit word, fixup) pairs of one (pseudo) instruction.
+        A fixup is None or (kind, symbol); the symbol dependent immediate
+        is left zero until resolve() """
+        ops = operands
+        try:
+            if mnemonic in branch_ops:
+                return [ (enc_b(OP_BRANCH, branch_ops[mnemonic], self.xreg(ops[0]),
+                                self.xreg(ops[1]), 0), (FIX_BRANCH, ops[2])) ]
+
+            if mnemonic in [ 'jal', 'j' ]:
+                rd = 0 if mnemonic == 'j' else self.xreg(ops[0])
+                return [ (enc_j(OP_JAL, rd, 0), (FIX_JAL, ops[-1])) ]
+
+            if mnemonic == 'la':
+                rd = self.xreg(ops[0])
+                return [ (enc_u(OP_AUIPC, rd, 0), (FIX_PCREL_HI, ops[1])),
+                         (enc_i(OP_IMM, rd, 0, rd, 0), (FIX_PCREL_LO, ops[1])) ]
+
+            return [ (word, None) for word in self.encode_plain(mnemonic, ops) ]
+        except IndexError:
+            raise asmError('Missing operand in {} {}'.format(mnemonic, ', '.join(operands)))
+
+    def resolve(self, word, fixup, pc, symbols):
+        if fixup is None:
+            return word
+
+        (kind, name) = fixup
+        target = self.symbol(name, symbols)
+        if kind == FIX_BRANCH:
+            return word | enc_b(0, 0, 0, 0, target - pc)
+        elif kind == FIX_JAL:
+            return word | enc_j(0, 0, target - pc)
+        elif kind == FIX_PCREL_HI:
+            (hi, lo) = split_pcrel(target - pc)
+            return word | (hi << 12)
+        else: # FIX_PCREL_LO, paired with the auipc right before
+            (hi, lo) = split_pcrel(target - (pc - 4))
+            return word | ((lo & 0xfff) << 20)
+
+    def encode(self, mnemonic, operands, pc, symbols):
+        """ Returns the instruction words of one (pseudo) instruction at pc """
+        return [ self.resolve(word, fixup, pc + 4 * i, symbols) for (i, (word, fixup)) in \
+                 enumerate(self.encode_insn(mnemonic, operands)) ]
+
+    def encode_plain(self, mnemonic, ops):
+        if mnemonic in fixed_ops:
+            if ops: raise asmError('{} takes no operand'.format(mnemonic))
+            return [ fixed_ops[mnemonic] ]
+
+        if mnemonic == '.word':
+            return [ self.imm(op) & 0xffffffff for op in ops ]
+
+        if mnemonic in r_ops or mnemonic in r32_ops:
+            opcode = OP_OP if mnemonic in r_ops else OP_OP_32
+            (funct3, funct7) = r_ops.get(mnemonic, r32_ops.get(mnemonic))
+            return [ enc_r(opcode, self.xreg(ops[0]), funct3, self.xreg(ops[1]),
+                           self.xreg(ops[2]), funct7) ]
+
+        if mnemonic in i_ops:
+            (opcode, funct3) = i_ops[mnemonic]
+            return [ enc_i(opcode, self.xreg(ops[0]), funct3, self.xreg(ops[1]),
+                           self.imm(ops[2])) ]
+
+        if mnemonic in shift_ops:
+            (opcode, funct3, funct7, width) = shift_ops[mnemonic]
+            shamt = self.imm(ops[2])
+            check_range(shamt, 0, (1 << width) - 1, 'Shift amount')
+            return [ enc_r(opcode, self.xreg(ops[0]), funct3, self.xreg(ops[1]),
+                           shamt & 0x1f, funct7 | (shamt >> 5)) ]
+
+        if mnemonic in load_ops:
+            (opcode, funct3, fp) = load_ops[mnemonic]
+            rd = self.freg(ops[0]) if fp else self.xreg(ops[0])
+            (offset, rs1) = self.mem(ops[1])
+            return [ enc_i(opcode, rd, funct3, rs1, offset) ]
+
+        if mnemonic in store_ops:
+            (opcode, funct3, fp) = store_ops[mnemonic]
+            rs2 = self.freg(ops[0]) if fp else self.xreg(ops[0])
+            (offset, rs1) = self.mem(ops[1])
+            return [ enc_s(opcode, funct3, rs1, rs2, offset) ]
+
+        if mnemonic in [ 'lui', 'auipc' ]:
+            imm20 = self.imm(ops[1])
+            check_range(imm20, 0, 0xfffff, 'U-immediate')
+            opcode = OP_LUI if mnemonic == 'lui' else OP_AUIPC
+            return [ enc_u(opcode, self.xreg(ops[0]), imm20) ]
+
+        if mnemonic == 'jalr':
+            (offset, rs1) = self.mem(ops[1])
+            return [ enc_i(OP_JALR, self.xreg(ops[0]), 0, rs1, offset) ]
+
+        if mnemonic in csr_ops:
+            if ops[1] not in csr_addrs:
+                raise asmError('Unknown CSR {}'.format(ops[1]))
+            if mnemonic[-1] == 'i':
+                src = self.imm(ops[2])
+                check_range(src, 0, 31, 'CSR immediate')
+            else:
+                src = self.xreg(ops[2])
+            return [ (csr_addrs[ops[1]] << 20) | (src << 15) | \
+                     (csr_ops[mnemonic] << 12) | (self.xreg(ops[0]) << 7) | OP_SYSTEM ]
+
+        if mnemonic == 'sfence.vma':
+            rs1 = self.xreg(ops[0]) if len(ops) > 0 else 0
+            rs2 = self.xreg(ops[1]) if len(ops) > 1 else 0
+            return [ enc_r(OP_SYSTEM, 0, 0, rs1, rs2, 0x09) ]
+
+        if mnemonic.split('.')[0] in amo_ops and len(mnemonic.split('.')) == 2:
+            (name, width) = mnemonic.split('.')
+            if width not in [ 'w', 'd' ]:
+                raise asmError('Bad AMO width {}'.format(mnemonic))
+            funct3 = 2 if width == 'w' else 3
+            rd = self.xreg(ops[0])
+            if name == 'lr':
+                (offset, rs1) = self.mem(ops[1])
+                rs2 = 0
+            else:
+                rs2 = self.xreg(ops[1])
+                (offset, rs1) = self.mem(ops[2])
+            if offset != 0:
+                raise asmError('AMO offset must be 0')
+            return [ enc_r(OP_AMO, rd, funct3, rs1, rs2, amo_ops[name] << 2) ]
+
+        if mnemonic in fp_ops:
+            (funct7, funct3, rs2, tpes) = fp_ops[mnemonic]
+            regs = []
+            for (tpe, op) in zip(tpes, ops):
+                regs.append(self.freg(op) if tpe == 'f' else self.xreg(op))
+            if len(regs) != len(tpes):
+                raise asmError('{} needs {} operands'.format(mnemonic, len(tpes)))
+            if funct3 is None:
+                funct3 = self.rm(ops, len(tpes), mnemonic)
+            elif len(ops) > len(tpes):
+                raise asmError('{} takes no rounding mode'.format(mnemonic))
+            if rs2 is None:
+                rs2 = regs[2]
+            return [ enc_r(OP_OP_FP, regs[0], funct3, regs[1], rs2, funct7) ]
+
+        if mnemonic in r4_ops:
+            (opcode, fmt) = r4_ops[mnemonic]
+            regs = [ self.freg(op) for op in ops[:4] ]
+            return [ enc_r4(opcode, regs[0], self.rm(ops, 4, mnemonic),
+                            regs[1], regs[2], regs[3], fmt) ]
+
+        if mnemonic == 'li':
+            imm = self.imm(ops[1])
+            return [ enc_i(OP_IMM, self.xreg(ops[0]), 0, 0, imm) ]
+
+        raise asmError('Unsupported instruction {}'.format(mnemonic))
+
+    def assemble(self, regions, symbols):
+        """ Assembles a list of (base address, entries).
+        An entry is either a line of assembly or a (label, encoding) pair
+        already encoded by encode_insn (e.g., Word.get_entry).
+        Labels of all regions are resolved first, so regions may refer to
+        each other and to the given (template) symbols.
+        Returns (list of word lists, label addresses) """
+        parsed = []
+        labels = {}
+        for (base, entries) in regions:
+            pc = base
+            region = []
+            for entry in entries:
+                if isinstance(entry, tuple):
+                    (label, encoding) = entry
+                    labels[label] = pc
+                else:
+                    (line_labels, mnemonic, operands) = self.parse(entry)
+                    for label in line_labels:
+                        labels[label] = pc
+                    if mnemonic is None:
+                        continue
+                    encoding = self.encode_insn(mnemonic, operands)
+
+                region.append((pc, encoding))
+                pc += 4 * len(encoding)
+            parsed.append(region)
+
+        all_symbols = dict(symbols)
+        all_symbols.update(labels)
+
+        words = []
+        for region in parsed:
+            region_words = []
+            for (pc, encoding) in region:
+                for (i, (word, fixup)) in enumerate(encoding):
+                    region_words.append(self.resolve(word, fixup, pc + 4 * i, all_symbols))
+            words.append(region_words)
+
+        return (words, labels)
+
+""" ELF helpers
+Minimal ELF64 little-endian section access to patch a linked image in place
+"""
+def elf_sections(elf):
+    (e_shoff,) = struct.unpack_from('<Q', elf, 0x28)
+    (e_shentsize, e_shnum, e_shstrndx) = struct.unpack_from('<HHH', elf, 0x3a)
+
+    headers = []
+    for i in range(e_shnum):
+        (name, tpe, flags, addr, offset, size) = \
+            struct.unpack_from('<IIQQQQ', elf, e_shoff + i * e_shentsize)
+        headers.append((name, tpe, addr, offset, size))
+
+    strtab = headers[e_shstrndx][3]
+    sections = {}
+    for (name, tpe, addr, offset, size) in headers:
+        end = elf.index(b'\0', strtab + name)
+        sections[bytes(elf[strtab + name:end]).decode()] = (addr, offset, size, tpe)
+
+    return sections
+
+def elf_patch(elf, sections, addr, payload):
+    """ Writes payload at a virtual address inside a PROGBITS section """
+    for (sec_addr, offset, size, tpe) in sections.values():
+        if sec_addr and tpe == 1 and sec_addr <= addr and addr + len(payload) <= sec_addr + size:
+            start = offset + addr - sec_addr
+            elf[start:start + len(payload)] = payload
+            return
+    raise asmError('Address {:016x} is not in the image'.format(addr))
+
+def elf_read(elf, sections, addr, length):
+    for (sec_addr, offset, size, tpe) in sections.values():
+        if sec_addr and tpe == 1 and sec_addr <= addr and addr + length <= sec_addr + size:
+            start = offset + addr - sec_addr
+            return bytes(elf[start:start + length])
+    raise asmError('Address {:016x} is not in the image'.format(addr))
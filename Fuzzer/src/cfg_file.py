@@ -0,0 +1,171 @@
+import os
+import json
+import pickle
+import struct
+import argparse
+import numpy as np
+
+from cfg_index import csr_from_lists, cfg_arrays
+
+# magic, length of the JSON array table that follows
+CFG_HDR = struct.Struct('<8sQ')
+CFG_MAGIC = b'CFGBIN01'
+CFG_ALIGN = 64
+
+def pack_cfg(CFG):
+    """ Flat arrays of a pickled CFG dict:
+      succ/pred/idom:  CSR (ptr, idx) adjacency of the blocks
+      assign:          assign block mask
+      cov_ptr:         start of each coverage signal in cov_assign
+      cov_assign:      assign id of coverage bit (i, j) at cov_ptr[i] + j, -1 if none
+      assign_to_block: block of each assign id, -1 if none
+    """
+    (succ_ptr, succ_idx, pred_ptr, pred_idx, assign) = cfg_arrays(CFG)
+    num = len(succ_ptr) - 1
+
+    blocks = [ CFG.get(n, {}) for n in range(num) ]
+    (idom_ptr, idom_idx) = csr_from_lists([ b.get('orig_idom', []) for b in blocks ], num)
+
+    count_to_assign = CFG['count_to_assign']
+    widths = np.zeros(max([ i for (i, j) in count_to_assign ]) + 1, dtype=np.int64)
+    for (i, j) in count_to_assign:
+        widths[i] = max(widths[i], j + 1)
+
+    cov_ptr = np.zeros(len(widths) + 1, dtype=np.int64)
+    cov_ptr[1:] = np.cumsum(widths)
+    cov_assign = np.full(cov_ptr[-1], -1, dtype=np.int32)
+    for ((i, j), assign_id) in count_to_assign.items():
+        cov_assign[cov_ptr[i] + j] = assign_id
+
+    assign_to_block = np.full(max(CFG['assign_to_block']) + 1, -1, dtype=np.int32)
+    for (assign_id, block) in CFG['assign_to_block'].items():
+        assign_to_block[assign_id] = block
+
+    mapped = cov_assign[cov_assign >= 0]
+    assert (assign_to_block[mapped] >= 0).all(), 'Coverage bit without an assign block'
+    assert (assign_to_block[mapped] < num).all(), 'Assign block out of the CFG'
+
+    return { 'succ_ptr': succ_ptr, 'succ_idx': succ_idx,
+             'pred_ptr': pred_ptr, 'pred_idx': pred_idx,
+             'idom_ptr': idom_ptr, 'idom_idx': idom_idx,
+             'assign': assign,
+             'cov_ptr': cov_ptr, 'cov_assign': cov_assign,
+             'assign_to_block': assign_to_block }
+
+def write_cfg(arrays, path):
+    table = []
+    offset = 0
+    for (name, array) in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = (offset + CFG_ALIGN - 1) // CFG_ALIGN * CFG_ALIGN
+        table.append([ name, array.dtype.str, list(array.shape), offset ])
+        offset += array.nbytes
+
+    header = json.dumps(table).encode()
+    data_start = (CFG_HDR.size + len(header) + CFG_ALIGN - 1) // CFG_ALIGN * CFG_ALIGN
+
+    # Workers may convert at the same time, the file is replaced at once
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    fd = open(tmp, 'wb')
+    fd.write(CFG_HDR.pack(CFG_MAGIC, len(header)) + header)
+    for ((name, dtype, shape, offset), array) in zip(table, arrays.values()):
+        fd.seek(data_start + offset)
+        fd.write(np.ascontiguousarray(array).tobytes())
+    fd.close()
+    os.replace(tmp, path)
+
+def convert_cfg(file_pkl, file_bin):
+    with open(file_pkl, 'rb') as file:
+        CFG = pickle.load(file)
+    write_cfg(pack_cfg(CFG), file_bin)
+
+""" Memory mapped CFG
+Read-only view of a CFG converted by convert_cfg. The arrays are backed by
+a single mmap of the file, so the forked workers share the page cache
+instead of each unpickling the CFG into dicts.
+"""
+class cfgFile():
+    def __init__(self, path):
+        fd = open(path, 'rb')
+        (magic, header_len) = CFG_HDR.unpack(fd.read(CFG_HDR.size))
+        assert magic == CFG_MAGIC, '{} is not a converted CFG'.format(path)
+        table = json.loads(fd.read(header_len).decode())
+        fd.close()
+
+        data_start = (CFG_HDR.size + header_len + CFG_ALIGN - 1) // CFG_ALIGN * CFG_ALIGN
+        # Plain ndarray views of the mapping, memmap slicing is slow
+        data = np.memmap(path, dtype=np.uint8, mode='r').view(np.ndarray)
+
+        for (name, dtype, shape, offset) in table:
+            dtype = np.dtype(dtype)
+            start = data_start + offset
+            end = start + dtype.itemsize * int(np.prod(shape))
+            setattr(self, name, data[start:end].view(dtype).reshape(shape))
+
+        self.num_blocks = len(self.succ_ptr) - 1
+
+    def __contains__(self, block):
+        return isinstance(block, (int, np.integer)) and 0 <= block < self.num_blocks
+
+    def successors(self, block):
+        return self.succ_idx[self.succ_ptr[block]:self.succ_ptr[block + 1]]
+
+    def predecessors(self, block):
+        return self.pred_idx[self.pred_ptr[block]:self.pred_ptr[block + 1]]
+
+    def orig_idom(self, block):
+        return self.idom_idx[self.idom_ptr[block]:self.idom_ptr[block + 1]]
+
+    def path_blocks(self, items):
+        """ Blocks of coverage bits items = [(i, j), ...], -1 if one has no assign """
+        items = np.asarray(items, dtype=np.int64).reshape(-1, 2)
+        (i, j) = (items[:, 0], items[:, 1])
+
+        valid = i < len(self.cov_ptr) - 1
+        valid[valid] = j[valid] < self.cov_ptr[i[valid] + 1] - self.cov_ptr[i[valid]]
+
+        blocks = np.full(len(items), -1, dtype=np.int64)
+        assign_id = self.cov_assign[self.cov_ptr[i[valid]] + j[valid]]
+        blocks[valid] = np.where(assign_id >= 0, self.assign_to_block[assign_id], -1)
+        return blocks
+
+    def idom_parents(self):
+        """ First orig_idom of every block, -1 if none """
+        parents = np.full(self.num_blocks, -1, dtype=np.int64)
+        has_idom = np.diff(self.idom_ptr) > 0
+        parents[has_idom] = self.idom_idx[self.idom_ptr[:-1][has_idom]]
+        return parents
+
+    def count_blocks(self):
+        """ Blocks with a coverage bit, in coverage bit order """
+        blocks = self.assign_to_block[self.cov_assign[self.cov_assign >= 0]]
+        (uniq, first) = np.unique(blocks, return_index=True)
+        return blocks[np.sort(first)]
+
+    def index_arrays(self):
+        """ Arguments of cfgIndex but the unvisited mask """
+        return (self.succ_ptr, self.succ_idx, self.pred_ptr, self.pred_idx, self.assign)
+
+def load_cfg(top_module, cfg_dir='../CFG'):
+    """ Map the converted CFG of top_module, (re)converting the pickle
+    when it is missing or out of date """
+    file_pkl = '{}/{}_cfg.pkl'.format(cfg_dir, top_module)
+    file_bin = '{}/{}_cfg.bin'.format(cfg_dir, top_module)
+
+    if os.path.isfile(file_pkl) and (not os.path.isfile(file_bin) or
+                                     os.path.getmtime(file_bin) < os.path.getmtime(file_pkl)):
+        convert_cfg(file_pkl, file_bin)
+
+    return cfgFile(file_bin)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a pickled CFG to the mmap format')
+    parser.add_argument('pkl', help='{top}_cfg.pkl from the CFG extraction')
+    parser.add_argument('-o', '--output', help='output file (default: .pkl replaced by .bin)')
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.pkl)[0] + '.bin'
+    convert_cfg(args.pkl, output)
+
+    cfg = cfgFile(output)
+    print('{}: {} blocks, {} bytes'.format(output, cfg.num_blocks, os.path.getsize(output)))
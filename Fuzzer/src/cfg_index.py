@@ -0,0 +1,145 @@
+import numpy as np
+
+NO_DIST = 9999
+
+# Same depth bounds as the original BFS/DFS scoring
+DEP_DEPTH = 4
+ASSIGN_DEPTH = 4
+
+def csr_from_lists(lists, num):
+    """ (ptr, idx) CSR arrays of num adjacency lists """
+    ptr = np.zeros(num + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum([ len(l) for l in lists ])
+    idx = np.fromiter((n for l in lists for n in l), dtype=np.int32, count=ptr[-1])
+    return (ptr, idx)
+
+def csr_gather(ptr, idx, nodes):
+    """ (owner position in nodes, neighbor) of every edge leaving nodes """
+    starts = ptr[nodes]
+    lens = ptr[nodes + 1] - starts
+    owner = np.repeat(np.arange(len(nodes)), lens)
+    first = np.repeat(starts - np.cumsum(lens) + lens, lens)
+    return (owner, idx[first + np.arange(len(owner))])
+
+def csr_transpose(ptr, idx):
+    """ CSR arrays of the reversed edges """
+    num = len(ptr) - 1
+    src = np.repeat(np.arange(num, dtype=np.int32), np.diff(ptr))
+    order = np.argsort(idx, kind='stable')
+    rptr = np.zeros(num + 1, dtype=np.int64)
+    rptr[1:] = np.cumsum(np.bincount(idx, minlength=num))
+    return (rptr, src[order])
+
+def cfg_arrays(CFG):
+    """ CSR successor/predecessor arrays and assign block mask of a CFG dict """
+    num = max([ k for k in CFG if isinstance(k, int) ]) + 1
+    empty = { 'successors': [], 'predecessors': [] }
+    blocks = [ CFG.get(n, empty) for n in range(num) ]
+
+    (succ_ptr, succ_idx) = csr_from_lists([ b['successors'] for b in blocks ], num)
+    (pred_ptr, pred_idx) = csr_from_lists([ b['predecessors'] for b in blocks ], num)
+
+    assign = np.zeros(num, dtype=bool)
+    assign[list(CFG.get('assign_block', []))] = True
+
+    return (succ_ptr, succ_idx, pred_ptr, pred_idx, assign)
+
+""" CFG distance index
+Distances from every block to the unvisited blocks (tracked in cul_path
+with no hits), over CSR adjacency arrays:
+  dep_dist:    successor hops to the nearest unvisited block (<= DEP_DEPTH),
+               scored 1 / distance by calculate_depdency
+  assign_dist: hops back from the nearest unvisited block over the
+               predecessors, only non-assign blocks count as a hop
+               (<= ASSIGN_DEPTH), assign blocks themselves have none
+The predecessors of the CFG are not the reversed successors, so each
+distance has its own graph (and its transpose to find the blocks affected
+by a newly covered one). Both follow d(u) = cost(u) + min over next blocks
+w of (0 if w is unvisited else d(w)). When blocks get covered only the
+blocks within the depth bound before them are recomputed.
+"""
+class cfgIndex():
+    def __init__(self, succ_ptr, succ_idx, pred_ptr, pred_idx, assign, unvisited):
+        # (next blocks, previous blocks) of each distance
+        self.dep_graph = ((succ_ptr, succ_idx), csr_transpose(succ_ptr, succ_idx))
+        self.assign_graph = (csr_transpose(pred_ptr, pred_idx), (pred_ptr, pred_idx))
+        self.assign = assign
+        self.unvisited = unvisited
+        self.num_blocks = len(unvisited)
+
+        self.dep_cost = np.ones(self.num_blocks, dtype=np.int16)
+        self.assign_cost = np.where(assign, 0, 1).astype(np.int16)
+
+        self.dep_dist = np.full(self.num_blocks, NO_DIST, dtype=np.int16)
+        self.assign_dist = np.full(self.num_blocks, NO_DIST, dtype=np.int16)
+
+        nodes = np.arange(self.num_blocks)
+        self.relax(self.dep_dist, self.dep_cost, DEP_DEPTH, self.dep_graph, nodes)
+        self.relax(self.assign_dist, self.assign_cost, ASSIGN_DEPTH, self.assign_graph, nodes)
+        self.update_weights()
+
+    def update_weights(self):
+        dist = self.dep_dist.astype(np.float64)
+        self.dep_weight = np.where(self.dep_dist <= DEP_DEPTH, 1 / dist, 0.0)
+
+    def relax(self, dist, cost, depth, graph, nodes):
+        """ Recompute dist of nodes, the other blocks are up to date """
+        dist[nodes] = NO_DIST
+        (owner, succ) = csr_gather(*graph[0], nodes)
+        if not len(owner): return
+
+        # Edges grouped per node, nodes without successors keep NO_DIST
+        has_edges = np.bincount(owner, minlength=len(nodes)) > 0
+        firsts = np.searchsorted(owner, np.flatnonzero(has_edges))
+        node_cost = cost[nodes][owner]
+        targets = nodes[has_edges]
+
+        while True:
+            reach = np.where(self.unvisited[succ], 0, dist[succ]).astype(np.int32)
+            best = np.minimum.reduceat(reach + node_cost, firsts)
+            best[best > depth] = NO_DIST
+
+            if np.array_equal(best, dist[targets]): break
+            dist[targets] = best
+
+    def reach(self, blocks, cost, depth, graph):
+        """ Blocks reaching one of blocks within depth """
+        best = np.full(self.num_blocks, NO_DIST, dtype=np.int32)
+        best[blocks] = 0
+        frontier = np.asarray(blocks)
+        while len(frontier):
+            (owner, pred) = csr_gather(*graph[1], frontier)
+            new = best[frontier][owner] + cost[pred]
+            keep = (new <= depth) & (new < best[pred])
+            (pred, new) = (pred[keep], new[keep])
+            np.minimum.at(best, pred, new)
+            frontier = np.unique(pred)
+        return np.flatnonzero(best != NO_DIST)
+
+    def cover(self, blocks):
+        """ blocks got their first hits """
+        blocks = np.asarray(blocks, dtype=np.int64)
+        blocks = blocks[(blocks < self.num_blocks)]
+        blocks = blocks[self.unvisited[blocks]]
+        if not len(blocks): return
+
+        self.unvisited[blocks] = False
+        for (dist, cost, depth, graph) in [
+                (self.dep_dist, self.dep_cost, DEP_DEPTH, self.dep_graph),
+                (self.assign_dist, self.assign_cost, ASSIGN_DEPTH, self.assign_graph) ]:
+            self.relax(dist, cost, depth, graph, self.reach(blocks, cost, depth, graph))
+        self.update_weights()
+
+    def path_array(self, path):
+        path = np.asarray(path, dtype=np.int64)
+        return path[path < self.num_blocks]
+
+    def dep_point(self, path):
+        return float(self.dep_weight[self.path_array(path)].sum())
+
+    def assign_point(self, path):
+        path = self.path_array(path)
+        if not len(path): return NO_DIST
+
+        dist = np.where(self.assign[path], NO_DIST, self.assign_dist[path])
+        return int(dist.min())
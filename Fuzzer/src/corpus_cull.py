@@ -0,0 +1,41 @@
+import numpy as np
+
+# Corpus additions between two cullings
+CULL_INTERVAL = 100
+
+def top_rated(paths, costs):
+    """ (blocks, entry) pairs: the cheapest entry visiting each block """
+    lens = [ len(path) for path in paths ]
+    if not sum(lens):
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    blocks = np.concatenate(paths)
+    owner = np.repeat(np.arange(len(paths)), lens)
+
+    # Sorted by block, then cost, then corpus position
+    order = np.lexsort((owner, np.asarray(costs)[owner], blocks))
+    (blocks, first) = np.unique(blocks[order], return_index=True)
+    return (blocks, owner[order][first])
+
+""" Favored corpus entries
+Greedy set cover over the visited blocks in the way of AFL's favored
+entries: every block is rated to the cheapest (short and fast) entry
+visiting it, then going through the blocks in order, the top rated entry of
+a block not covered yet is favored and covers all its blocks. The entries
+left out only visit blocks of the favored ones.
+"""
+def favored_entries(paths, costs):
+    """ Boolean mask of the favored entries """
+    favored = np.zeros(len(paths), dtype=bool)
+    (blocks, top) = top_rated(paths, costs)
+    if not len(blocks):
+        return favored
+
+    covered = np.zeros(blocks[-1] + 1, dtype=bool)
+    for (block, entry) in zip(blocks.tolist(), top.tolist()):
+        if covered[block]:
+            continue
+        favored[entry] = True
+        covered[paths[entry]] = True
+
+    return favored
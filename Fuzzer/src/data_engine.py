@@ -0,0 +1,137 @@
+import random
+import numpy as np
+
+# 6 data sections of 64 double words
+DATA_WORDS = 64 * 6
+# Fresh random seeds generated at once
+DATA_BATCH = 32
+# Words rewritten by a flip/fp/int mutation
+MUT_WORDS = (1, 8)
+# Prior yield of a data seed without runs
+PRIOR_GAIN = 1.0
+
+def nan_box(single):
+    return 0xffffffff00000000 | single
+
+# +-0, +-inf, quiet/signaling NaN, denormals, normal bounds, +-1
+INTERESTING_FP = np.array(
+    [ 0x0000000000000000, 0x8000000000000000, 0x7ff0000000000000, 0xfff0000000000000,
+      0x7ff8000000000000, 0x7ff0000000000001, 0x0000000000000001, 0x000fffffffffffff,
+      0x8000000000000001, 0x0010000000000000, 0x7fefffffffffffff, 0x3ff0000000000000,
+      0xbff0000000000000 ] +
+    [ nan_box(single) for single in
+      [ 0x00000000, 0x80000000, 0x7f800000, 0xff800000, 0x7fc00000, 0x7f800001,
+        0x00000001, 0x007fffff, 0x00800000, 0x7f7fffff, 0x3f800000, 0xbf800000 ] ] +
+    # Single precision values without NaN boxing
+    [ 0x000000007fc00000, 0x000000007f800000 ],
+    dtype=np.uint64)
+
+# Boundaries of the 8/16/32/64 bit integers, zero and sign extended
+INTERESTING_INT = np.array(
+    [ 0x0, 0x1, 0xffffffffffffffff, 0x7f, 0x80, 0xff, 0xffffffffffffff80,
+      0x7fff, 0x8000, 0xffff, 0xffffffffffff8000, 0x7fffffff, 0x80000000,
+      0xffffffff, 0xffffffff80000000, 0x7fffffffffffffff, 0x8000000000000000 ],
+    dtype=np.uint64)
+
+DATA_STAGES = [ 'flip', 'fp', 'int', 'splice' ]
+
+""" Data seed engine
+The data sections of the inputs as rows of a uint64 array. Fresh rows are
+drawn in batches, mutants rewrite a few words of a seed at once (bit flips,
+interesting FP and integer values) or splice a range of another seed at the
+same offsets. Every seed is credited with the yield of the runs using it,
+the seed with the lowest yield per use gives its slot to a new one.
+"""
+class dataEngine():
+    def __init__(self, max_data):
+        self.max_data = max_data
+        self.rng = np.random.default_rng(random.getrandbits(64))
+
+        self.data = np.zeros((max_data, DATA_WORDS), dtype=np.uint64)
+        self.num = 0
+        self.gain = np.zeros(max_data)
+        self.uses = np.zeros(max_data)
+        self.last = np.zeros(max_data, dtype=np.int64)
+        self.tick = 0
+
+        self.fresh = np.zeros((0, DATA_WORDS), dtype=np.uint64)
+
+    def random_row(self):
+        if not len(self.fresh):
+            self.fresh = self.rng.integers(0, 1 << 64, (DATA_BATCH, DATA_WORDS),
+                                           dtype=np.uint64, endpoint=False)
+        (row, self.fresh) = (self.fresh[0], self.fresh[1:])
+        return row
+
+    def victim(self):
+        """ Lowest yield per use, then least recently used """
+        score = (self.gain + PRIOR_GAIN) / (self.uses + 1)
+        return int(np.lexsort((self.last, score))[0])
+
+    def add(self, row=None):
+        """ Store row (a fresh random one if None), returns its seed """
+        if row is None:
+            row = self.random_row()
+        row = np.asarray(row, dtype=np.uint64)
+        assert row.shape == (DATA_WORDS,), \
+            'Data of {} words, expected {}'.format(row.size, DATA_WORDS)
+
+        if self.num < self.max_data:
+            seed = self.num
+            self.num += 1
+        else:
+            seed = self.victim()
+
+        self.data[seed] = row
+        self.gain[seed] = 0
+        self.uses[seed] = 0
+        self.touch(seed)
+        return seed
+
+    def get(self, seed):
+        return self.data[seed].tolist()
+
+    def touch(self, seed):
+        self.tick += 1
+        self.last[seed] = self.tick
+
+    def credit(self, seed, gain):
+        """ A run with the data of seed found gain new blocks/transitions """
+        self.uses[seed] += 1
+        self.gain[seed] += gain
+
+    def donor(self, seed):
+        """ Another seed, weighted by its yield per use """
+        if self.num < 2:
+            return seed
+
+        weights = (self.gain[:self.num] + PRIOR_GAIN) / (self.uses[:self.num] + 1)
+        weights[seed] = 0
+        return int(self.rng.choice(self.num, p=weights / weights.sum()))
+
+    def mutate(self, seed, stage):
+        """ New seed from the data of seed, stage in DATA_STAGES """
+        row = self.data[seed].copy()
+
+        if stage == 'splice':
+            start = int(self.rng.integers(0, DATA_WORDS))
+            end = start + int(self.rng.integers(1, DATA_WORDS // 6 + 1))
+            row[start:end] = self.data[self.donor(seed)][start:end]
+        else:
+            num = random.randint(*MUT_WORDS)
+            pos = self.rng.integers(0, DATA_WORDS, num)
+            if stage == 'flip':
+                row[pos] ^= np.left_shift(np.uint64(1), self.rng.integers(0, 64, num, dtype=np.uint64))
+            elif stage == 'fp':
+                row[pos] = INTERESTING_FP[self.rng.integers(0, len(INTERESTING_FP), num)]
+            else:
+                row[pos] = INTERESTING_INT[self.rng.integers(0, len(INTERESTING_INT), num)]
+
+        return self.add(row)
+
+    def dump(self, name):
+        fd = open(name, 'w')
+        fd.write('{:<6}\t{:<10}\t{:<10}\n'.format('seed', 'uses', 'yield'))
+        for seed in np.argsort(-self.gain[:self.num], kind='stable').tolist():
+            fd.write('{:<6}\t{:<10.0f}\t{:<10.1f}\n'.format(seed, self.uses[seed], self.gain[seed]))
+        fd.close()
@@ -0,0 +1,142 @@
+import random
+import numpy as np
+
+""" Exploration fitness index
+explr_point of a corpus entry is the sum of 1 / hit count over the blocks of
+its visited_path, with the hit counts of the cul_path array of the mutator.
+The points are kept up to date incrementally: a hit count change only
+adjusts the entries visiting that block (block -> entries inverted index),
+and seeds are sampled by explr_point through a Fenwick tree over corpus
+slots instead of a fresh weights list per draw.
+"""
+class fitnessIndex():
+    def __init__(self, cul_path, capacity):
+        self.cul_path = cul_path
+        self.capacity = capacity
+
+        # block -> { entry: occurrences of block in entry.visited_path }
+        self.block_entries = {}
+
+        self.entries = [ None for i in range(capacity) ]
+        self.values = [ 0.0 for i in range(capacity) ]
+        self.tree = [ 0.0 for i in range(capacity + 1) ]
+        self.slots = {}
+        self.free = list(range(capacity - 1, -1, -1))
+
+        self.top_bit = 1
+        while self.top_bit * 2 <= capacity:
+            self.top_bit *= 2
+
+    def weight(self, count):
+        # A block without hits is as rare as it gets
+        return 1 / np.maximum(count, 1)
+
+    def tree_add(self, slot, delta):
+        i = slot + 1
+        while i <= self.capacity:
+            self.tree[i] += delta
+            i += i & (-i)
+
+    def set_value(self, slot, value):
+        self.tree_add(slot, value - self.values[slot])
+        self.values[slot] = value
+
+    def total(self):
+        total = 0.0
+        i = self.capacity
+        while i > 0:
+            total += self.tree[i]
+            i -= i & (-i)
+        return total
+
+    def rebuild(self):
+        """ Recompute every explr_point and the tree from the hit counts """
+        self.tree = [ 0.0 for i in range(self.capacity + 1) ]
+        for (slot, entry) in enumerate(self.entries):
+            value = 0.0
+            if entry is not None:
+                value = float(self.weight(self.cul_path[entry.visited_path]).sum())
+                entry.explr_point = value
+
+            self.values[slot] = value
+            i = slot + 1
+            self.tree[i] += value
+            parent = i + (i & (-i))
+            if parent <= self.capacity:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, entry):
+        assert self.free, 'Fitness index is full ({} entries)'.format(self.capacity)
+
+        slot = self.free.pop()
+        self.entries[slot] = entry
+        self.slots[entry] = slot
+
+        (blocks, occurrences) = np.unique(entry.visited_path, return_counts=True)
+        for (block, num) in zip(blocks.tolist(), occurrences.tolist()):
+            self.block_entries.setdefault(block, {})[entry] = num
+
+        value = float((occurrences * self.weight(self.cul_path[blocks])).sum())
+
+        entry.explr_point = value
+        self.set_value(slot, value)
+
+    def remove(self, entry):
+        slot = self.slots.pop(entry)
+        for block in set(entry.visited_path.tolist()):
+            entries = self.block_entries[block]
+            entries.pop(entry)
+            if not entries:
+                self.block_entries.pop(block)
+
+        self.entries[slot] = None
+        self.set_value(slot, 0.0)
+        self.free.append(slot)
+
+    def set_counts(self, blocks, counts):
+        """ Update the hit counts of blocks (unique) and the points of their entries """
+        delta = self.weight(counts) - self.weight(self.cul_path[blocks])
+        self.cul_path[blocks] = counts
+
+        changed = delta != 0
+        for (block, block_delta) in zip(blocks[changed].tolist(), delta[changed].tolist()):
+            if block not in self.block_entries:
+                continue
+
+            for (entry, num) in self.block_entries[block].items():
+                entry.explr_point += num * block_delta
+                slot = self.slots[entry]
+                self.set_value(slot, entry.explr_point)
+
+    def find(self, u):
+        pos = 0
+        bit = self.top_bit
+        while bit:
+            nxt = pos + bit
+            if nxt <= self.capacity and self.tree[nxt] <= u:
+                pos = nxt
+                u -= self.tree[nxt]
+            bit >>= 1
+        return pos
+
+    def sample(self, k=1):
+        """ k entries drawn with replacement, weighted by explr_point """
+        if not self.slots:
+            raise IndexError('Cannot choose from an empty corpus')
+
+        total = self.total()
+        if total <= 0:
+            return random.choices(list(self.slots), k=k)
+
+        seeds = []
+        while len(seeds) < k:
+            slot = self.find(random.random() * total)
+            if slot < self.capacity and self.entries[slot] is not None and self.values[slot] > 0:
+                seeds.append(self.entries[slot])
+            else:
+                # Rounding left by the incremental updates
+                self.rebuild()
+                total = self.total()
+                if total <= 0:
+                    return seeds + random.choices(list(self.slots), k=k-len(seeds))
+        return seeds
@@ -1,9 +1,13 @@
 import os
 import random
+import numpy as np
 
 from riscv_definitions import *
 from word import *
 
+# Uniform draws generated at once for the operands
+RAND_POOL = 4096
+
 """ rvInstGenerator
 Generates syntactically, semantically desirable unit of instructions
 
@@ -71,6 +75,16 @@ class rvInstGenerator():
             self.opcodes_map.update(rv_opcodes[isa])
 
         self.opcodes = list(self.opcodes_map.keys())
+        self.prefix_opcodes = list(rv_zicsr.keys())
+
+        # opcode -> word builder, first match of opcodes_words as before
+        self.word_builders = {}
+        for (key_opcodes, key_word) in opcodes_words.values():
+            for opcode in key_opcodes:
+                self.word_builders.setdefault(opcode, key_word)
+
+        self.rng = np.random.default_rng(random.getrandbits(64))
+        self.pool = iter([])
 
         self.prefix_num = 0
         self.main_num = 0
@@ -79,9 +93,7 @@ class rvInstGenerator():
         self.xNums = [ i for i in range(32) ]
         self.fNums = [ i for i in range(32) ]
 
-        self.used_xNums = set([])
-        self.used_fNums = set([])
-        self.used_imms = set([])
+        self.reset_used()
 
 
     def extend(self, isas):
@@ -98,30 +110,54 @@ class rvInstGenerator():
         self.main_num = 0
         self.suffix_num = 0
 
+        self.reset_used()
+
+    def reset_used(self):
+        # Sets for membership, lists to pick from
         self.used_xNums = set([])
         self.used_fNums = set([])
         self.used_imms = set([])
+        self.used_xList = []
+        self.used_fList = []
+        self.used_immList = []
+
+    def rand(self):
+        """ Uniform [0, 1) from a pool drawn RAND_POOL at a time """
+        u = next(self.pool, None)
+        if u is None:
+            self.pool = iter(self.rng.random(RAND_POOL).tolist())
+            u = next(self.pool)
+        return u
+
+    def randint(self, a, b):
+        """ Uniform integer of [a, b] """
+        return a + int(self.rand() * (b - a + 1))
+
+    def pick(self, items):
+        return items[int(self.rand() * len(items))]
 
     def _get_xregs(self, region=(0, 31), no_zero=False, thres=0.2):
-        if region == (0, 31) and len(self.used_xNums) > 0 and random.random() < thres:
-            xNum = random.choice(list(self.used_xNums))
+        if region == (0, 31) and self.used_xList and self.rand() < thres:
+            xNum = self.pick(self.used_xList)
         else:
-            xNum = random.choice(self.xNums[region[0]:region[1]])
-            used_xNums = list(self.used_xNums) + [ xNum ]
-            self.used_xNums = set(used_xNums)
+            xNum = self.randint(region[0], region[1] - 1)
+            if xNum not in self.used_xNums:
+                self.used_xNums.add(xNum)
+                self.used_xList.append(xNum)
 
         if no_zero and xNum == 0:
-            xNum = random.choice(list(self.xNums)[1:])
+            xNum = self.randint(1, 31)
 
         return 'x' + str(xNum)
 
     def _get_fregs(self, thres=0.2):
-        if len(self.used_fNums) > 0 and random.random() < thres:
-            fNum = random.choice(list(self.used_fNums))
+        if self.used_fList and self.rand() < thres:
+            fNum = self.pick(self.used_fList)
         else:
-            fNum = random.choice(self.fNums)
-            used_fNums = list(self.used_fNums) + [ fNum ]
-            self.used_fNums = set(used_fNums)
+            fNum = self.randint(0, 31)
+            if fNum not in self.used_fNums:
+                self.used_fNums.add(fNum)
+                self.used_fList.append(fNum)
         return 'f' + str(fNum)
 
     def _get_imm(self, iName, align, thres=0.2, zfthres=0.2, alignthres=1):
@@ -130,12 +166,12 @@ class rvInstGenerator():
             sign = ''
             width = int(iName[4:])
         else:
-            sign = random.choice(['', '-'])
+            sign = '' if self.rand() < 0.5 else '-'
             width = int(iName[3:]) - 1
 
         mask = (1 << width) - 1
 
-        rand = random.random()
+        rand = self.rand()
         if rand < alignthres:
             align_mask = ~(align - 1)
         else:
@@ -143,40 +179,37 @@ class rvInstGenerator():
 
         mask = mask & align_mask
 
-        rand = random.random()
-        if len(self.used_imms) > 0 and rand < thres:
-            imm = random.choice(list(self.used_imms))
+        rand = self.rand()
+        if self.used_immList and rand < thres:
+            imm = self.pick(self.used_immList)
             return sign + str(mask & imm)
         elif rand < thres + zfthres:
-            imm = random.choice([ 0x0, 0xffffffff ])
+            imm = self.pick([ 0x0, 0xffffffff ])
             return sign + str(mask & imm)
         else:
-            imm = random.randint(0, mask)
-            used_imms = list(self.used_imms) + [ imm ]
-            self.used_imms = set(used_imms)
+            imm = self.randint(0, mask)
+            if imm not in self.used_imms:
+                self.used_imms.add(imm)
+                self.used_immList.append(imm)
             return sign + str(mask & imm)
 
     def _get_symbol(self, tpe, my_label, max_label, part):
         if tpe == MEM_W:
-            n = random.randint(0, 5) # TODO, num_mem_sections = 6
-            k = random.randint(0, 27)
+            n = self.randint(0, 5) # TODO, num_mem_sections = 6
+            k = self.randint(0, 27)
             symbol = 'd_' + str(n) + '_' + str(k)
         elif tpe == MEM_R:
-            rand = random.random()
+            rand = self.rand()
             if rand < 0.2:
-                n = random.randint(0, max_label)
+                n = self.randint(0, max_label)
                 symbol = part + str(n)
             else:
-                n = random.randint(0, 5)
-                k = random.randint(0, 27)
+                n = self.randint(0, 5)
+                k = self.randint(0, 27)
                 symbol = 'd_' + str(n) + '_' + str(k)
         else:
-            if tpe in [ CF_J, CF_RET ]:
-                num = random.randint(my_label + 1, max_label)
-                symbol = part + str(num)
-            else:
-                num = random.randint(my_label + 1, max_label)
-                symbol = part + str(num)
+            num = self.randint(my_label + 1, max_label)
+            symbol = part + str(num)
 
         return symbol
 
@@ -184,38 +217,68 @@ class rvInstGenerator():
     Set of instructions which forms compilable, forward-guaranteeing sequence.
     """
     def get_word(self, part):
+        return self.get_words(part, 1)[0]
+
+    def get_words(self, part, num):
+        """ num words of part, the opcodes are drawn at once """
         if part == PREFIX:
-            opcode = random.choice(list(rv_zicsr.keys()))
+            opcodes = self.prefix_opcodes
             label_num = self.prefix_num
-            self.prefix_num += 1
+            self.prefix_num += num
         elif part == MAIN:
-            opcode = random.choice(self.opcodes)
+            opcodes = self.opcodes
             label_num = self.main_num
-            self.main_num += 1
+            self.main_num += num
         else: # SUFFIX
-            opcode = random.choice(self.opcodes)
+            opcodes = self.opcodes
             label_num = self.suffix_num
-            self.suffix_num += 1
-        #print("OPCODE: ",opcode)
-        (syntax, xregs, fregs, imms, symbols) = self.opcodes_map.get(opcode)
+            self.suffix_num += num
+
+        words = []
+        for idx in self.rng.integers(0, len(opcodes), num).tolist():
+            words.append(self.build_word(opcodes[idx], label_num))
+            label_num += 1
+
+        return words
+
+    def build_word(self, opcode, label_num):
+        (syntax, xregs, fregs, imms, symbols) = self.opcodes_map[opcode]
         xregs = list(xregs)
         fregs = list(fregs)
         imms = list(imms)
         symbols = list(symbols)
-        #print(xregs, fregs, imms, symbols)
-        tpe = NONE # 
-        insts = [ syntax ]
 
-        for (key, tup) in opcodes_words.items():
-            key_opcodes = tup[0]
-            key_word = tup[1]
-            if opcode in key_opcodes:
-                (tpe, insts) = key_word(opcode, syntax, xregs, fregs, imms, symbols)
-                break
-
-        word = Word(label_num, insts, tpe, xregs, fregs, imms, symbols)
+        tpe = NONE
+        insts = [ syntax ]
 
-        return word
+        key_word = self.word_builders.get(opcode)
+        if key_word:
+            (tpe, insts) = key_word(opcode, syntax, xregs, fregs, imms, symbols)
+
+        return Word(label_num, insts, tpe, xregs, fregs, imms, symbols)
+
+    def get_batch(self, num, num_prefix, num_words, num_suffix):
+        """ Populated (prefix, words, suffix) of num inputs, the opcodes of
+        all of them are drawn at once """
+        parts = [ (PREFIX, self.prefix_opcodes, num_prefix),
+                  (MAIN, self.opcodes, num_words),
+                  (SUFFIX, self.opcodes, num_suffix) ]
+        indices = [ self.rng.integers(0, len(opcodes), (num, size)).tolist()
+                    for (part, opcodes, size) in parts ]
+
+        batch = []
+        for n in range(num):
+            self.reset()
+            sim_words = []
+            for ((part, opcodes, size), idx) in zip(parts, indices):
+                words = [ self.build_word(opcodes[i], label)
+                          for (label, i) in enumerate(idx[n]) ]
+                for word in words:
+                    self.populate_word(word, size, part)
+                sim_words.append(words)
+            batch.append(tuple(sim_words))
+
+        return batch
 
     def populate_word(self, word: Word, max_label: int, part: str):
         if word.populated:
@@ -1,6 +1,9 @@
 import os
 import random
 import time
+import struct
+import pickle
+import numpy as np
 import sysv_ipc as ipc
 import cocotb
 
@@ -14,6 +17,38 @@ ERR_ISA_TIMEOUT = 3
 ERR_RTL_SIM     = 4
 ERR_SI_READ     = 5
 
+# Packed coverage map written by the instrumented RTL (firrtl/covDump.py),
+# a line of two hex digits per byte
+COVMAP_FILE     = 'covmap.hex'
+COVMAP_SIZE     = 1 << 20
+
+POPCOUNT = np.array([ bin(n).count('1') for n in range(256) ], dtype=np.int64)
+
+# Shared corpus index: sequence number of the next entry, then a ring of
+# (path digest, store offset, corpus id, pid, proc_num, record length,
+#  transitions, coverage) slots pointing into the per-worker corpus stores
+CORPUS_RING     = 4096
+CORPUS_SEQ      = struct.Struct('<Q')
+CORPUS_SLOT     = struct.Struct('<QQIIIIII')
+
+def read_covmap(path):
+    fd = open(path, 'r')
+    text = fd.read()
+    fd.close()
+    return np.frombuffer(bytes.fromhex(text), dtype=np.uint8)
+
+def write_covmap(path, cov_map):
+    text = cov_map.tobytes().hex()
+    fd = open(path, 'w')
+    fd.write(''.join([ text[i:i + 2] + '\n' for i in range(0, len(text), 2) ]))
+    fd.close()
+
+class corpusEntry():
+    def __init__(self, seq, slot):
+        self.seq = seq
+        (self.digest, self.offset, self.id, self.pid, self.proc_num,
+         self.length, self.trns, self.coverage) = slot
+
 class procState():
     def __init__(self):
         self.NORMAL = NORMAL
@@ -52,6 +87,9 @@ class procManager():
         self.mNum_sem = None
         self.cNum_sem = None
         self.covMap_sem = None
+        self.covMap_shm = None
+        self.corpus_shm = None
+        self.corpus_sem = None
         self.proc_states = None
         self.state_sem = None
 
@@ -65,21 +103,35 @@ class procManager():
                 self.covMap_sem = ipc.Semaphore(key+4, ipc.IPC_CREX, 0x01b4, 1)
                 self.proc_states = ipc.SharedMemory(key+5, ipc.IPC_CREX, 0x01b4, ipc.PAGE_SIZE)
                 self.state_sem = ipc.Semaphore(key+6, ipc.IPC_CREX, 0x01b4, 1)
+                self.covMap_shm = ipc.SharedMemory(key+7, ipc.IPC_CREX, 0x01b4, COVMAP_SIZE)
+                self.corpus_shm = ipc.SharedMemory(key+8, ipc.IPC_CREX, 0x01b4,
+                                                   CORPUS_SEQ.size + CORPUS_RING * CORPUS_SLOT.size)
+                self.corpus_sem = ipc.Semaphore(key+9, ipc.IPC_CREX, 0x01b4, 1)
             except ipc.ExistentialError:
                 self.delete_ipc(self.cNum_shm)
                 self.delete_ipc(self.mNum_shm)
                 self.delete_ipc(self.cNum_sem)
                 self.delete_ipc(self.mNum_sem)
                 self.delete_ipc(self.covMap_sem)
+                self.delete_ipc(self.covMap_shm)
+                self.delete_ipc(self.corpus_shm)
+                self.delete_ipc(self.corpus_sem)
             else:
                 break
 
         self.write_num('mNum', self.mNum)
         self.write_num('cNum', self.cNum)
+        self.corpus_shm.write(CORPUS_SEQ.pack(0))
+        self.corpus_fd = None
 
         for i in range(self.num_cores):
             self.set_state(i, 0)
 
+        # Coverage of the previous runs
+        covmap = self.out + '/covmap/' + COVMAP_FILE
+        if os.path.isfile(covmap):
+            self.covMap_shm.write(read_covmap(covmap)[:COVMAP_SIZE].tobytes())
+
     def set_state(self, proc_num, state):
         self.state_sem.P()
         states = self.proc_states.read(self.num_cores)
@@ -111,6 +163,9 @@ class procManager():
         self.mNum_sem.remove()
         self.cNum_sem.remove()
         self.covMap_sem.remove()
+        self.covMap_shm.remove()
+        self.corpus_shm.remove()
+        self.corpus_sem.remove()
         self.proc_states.remove()
 
 
@@ -146,36 +201,55 @@ class procManager():
         sem = getattr(self, name + '_sem')
         sem.V()
 
+    def or_covmap(self, proc_num):
+        """ OR the coverage map last stored by proc_num into the global map,
+        must hold covMap_sem. Returns the global map """
+        cov_file = self.out + '/covmap-{:02}/{}'.format(proc_num, COVMAP_FILE)
+        if not os.path.isfile(cov_file):
+            return np.zeros(0, dtype=np.uint8)
+
+        cov_map = read_covmap(cov_file)
+        assert len(cov_map) <= COVMAP_SIZE, \
+            'Coverage map ({} bytes) does not fit COVMAP_SIZE'.format(len(cov_map))
+
+        global_map = np.frombuffer(self.covMap_shm.read(len(cov_map)), dtype=np.uint8)
+        global_map = np.bitwise_or(global_map, cov_map)
+        self.covMap_shm.write(global_map.tobytes())
+        return global_map
+
+    def check_covmap(self, proc_num):
+        """ The map proc_num stored right after restoring must be the global
+        map, must hold covMap_sem """
+        covmap = self.out + '/covmap/' + COVMAP_FILE
+        cov_file = self.out + '/covmap-{:02}/{}'.format(proc_num, COVMAP_FILE)
+        if not os.path.isfile(covmap):
+            return
+
+        global_map = read_covmap(covmap)
+        cov_map = read_covmap(cov_file)
+        assert np.array_equal(global_map[:len(cov_map)], cov_map) and \
+            not global_map[len(cov_map):].any(), \
+            'Coverage map of proc {} does not survive the store/restore'.format(proc_num)
+
+    def merge_covmap(self, proc_num):
+        """ Global coverage after merging the map of this iteration """
+        self.covMap_sem.P()
+        global_map = self.or_covmap(proc_num)
+        self.covMap_sem.V()
+
+        return int(POPCOUNT[global_map].sum())
+
     def store_covmap(self, proc_num, start_time, start_iter, num_iter):
         self.covMap_sem.P()
-        cov_sum = 0
-        cov_files = []
-        covmaps = os.listdir(self.out + '/covmap-{:02}'.format(proc_num))
-
-        for cov_file in covmaps:
-            cov_map = [ 0 for i in
-                        range(os.path.getsize(self.out + '/covmap-{:02}/{}'.
-                                              format(proc_num, cov_file)))]
-            if os.path.isfile(self.out + '/covmap/{}'.format(cov_file)):
-                fd = open(self.out + '/covmap/{}'.format(cov_file), 'r')
-                line = fd.readline()
-                fd.close()
-
-                for n in range(len(cov_map)):
-                    cov_map[n] = int(line[n])
-
-            fd = open(self.out + '/covmap-{:02}/{}'.format(proc_num, cov_file), 'r')
-            line = fd.readline()
-            fd.close()
-
-            for n in range(len(cov_map)):
-                cov_map[n] = cov_map[n] | int(line[n])
-                cov_sum = cov_sum + cov_map[n]
-
-            cov_string = ''.join(str(e) for e in cov_map)
-            fd = open(self.out + '/covmap/{}'.format(cov_file), 'w')
-            fd.write(cov_string)
-            fd.close()
+        global_map = self.or_covmap(proc_num)
+        cov_sum = int(POPCOUNT[global_map].sum())
+
+        # Restored by the next batch, replaced at once as a worker may be
+        # restoring it
+        if len(global_map):
+            covmap = self.out + '/covmap/' + COVMAP_FILE
+            write_covmap(covmap + '.tmp', global_map)
+            os.replace(covmap + '.tmp', covmap)
 
         elapsed_time = time.time() - start_time
         fd = open(self.cov_log, 'a')
@@ -184,6 +258,57 @@ class procManager():
         fd.close()
         self.covMap_sem.V()
 
+    def corpus_store(self, proc_num):
+        return self.out + '/.corpus_{:02}.bin'.format(proc_num)
+
+    def publish_corpus(self, proc_num, cNum, sim_input, data, trns, coverage):
+        """ Append a corpus entry to the binary store of this worker and
+        announce it in the shared corpus index """
+        record = pickle.dumps((sim_input, data), pickle.HIGHEST_PROTOCOL)
+
+        # Only this worker appends to its store
+        if self.corpus_fd is None:
+            self.corpus_fd = open(self.corpus_store(proc_num), 'ab')
+        offset = self.corpus_fd.tell()
+        self.corpus_fd.write(record)
+        self.corpus_fd.flush()
+
+        slot = CORPUS_SLOT.pack(sim_input.get_digest(), offset, cNum, os.getpid(),
+                                proc_num, len(record), trns, coverage)
+
+        self.corpus_sem.P()
+        (seq,) = CORPUS_SEQ.unpack(self.corpus_shm.read(CORPUS_SEQ.size))
+        self.corpus_shm.write(slot, CORPUS_SEQ.size + (seq % CORPUS_RING) * CORPUS_SLOT.size)
+        self.corpus_shm.write(CORPUS_SEQ.pack(seq + 1))
+        self.corpus_sem.V()
+
+    def pull_corpus(self, seq):
+        """ Index entries of the other workers from sequence number seq,
+        the ones already overwritten in the ring are skipped.
+        Returns (next sequence number, entries) """
+        self.corpus_sem.P()
+        (head,) = CORPUS_SEQ.unpack(self.corpus_shm.read(CORPUS_SEQ.size))
+        start = max(seq, head - CORPUS_RING)
+
+        slots = []
+        for n in range(start, head):
+            offset = CORPUS_SEQ.size + (n % CORPUS_RING) * CORPUS_SLOT.size
+            slots.append((n, CORPUS_SLOT.unpack(self.corpus_shm.read(CORPUS_SLOT.size, offset))))
+        self.corpus_sem.V()
+
+        pid = os.getpid()
+        entries = [ corpusEntry(n, slot) for (n, slot) in slots ]
+        return (head, [ entry for entry in entries if entry.pid != pid ])
+
+    def load_corpus(self, entry: corpusEntry):
+        """ (sim_input, data) of an index entry """
+        fd = open(self.corpus_store(entry.proc_num), 'rb')
+        fd.seek(entry.offset)
+        record = fd.read(entry.length)
+        fd.close()
+
+        return pickle.loads(record)
+
     @coroutine
     def clock_gen(self, clock, period=2):
         while True:
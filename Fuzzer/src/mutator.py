@@ -1,15 +1,39 @@
 import os
 import random
-from copy import deepcopy
-import pickle
+import hashlib
+import numpy as np
+from collections import deque
 
 from inst_generator import Word, rvInstGenerator, PREFIX, MAIN, SUFFIX
+from word import CF_J, CF_BR, CF_RET
+from fitness_index import fitnessIndex
+from cfg_index import cfgIndex
+from cfg_file import load_cfg
+from corpus_cull import favored_entries, CULL_INTERVAL
+from scheduler import opScheduler
+from data_engine import dataEngine
 
 """ Mutation phases """
 GENERATION = 0
 MUTATION   = 1
 MERGE      = 2
 
+PHASE_NAMES = [ 'generation', 'mutation', 'merge' ]
+
+# GENERATION inputs generated at once (rvInstGenerator.get_batch)
+GEN_BATCH = 16
+
+""" Scheduled operators and their base probabilities
+ phase: mutation phase (update_phase)
+ word:  operator applied to each seed word (mutate_words)
+ merge: crossover at a random word or splice after a control flow word
+ data:  reuse the data seed of the seed or mutate it (dataEngine stages)
+"""
+SCHED_OPS = { 'phase': { 'generation': 0.1, 'mutation': 0.45, 'merge': 0.45 },
+              'word':  { 'keep': 0.45, 'insert': 0.2, 'drop': 0.2, 'replace': 0.15 },
+              'merge': { 'crossover': 0.5, 'splice': 0.5 },
+              'data':  { 'reuse': 0.6, 'flip': 0.1, 'fp': 0.1, 'int': 0.1, 'splice': 0.1 } }
+
 """ Template versions """
 P_M = 0
 P_S = 1
@@ -23,6 +47,11 @@ templates = [ 'p-m', 'p-s', 'p-u',
               'v-u']
 
 class simInput():
+    __slots__ = ('prefix', 'words', 'suffix', 'ints', 'num_prefix', 'num_words',
+                 'num_suffix', 'data_seed', 'template', 'it', 'name_suffix',
+                 'visited_bits', 'explr_point', 'uncov_alt_br', 'dep_point',
+                 'assign_dist', 'exec_time', 'ops')
+
     def __init__(self, prefix: list, words: list, suffix: list, ints: list, data_seed: int, template: int):
         self.prefix = prefix
         self.words = words
@@ -38,11 +67,16 @@ class simInput():
         self.it = 0
         self.name_suffix = '' 
         
-        self.visited_path = []
+        # Visited blocks as a bitset over the block ids
+        self.visited_bits = np.zeros(0, dtype=np.uint8)
         self.explr_point = float(0)
         self.uncov_alt_br = float(0)
         self.dep_point = float(0)
         self.assign_dist = 0
+        # RTL simulation time (s), 0 if it did not run here
+        self.exec_time = float(0)
+        # { (group, op): uses } of the scheduled operators that built it
+        self.ops = {}
         
 
     def save(self, name, data=[]):
@@ -98,20 +132,47 @@ class simInput():
 
         insts.append(SUFFIX + '{}:'.format(self.num_suffix))
         return insts
+
+    def get_entries(self, part, assembler):
+        """ Encoded (label, encoding) entries of a region for the in-process build """
+        words = { PREFIX: self.prefix, MAIN: self.words, SUFFIX: self.suffix }[part]
+
+        entries = [ word.get_entry(assembler) for word in words ]
+        entries.append((part + str(len(words)), []))
+        return entries
     
-    def set_visit_path(self, visit_path, CFG):
-        new_visit_path = []
-        for item in visit_path:
-            if item in CFG['count_to_assign']:
-                count_value = CFG['count_to_assign'].get(item)
-                self.visited_path.append(CFG['assign_to_block'][count_value])
-                new_visit_path.append(item)
+    def get_cost(self):
+        """ Length times RTL simulation time, favored entries are cheap """
+        return max(len(self.ints), 1) * max(self.exec_time, 1e-3)
+
+    def freeze(self):
+        """ Corpus entries hand their words to the mutated inputs by
+        reference, the word lists become tuples """
+        self.prefix = tuple(self.prefix)
+        self.words = tuple(self.words)
+        self.suffix = tuple(self.suffix)
+
+    @property
+    def visited_path(self):
+        """ Visited block ids in increasing order """
+        # Paths are sparse, only the non-zero bytes are unpacked
+        nonzero = np.flatnonzero(self.visited_bits)
+        bits = np.unpackbits(self.visited_bits[nonzero, None], axis=1, bitorder='little')
+        (rows, cols) = np.nonzero(bits)
+        return nonzero[rows] * 8 + cols
+
+    def get_digest(self):
+        """ 64 bit digest of the visited blocks """
+        blocks = str(self.visited_path.tolist()).encode()
+        return int.from_bytes(hashlib.blake2b(blocks, digest_size=8).digest(), 'little')
 
-        # 清空原始的 visit_path 列表
-        visit_path.clear()
+    def set_visit_path(self, visit_path, CFG):
+        """ visit_path: (i, j) rows of the set coverage bits (rvRTLhost.get_path) """
+        blocks = CFG.path_blocks(visit_path)
 
-        # 将新的路径添加到 visit_path 列表中
-        visit_path.extend(new_visit_path)
+        visited = np.zeros(CFG.num_blocks, dtype=bool)
+        visited[blocks[blocks >= 0]] = True
+        self.visited_bits = np.packbits(visited, bitorder='little')
 
 
 
@@ -119,9 +180,18 @@ class rvMutator():
     def __init__(self, max_data_seeds=100, corpus_size=2000, no_guide=False, top_module=None):
         self.corpus_size = corpus_size
         self.corpus = []
+        # Entries left out of the favored set by the last culling, most
+        # expensive first, they are evicted before the others
+        self.redundant = []
+        self.num_added = 0
+        # Visited path digests of the corpus, shared entries already covered are skipped
+        self.digests = set()
 
         self.phases = [GENERATION, MUTATION, MERGE]
         self.phase = GENERATION
+        # Warm-up phases are not picked by the scheduler, nor credited to it
+        self.phase_forced = True
+        self.scheduler = opScheduler(SCHED_OPS)
 
         
         self.num_prefix = 3
@@ -134,41 +204,36 @@ class rvMutator():
 
         
         self.max_data = max_data_seeds
-        self.random_data = {}
-        self.data_seeds = []
+        self.data_engine = dataEngine(max_data_seeds)
 
         self.inst_generator = rvInstGenerator('RV64G')
+        # Populated words of the next GENERATION inputs
+        self.gen_batch = deque()
         
-        self.cul_path = {}
+        # Hit counts of the blocks, only the tracked ones (with a coverage
+        # bit) count towards the coverage
+        self.cul_path = None
+        self.tracked = None
         self.CFG = self.get_cfg_cul_path(top_module=top_module)
-        # assign_dist should be a dictionary, key is the unvisited block id, we only collect distance within 5
-        self.assign_dist = {}
+        # explr_point of the corpus, kept up to date with cul_path
+        self.fitness = fitnessIndex(self.cul_path, corpus_size + 1)
+        # Distances to the unvisited blocks for dep_point and assign_dist
+        self.cfg_index = self.get_cfg_index()
         
         
 
 
     def add_data(self, new_data=[]):
-        if len(self.data_seeds) == self.max_data:
-            seed = self.data_seeds.pop(0)
-        else:
-            seed = len(self.data_seeds)
+        return self.data_engine.add(new_data if len(new_data) else None)
 
-        if new_data:
-            self.random_data[seed] = new_data
-        else:
-            self.random_data[seed] = [ random.randint(0, 0xffffffffffffffff) for i in range(64 * 6)] # TODO, Num_data_sections = 6
-        self.data_seeds.append(seed)
+    def get_data(self, seed):
+        return self.data_engine.get(seed)
 
-        return seed
+    def mutate_data(self, seed, stage):
+        return self.data_engine.mutate(seed, stage)
 
     def update_data_seeds(self, seed):
-        assert self.data_seeds.count(seed) == 1, \
-            '{} entrie(s) of {} exist in Mutator data_seeds'. \
-            format(self.data_seeds.count(seed), seed)
-
-        idx = self.data_seeds.index(seed)
-        self.data_seeds.pop(idx)
-        self.data_seeds.append(seed)
+        self.data_engine.touch(seed)
 
     def read_label(self, line, tuples):
         label = line[:8].split(':')[0]
@@ -260,7 +325,7 @@ class rvMutator():
 
         data_seed = self.add_data(data)
         sim_input = simInput(prefix, words, suffix, ints, data_seed, template)
-        data = self.random_data[data_seed]
+        data = self.get_data(data_seed)
 
         assert_intr = False
         if [ i for i in ints if i != 0 ]:
@@ -309,7 +374,7 @@ class rvMutator():
         else:
             min_input = simInput(prefix, words, new_target, ints, data_seed, template)
 
-        data = self.random_data[data_seed]
+        data = self.get_data(data_seed)
         return (min_input, data)
 
     def delete_nop(self, sim_input):
@@ -327,8 +392,7 @@ class rvMutator():
             tmps = []
             for word in target:
                 if word.insts != ['nop']:
-                    new_word = deepcopy(word)
-                    tmps.append(new_word)
+                    tmps.append(word.copy())
 
                 if part == MAIN:
                     if word.insts != ['nop']:
@@ -339,7 +403,7 @@ class rvMutator():
             words_map[part] = new_target
 
         del_input = simInput(words_map[PREFIX], words_map[MAIN], words_map[SUFFIX], new_ints, data_seed, template)
-        data = self.random_data[data_seed]
+        data = self.get_data(data_seed)
 
         return (del_input, data)
 
@@ -356,6 +420,20 @@ class rvMutator():
             except:
                 continue
 
+    def add_shared_corpus(self, sim_input, data):
+        """ Add a corpus entry of another worker, returns False if an entry
+        with the same visited blocks is already in the corpus """
+        if sim_input.get_digest() in self.digests:
+            return False
+
+        sim_input.data_seed = self.add_data(data)
+        # Blocks visited by the other worker, so they weigh in the exploration points
+        blocks = sim_input.visited_path
+        self.cfg_index.cover(self.set_counts(blocks, self.cul_path[blocks] + 1))
+
+        self.add_corpus(sim_input)
+        return True
+
     def reset_labels(self, words, part):
         n = 0
 
@@ -372,17 +450,21 @@ class rvMutator():
 
         return words
 
-    def mutate_words(self, seed_words, part, max_num):
+    def mutate_words(self, seed_words, part, max_num, ops):
         words = []
 
-        for word in seed_words:
-            rand = random.random()
-            if rand < 0.5:
-                words.append(word)
-            elif rand < 0.75:
-                words.append(word)
+        # The seed words belong to corpus entries, only the kept ones are
+        # copied before reset_labels rewrites them
+        for (word, op) in zip(seed_words, self.scheduler.picks('word', len(seed_words))):
+            ops[('word', op)] = ops.get(('word', op), 0) + 1
+            if op == 'keep':
+                words.append(word.copy())
+            elif op == 'insert':
+                words.append(word.copy())
                 new_word = self.inst_generator.get_word(part)
                 words.append(new_word)
+            elif op == 'replace':
+                words.append(self.inst_generator.get_word(part))
 
         words = words[0:max_num]
         words = self.reset_labels(words, part)
@@ -399,16 +481,15 @@ class rvMutator():
 
         data_seed = -1
         template = -1
+        ops = {}
+        if not self.phase_forced:
+            ops[('phase', PHASE_NAMES[self.phase])] = 1
+
         if self.phase == GENERATION:
-            for n in range(self.num_prefix):
-                word = self.inst_generator.get_word(PREFIX)
-                prefix.append(word)
-            for n in range(self.num_words):
-                word = self.inst_generator.get_word(MAIN)
-                words.append(word)
-            for n in range(self.num_suffix):
-                word = self.inst_generator.get_word(SUFFIX)
-                suffix.append(word)
+            if not self.gen_batch:
+                self.gen_batch = deque(self.inst_generator.get_batch(
+                    GEN_BATCH, self.num_prefix, self.num_words, self.num_suffix))
+            (prefix, words, suffix) = self.gen_batch.popleft()
             name_suffix = '_gen'
         elif self.phase in [ MUTATION, MERGE ]:
             if self.phase == MUTATION:
@@ -417,8 +498,7 @@ class rvMutator():
                 # print("assign_dist",self.corpus[0].assign_dist)
                 
                 rand = random.random()
-                fitness_explr = [indiv.explr_point for indiv in self.corpus]
-                [seed_si1] = random.choices(self.corpus, fitness_explr)
+                [seed_si1] = self.fitness.sample()
                 if rand < 0.2:
                     self.calculate_depdency()
                     fitness_uncov = [indiv.dep_point for indiv in self.corpus]
@@ -429,9 +509,9 @@ class rvMutator():
                 seed_si = random.choice([seed_si1])
                 
                 # [seed_si] = random.choices(self.corpus)
-                seed_prefix = deepcopy(seed_si.prefix)
-                seed_words = deepcopy(seed_si.words)
-                seed_suffix = deepcopy(seed_si.suffix)
+                seed_prefix = seed_si.prefix
+                seed_words = seed_si.words
+                seed_suffix = seed_si.suffix
                 data_seed = seed_si.get_seed()
                 template = seed_si.get_template()
                 name_suffix = '_mut_'+str(seed_si.it)
@@ -442,9 +522,8 @@ class rvMutator():
                 # print("uncov_alt",self.corpus[0].uncov_alt_br)
                 # print("assign_dist",self.corpus[0].assign_dist)
                 rand = random.random()
-                fitness_explr = [indiv.explr_point for indiv in self.corpus]
                 
-                [seed_si11, seed_si12] = random.choices(self.corpus, fitness_explr, k=2)
+                [seed_si11, seed_si12] = self.fitness.sample(2)
                 if rand < 0.2:
                     self.calculate_depdency()
                     fitness_uncov = [indiv.dep_point for indiv in self.corpus]
@@ -455,12 +534,19 @@ class rvMutator():
                 # [seed_si1, seed_si2] = random.choices([seed_si11, seed_si12], k=2)
                 # [seed_si1, seed_si2] = random.choices(self.corpus, k=2)
 
-                seed_prefix = deepcopy(seed_si1.prefix)
-                si1_words = deepcopy(seed_si1.words)
-                si2_words = deepcopy(seed_si2.words)
-                seed_suffix = deepcopy(seed_si1.suffix)
+                seed_prefix = seed_si1.prefix
+                si1_words = seed_si1.words
+                si2_words = seed_si2.words
+                seed_suffix = seed_si1.suffix
                 idx = random.randint(0, min(len(si1_words),
                                             len(si2_words)))
+                merge_op = self.scheduler.pick('merge')
+                ops[('merge', merge_op)] = 1
+                if merge_op == 'splice':
+                    # Right after a jump/branch/return of the first seed
+                    points = [ i + 1 for (i, word) in enumerate(si1_words[:len(si2_words)])
+                               if word.tpe in [ CF_J, CF_BR, CF_RET ] ]
+                    if points: idx = random.choice(points)
 
                 for i in range(idx):
                     seed_words.append(si1_words[i])
@@ -472,9 +558,14 @@ class rvMutator():
 
                 name_suffix = '_mer_' + str(seed_si1.it) + '_' + str(seed_si2.it)
 
-            prefix = self.mutate_words(seed_prefix, PREFIX, self.num_prefix)
-            words = self.mutate_words(seed_words, MAIN, self.max_nWords)
-            suffix = self.mutate_words(seed_suffix, SUFFIX, self.num_suffix)
+            data_op = self.scheduler.pick('data')
+            ops[('data', data_op)] = 1
+            if data_op != 'reuse':
+                data_seed = self.mutate_data(data_seed, data_op)
+
+            prefix = self.mutate_words(seed_prefix, PREFIX, self.num_prefix, ops)
+            words = self.mutate_words(seed_words, MAIN, self.max_nWords, ops)
+            suffix = self.mutate_words(seed_suffix, SUFFIX, self.num_suffix, ops)
 
         for word in prefix:
             self.inst_generator.populate_word(word, len(prefix), PREFIX)
@@ -504,156 +595,165 @@ class rvMutator():
         sim_input = simInput(prefix, words, suffix, ints, data_seed, template)
         sim_input.it = it
         sim_input.name_suffix = name_suffix
-        data = self.random_data[data_seed]
+        sim_input.ops = ops
+        data = self.get_data(data_seed)
 
         return (sim_input, data)
 
+    def report(self, sim_input, gain, seconds):
+        """ Credit gain (new blocks + transitions) and the wall time of a
+        run to the operators of sim_input """
+        self.scheduler.report(sim_input.ops, gain, seconds)
+        self.data_engine.credit(sim_input.data_seed, gain)
+
+    def dump_stats(self, out, proc_num):
+        """ Operator statistics of the scheduler and yield of the data seeds """
+        self.scheduler.dump(out + '/scheduler_{:02}.txt'.format(proc_num))
+        self.data_engine.dump(out + '/data_seeds_{:02}.txt'.format(proc_num))
+
     def calculate_exploration(self):
-        for item in self.corpus:
-            item.explr_point = 0
-            for i in range(0,len(item.visited_path)):
-                item.explr_point += 1 / self.cul_path[item.visited_path[i]]
+        # explr_point is maintained incrementally, this recomputes it from scratch
+        self.fitness.rebuild()
     
     def calculate_depdency(self):
         for item in self.corpus:
-            item.dep_point = 0
-        for item in self.corpus:
-            for i in range(0,len(item.visited_path)):
-                queue = [(item.visited_path[i],0)]
-                break_flag = False
-                while not break_flag:
-                    if queue == []:
-                        break
-                    cur = queue.pop(0)
-                    if cur[0] in self.CFG:
-                        cur_block = self.CFG[cur[0]]
-                        for succ in cur_block['successors']:
-                            if succ in self.cul_path and self.cul_path[succ] == 0:
-                                item.dep_point += 1 / (cur[1]+1)
-                                break_flag = True
-                                break
-                            if cur[1]+1<=3:
-                                queue.append((succ,cur[1]+1))
-                        
+            item.dep_point = self.cfg_index.dep_point(item.visited_path)
     
     def calculate_uncov_alt(self):
         for item in self.corpus:
             item.uncov_alt_br = 0
         for item in self.corpus:
             visited_alt = {}
-            for i in range(0,len(item.visited_path)):
-                if item.visited_path[i] in self.CFG:
-                    cur_block = self.CFG[item.visited_path[i]]
-                    visited_alt[item.visited_path[i]] = True
-                    # depth 1
-                    if cur_block['orig_idom']!=[]:
-                        cur_orig_idom = cur_block['orig_idom'][0]
-                        for _item in self.CFG[cur_orig_idom]['successors']:
-                            if _item not in visited_alt and _item in self.cul_path and self.cul_path[_item] == 0:
+            for block in item.visited_path.tolist():
+                if block in self.CFG:
+                    cur_idom = self.CFG.orig_idom(block)
+                    visited_alt[block] = True
+                    # depth 1, 2, 3
+                    for weight in [1, 0.5, 1.0/3.0]:
+                        if not len(cur_idom): break
+                        cur_orig_idom = int(cur_idom[0])
+                        for _item in self.CFG.successors(cur_orig_idom).tolist():
+                            if _item not in visited_alt and self.tracked[_item] and self.cul_path[_item] == 0:
                                 visited_alt[_item] = True
-                                item.uncov_alt_br += 1
+                                item.uncov_alt_br += weight
                                 break
-                        # depth 2
-                        if self.CFG[cur_orig_idom]['orig_idom']!=[]:
-                            cur_orig_idom2 = self.CFG[cur_orig_idom]['orig_idom'][0]
-                            for __item in self.CFG[cur_orig_idom2]['successors']:
-                                if __item not in visited_alt and __item in self.cul_path and self.cul_path[__item] == 0:
-                                    visited_alt[__item] = True
-                                    item.uncov_alt_br += 0.5
-                                    break
-                            # depth 3
-                            if self.CFG[cur_orig_idom2]['orig_idom']!=[]:
-                                cur_orig_idom3 = self.CFG[cur_orig_idom2]['orig_idom'][0]
-                                for ___item in self.CFG[cur_orig_idom3]['successors']:
-                                    if ___item not in visited_alt and ___item in self.cul_path and self.cul_path[___item] == 0:
-                                        visited_alt[___item] = True
-                                        item.uncov_alt_br += 1.0/3.0
-                                        break
+                        cur_idom = self.CFG.orig_idom(cur_orig_idom)
         # a = 1
     
     def calculate_unvisited_assign_dist(self):
-        self.CFG['assign_block'] = set(self.CFG['assign_block'])
-        for key in self.cul_path:
-            if self.cul_path[key] == 0:
-                stack = [key]
-                dict_depth = {key: 0}
-                keys_to_remove = []
-                # calculate the distance within 4
-                while stack:
-                    cur = stack.pop()
-                    if cur in dict_depth and dict_depth[cur] <= 3:
-                        for pred in self.CFG[cur]['predecessors']:
-                            if pred not in dict_depth:
-                                if pred not in self.CFG['assign_block']:
-                                    dict_depth[pred] = dict_depth[cur] + 1
-                                else:
-                                    dict_depth[pred] = dict_depth[cur]
-                                    keys_to_remove.append(pred)
-                                stack.append(pred)
-                dict_depth.pop(key)
-                for item in keys_to_remove:
-                    dict_depth.pop(item)
-                self.assign_dist[key] = dict_depth
-                
         for sim_input in self.corpus:
-            _min = 9999
-            for node in sim_input.visited_path:
-                for key in self.assign_dist:
-                    if node in self.assign_dist[key]:
-                        _min = min(_min,self.assign_dist[key][node])
-            sim_input.assign_dist = _min
-                
-    
+            sim_input.assign_dist = self.cfg_index.assign_point(sim_input.visited_path)
 
     def update_phase(self, it):
         global visit_assign_dist
-        if it < self.corpus_size / 10 or self.no_guide:
+        self.phase_forced = it < self.corpus_size / 10 or self.no_guide or not self.corpus
+        if self.phase_forced:
             self.phase = GENERATION
         else:
-            rand = random.random()
-            if rand < 0.1:
-                self.phase = GENERATION
-            elif rand < 0.55:
-                self.calculate_exploration()
-                self.phase = MUTATION
-            else:
-                self.calculate_exploration()
-                self.phase = MERGE
+            self.phase = PHASE_NAMES.index(self.scheduler.pick('phase'))
 
     def add_corpus(self, sim_input):
+        sim_input.freeze()
         self.corpus.append(sim_input)
+        self.digests.add(sim_input.get_digest())
+        self.fitness.add(sim_input)
 
         self.num_words = min(self.num_words + 1, self.max_nWords)
+        self.num_added += 1
+        if self.num_added >= CULL_INTERVAL:
+            self.cull_corpus()
         if len(self.corpus) > self.corpus_size:
-            self.corpus.pop(0)      
+            self.fitness.remove(self.evict())
+
+    def cull_corpus(self):
+        """ Recompute the favored set of the corpus """
+        self.num_added = 0
+        paths = [ entry.visited_path for entry in self.corpus ]
+        costs = [ entry.get_cost() for entry in self.corpus ]
+        favored = favored_entries(paths, costs)
+
+        redundant = [ n for n in range(len(self.corpus)) if not favored[n] ]
+        redundant.sort(key=lambda n: costs[n], reverse=True)
+        self.redundant = [ self.corpus[n] for n in redundant ]
+
+    def evict(self):
+        """ Remove the most expensive redundant entry, the entries added
+        since the last culling are not candidates until the next one.
+        Without redundant entries the oldest one goes """
+        if not self.redundant:
+            self.cull_corpus()
+
+        # The favored set covers the blocks of the redundant entries
+        if self.redundant:
+            entry = self.redundant.pop(0)
+            self.corpus.remove(entry)
+        else:
+            entry = self.corpus.pop(0)
+        return entry
 
     def get_cfg_cul_path(self, top_module):
         if top_module == None:
             raise ValueError('top_module is None')
-        file_pkl = f'../CFG/{top_module}_cfg.pkl'
-        with open(file_pkl, 'rb') as file:
-            data = pickle.load(file)
+        # Converted from ../CFG/{top_module}_cfg.pkl on first use, mapped
+        # read-only and shared with the other workers
+        cfg = load_cfg(top_module)
+
+        blocks = cfg.count_blocks()
+        self.cul_path = np.zeros(cfg.num_blocks, dtype=np.int64)
+        self.tracked = np.zeros(cfg.num_blocks, dtype=bool)
+        self.tracked[blocks] = True
+        self.num_tracked = len(blocks)
+        self.num_covered = 0
+
+        # Tracked blocks in coverage bit order, the first hit child sets
+        # the count of an uncovered idom
+        self.track_order = np.full(cfg.num_blocks, len(blocks), dtype=np.int64)
+        self.track_order[blocks] = np.arange(len(blocks))
+        self.idom_parent = cfg.idom_parents()
+        # Blocks hit since the last idom propagation
+        self.new_hits = []
         
-        for key,value in data['count_to_assign'].items():
-            block = data['assign_to_block'][value]
-            self.cul_path[block] = 0
-        
-        return data
+        return cfg
         
+    def get_cfg_index(self):
+        unvisited = self.tracked & (self.cul_path == 0)
+        return cfgIndex(*self.CFG.index_arrays(), unvisited)
+
+    def set_counts(self, blocks, counts):
+        """ Set the hit counts of blocks (unique), returns the blocks hit for
+        the first time """
+        covered = blocks[(self.cul_path[blocks] == 0) & (counts > 0)]
+        self.fitness.set_counts(blocks, counts)
+
+        self.num_covered += int(self.tracked[covered].sum())
+        self.new_hits.append(covered)
+        return covered
+
+    def propagate_idom(self):
+        """ Tracked blocks with a hit cover their uncovered tracked idom.
+        Only new hits can have an uncovered idom, the others were
+        propagated before. Returns the covered idoms """
+        covered = [ np.zeros(0, dtype=np.int64) ]
+        sources = np.concatenate(self.new_hits + covered)
+        while len(sources):
+            sources = sources[self.tracked[sources] & (self.idom_parent[sources] >= 0)]
+            parents = self.idom_parent[sources]
+            keep = self.tracked[parents] & (self.cul_path[parents] == 0)
+            (sources, parents) = (sources[keep], parents[keep])
+
+            order = np.argsort(self.track_order[sources], kind='stable')
+            (parents, first) = np.unique(parents[order], return_index=True)
+            sources = self.set_counts(parents, self.cul_path[sources[order][first]])
+            covered.append(sources)
+
+        self.new_hits = []
+        return np.concatenate(covered)
+
     def accumulate_coverage(self, path):
-        for i in range(len(path)):
-            if path[i] in self.cul_path:
-                self.cul_path[path[i]] += 1
-            else:
-                self.cul_path[path[i]] = 1
-        cur_cov = 0
+        (blocks, hits) = np.unique(np.asarray(path, dtype=np.int64), return_counts=True)
+        covered = self.set_counts(blocks, self.cul_path[blocks] + hits)
+        covered = np.concatenate([covered, self.propagate_idom()])
+        self.cfg_index.cover(covered)
         # print acculumate coverage
-        for key, value in self.cul_path.items():
-            if value > 0:
-                idom = self.CFG[key]['orig_idom']
-                if idom != [] and idom[0] in self.cul_path and self.cul_path[idom[0]] == 0:
-                    self.cul_path[idom[0]] = value
-        for key, value in self.cul_path.items():
-            if value > 0:
-                cur_cov += 1
-        print(f'Current coverage: {cur_cov/len(self.cul_path)*100}%')
\ No newline at end of file
+        print(f'Current coverage: {self.num_covered/self.num_tracked*100}%')
+        return int(self.tracked[covered].sum())
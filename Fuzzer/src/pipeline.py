@@ -0,0 +1,103 @@
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from multicore_manager import proc_state
+from spike_log_to_trace_csv import read_spike_commits
+
+""" Prepared iteration
+    Everything of an iteration that does not depend on the RTL simulation """
+class prepResult():
+    def __init__(self, it, sim_input, data, assert_intr):
+        self.it = it
+        self.sim_input = sim_input
+        self.data = data
+        self.assert_intr = assert_intr
+
+        self.isa_input = None
+        self.rtl_input = None
+        self.symbols = None
+        self.isa_ret = proc_state.NORMAL
+        self.commits = None
+        self.exc = None
+
+""" Fuzzing pipeline
+    Worker threads build (asm, gcc, elf2hex, nm), run spike and parse the
+    spike log of iterations N+1..N+depth while the RTL simulation of
+    iteration N is running. Inputs are still generated and results are
+    still consumed in order by the fuzzing loop, so mutator feedback lands
+    as soon as each iteration is simulated. """
+class rvPipeline():
+    def __init__(self, preprocessor, isaHost, out, proc_num, depth=2,
+                 isa_time_limit=1, debug=False):
+        self.preprocessor = preprocessor
+        self.isaHost = isaHost
+        self.out = out
+        self.proc_num = proc_num
+        self.depth = depth
+        self.isa_time_limit = isa_time_limit
+        self.debug = debug
+
+        self.executor = ThreadPoolExecutor(max_workers=depth)
+        self.queue = deque()
+        self.next_it = 1
+
+    def debug_print(self, message):
+        if self.debug:
+            print(message)
+
+    def prepare(self, prep: prepResult):
+        it = prep.it
+        try:
+            (isa_input, rtl_input, symbols) = \
+                self.preprocessor.process(prep.sim_input, prep.data,
+                                          prep.assert_intr, it, None)
+            prep.isa_input = isa_input
+            prep.rtl_input = rtl_input
+            prep.symbols = symbols
+
+            if not (isa_input and rtl_input):
+                return prep
+
+            # Spike runs concurrently, so each iteration gets its own signature
+            isa_input.sigfile = self.out + '/.isa_sig_{}_{}.txt'.format(self.proc_num, it)
+            isa_log = self.out + '/trace/isa_{}.log'.format(it)
+
+            try:
+                isa_ret = self.isaHost.run_test(isa_input, prep.assert_intr, isa_log,
+                                                timeout=self.isa_time_limit)
+                if isa_ret != 0:
+                    prep.isa_ret = proc_state.ERR_ISA_ASSERT
+            except subprocess.TimeoutExpired:
+                prep.isa_ret = proc_state.ERR_ISA_TIMEOUT
+
+            prep.commits = list(read_spike_commits(isa_log))
+        except Exception as e:
+            prep.exc = e
+
+        return prep
+
+    def fill(self, num_iter, generate):
+        while len(self.queue) < self.depth and self.next_it <= num_iter:
+            (sim_input, data) = generate(self.next_it)
+            prep = prepResult(self.next_it, sim_input, data, False)
+            self.queue.append(self.executor.submit(self.prepare, prep))
+            self.debug_print('[Pipeline] Iteration {} submitted'.format(self.next_it))
+            self.next_it += 1
+
+    def pop(self, it, num_iter, generate):
+        self.fill(num_iter, generate)
+        assert self.queue, 'Pipeline is empty'
+
+        prep = self.queue.popleft().result()
+        assert prep.it == it, 'Pipeline out of order ({} != {})'.format(prep.it, it)
+
+        # Keep the workers busy while the caller simulates this iteration
+        self.fill(num_iter, generate)
+        return prep
+
+    def shutdown(self):
+        for future in self.queue:
+            future.cancel()
+        self.queue.clear()
+        self.executor.shutdown(wait=True)
@@ -2,20 +2,49 @@ import os
 import subprocess
 import shutil
 import random
+import struct
+import threading
 from shutil import copyfile
 
 from ISASim.host import isaInput
 from RTLSim.host import rtlInput
 from mutator import simInput, templates, P_M, P_S, P_U, V_U
+from inst_generator import PREFIX, MAIN
+from assembler import rvAssembler, asmError, elf_sections, elf_patch, elf_read, NOP
+
+""" Fuzz regions of the fast build path
+Each region is reserved with a fixed number of instruction slots (plus the
+jump over the unused slots), so every template symbol keeps its address
+whatever the length of the fuzz instructions is.
+"""
+fuzz_regions = [ ('_fuzz_prefix:', '_pad_prefix', 64),
+                 ('_fuzz_main:', '_pad_main', 2048),
+                 ('_fuzz_suffix:', '_pad_suffix', 256) ]
+
+class templateImage():
+    def __init__(self, elf, sections, symbols):
+        self.elf = elf
+        self.sections = sections
+        self.symbols = symbols
 
 class rvPreProcessor():
-    def __init__(self, cc, elf2hex, template='Template', out_base ='.', proc_num=0):
+    def __init__(self, cc, elf2hex, template='Template', out_base ='.', proc_num=0,
+                 fast_build=False, build_check=False):
         self.cc = cc
         self.elf2hex = elf2hex
         self.template = template
         self.base = out_base
         self.proc_num = proc_num
         self.er_num = 0
+
+        self.fast_build = fast_build
+        self.build_check = build_check
+        self.assembler = rvAssembler()
+        self.images = {}
+        self.image_lock = threading.Lock()
+        self.num_fast = 0
+        self.num_fallback = 0
+        self.num_check_fail = 0
         self.cc_args = [ cc, '-march=rv64g', '-mabi=lp64', '-static', '-mcmodel=medany',
                          '-fvisibility=hidden', '-nostdlib', '-nostartfiles',
                          '-I', '{}/include'.format(template),
@@ -55,6 +84,206 @@ class rvPreProcessor():
         fd.write('{:016x}:{:04b}\n'.format(epc, val))
         fd.close()
 
+    def get_extra_args(self, version, data, intr):
+        if intr: DINTR = ['-DINTERRUPT']
+        else: DINTR = []
+        extra_args = DINTR + [ '-I', '{}/include/p'.format(self.template) ]
+        if version in [ V_U ]:
+            rand = data[0] & 0xffffffff
+            extra_args = DINTR + [ '-DENTROPY=0x{:08x}'.format(rand), '-std=gnu99', '-O2',
+                                   '-I', '{}/include/v'.format(self.template),
+                                   '{}/include/v/string.c'.format(self.template),
+                                   '{}/include/v/vm.c'.format(self.template) ]
+        return extra_args
+
+    def get_suffix_lines(self, suffix_insts):
+        lines = []
+        for inst in suffix_insts:
+            a=random.randint(0,7) #this is for rounding illegal mode
+            #print(inst)
+            if "fnmadd.s" in inst and a == 6: #add fnmadd with illegal frm field 
+                lines.append(".word 0xa106e5cf")
+            lines.append(inst)
+        return lines
+
+    def get_assembly(self, template_lines, region_insts, data, num_data_sections, pad=False):
+        """ Fills the template with the fuzz regions and the data sections.
+        With pad, each region is followed by a jump to its end and nops up to
+        the fixed region size of the fast build path """
+        section_size = len(data) // num_data_sections
+
+        assembly = []
+        for line in template_lines:
+            assembly.append(line)
+            for (region, pad_label, cap) in fuzz_regions:
+                if region in line:
+                    insts = region_insts[region]
+                    for inst in insts:
+                        assembly.append(inst + ';\n')
+                    if pad:
+                        assembly.append('        j {};\n'.format(pad_label))
+                        num = sum([ self.num_slots(inst) for inst in insts ])
+                        assembly.append('        .fill {}, 4, 0x{:08x};\n'.format(cap - num, NOP))
+                        assembly.append('{}:\n'.format(pad_label))
+
+            for n in range(num_data_sections):
+                start = n * section_size
+                end = start + section_size
+                if '_random_data{}'.format(n) in line:
+                    k = 0
+                    for i in range(start, end, 2):
+                        label = ''
+                        if i > start + 2 and i < end - 4:
+                            label = 'd_{}_{}:'.format(n, k)
+                            k += 1
+
+                        assembly.append('{:<16}.dword 0x{:016x}, 0x{:016x}\n'.\
+                                        format(label, data[i], data[i+1]))
+
+        return assembly
+
+    def num_slots(self, inst):
+        if isinstance(inst, tuple):
+            return len(inst[1])
+
+        (labels, mnemonic, operands) = self.assembler.parse(inst)
+        return self.assembler.size(mnemonic, operands) // 4
+
+    def compile(self, asm_name, elf_name, extra_args):
+        cc_args = self.cc_args + extra_args + [ asm_name, '-o', elf_name ]
+
+        while True:
+            cc_ret = subprocess.call(cc_args)
+            # if cc_ret == -9: cc process is killed by OS due to memory usage
+            if cc_ret != -9: break
+
+        return cc_ret
+
+    def get_image(self, version, intr, template_lines, num_data, num_data_sections):
+        """ Template image of the fast build path, compiled once per
+        template and interrupt configuration """
+        key = (version, intr)
+        with self.image_lock:
+            if key in self.images:
+                return self.images[key]
+
+            name = self.base + '/.template_{}{}_{}'.format(templates[version],
+                                                          '_intr' if intr else '',
+                                                          self.proc_num)
+            empty = { region: [] for (region, pad_label, cap) in fuzz_regions }
+            assembly = self.get_assembly(template_lines, empty, [ 0 ] * num_data,
+                                         num_data_sections, pad=True)
+
+            fd = open(name + '.S', 'w')
+            fd.writelines(assembly)
+            fd.close()
+
+            image = None
+            extra_args = self.get_extra_args(version, [ 0 ], intr) + [ '-mno-relax' ]
+            if self.compile(name + '.S', name + '.elf', extra_args) == 0:
+                fd = open(name + '.elf', 'rb')
+                elf = fd.read()
+                fd.close()
+
+                symbols = self.get_symbols(name + '.elf', name + '.symbols')
+                image = templateImage(elf, elf_sections(elf), symbols)
+
+            self.images[key] = image
+            return image
+
+    def fast_process(self, version, intr, sim_input, template_lines, region_insts, data,
+                     num_data_sections, asm_name, elf_name):
+        """ Builds the test ELF by patching the template image.
+        Returns (elf, symbols, text image) or None if the test can not be
+        built in-process """
+        image = self.get_image(version, intr, template_lines, len(data), num_data_sections)
+        if not image:
+            return None
+
+        try:
+            # Prefix and main come from the (cached) Word encodings, the suffix
+            # is assembled from text because of the inserted illegal words
+            region_entries = { '_fuzz_prefix:': sim_input.get_entries(PREFIX, self.assembler),
+                               '_fuzz_main:': sim_input.get_entries(MAIN, self.assembler),
+                               '_fuzz_suffix:': region_insts['_fuzz_suffix:'] }
+
+            regions = []
+            for (region, pad_label, cap) in fuzz_regions:
+                entries = region_entries[region]
+                if region[:-1] not in image.symbols:
+                    continue
+                if sum([ self.num_slots(entry) for entry in entries ]) > cap:
+                    return None
+                regions.append((image.symbols[region[:-1]],
+                                entries + [ 'j {}'.format(pad_label) ]))
+
+            (words, labels) = self.assembler.assemble(regions, image.symbols)
+        except asmError as e:
+            self.debug_build('[PreProcessor] In-process build fallback ({})'.format(e))
+            return None
+
+        elf = bytearray(image.elf)
+        for ((base, insts), region_words) in zip(regions, words):
+            elf_patch(elf, image.sections, base,
+                      struct.pack('<{}I'.format(len(region_words)), *region_words))
+
+        section_size = len(data) // num_data_sections
+        for n in range(num_data_sections):
+            start = n * section_size
+            payload = struct.pack('<{}Q'.format(section_size), *data[start:start + section_size])
+            elf_patch(elf, image.sections, image.symbols['_random_data{}'.format(n)], payload)
+
+        symbols = dict(image.symbols)
+        symbols.update(labels)
+
+        # Text words from _start to _end_main + 36, as read from the elf2hex output
+        _start = symbols['_start']
+        num_words = len(range(_start, symbols['_end_main'] + 36, 8))
+        (addr, offset, size, tpe) = image.sections['.text.init']
+        text = elf_read(elf, image.sections, _start, min(num_words * 8, addr + size - _start))
+        text = text + bytes(num_words * 8 - len(text))
+        text_image = list(struct.unpack('<{}Q'.format(num_words), text))
+
+        fd = open(asm_name, 'w')
+        fd.writelines(self.get_assembly(template_lines, region_insts, data,
+                                        num_data_sections, pad=True))
+        fd.close()
+
+        fd = open(elf_name, 'wb')
+        fd.write(elf)
+        fd.close()
+
+        return (elf, symbols, text_image)
+
+    def check_build(self, elf, asm_name, chk_name, extra_args):
+        """ Cross-checks the in-process build against gcc """
+        if self.compile(asm_name, chk_name, extra_args + [ '-mno-relax' ]) != 0:
+            return False
+
+        fd = open(chk_name, 'rb')
+        chk_elf = fd.read()
+        fd.close()
+        os.remove(chk_name)
+
+        sections = elf_sections(elf)
+        chk_sections = elf_sections(chk_elf)
+        for (name, tup) in chk_sections.items():
+            if tup[3] != 1 or not tup[0]: continue
+            if name not in sections or \
+               (sections[name][0], sections[name][2]) != (tup[0], tup[2]):
+                print('[PreProcessor] In-process build layout mismatch in {}'.format(name))
+                return False
+            if elf_read(elf, sections, tup[0], tup[2]) != \
+               elf_read(chk_elf, chk_sections, tup[0], tup[2]):
+                print('[PreProcessor] In-process build mismatch in {}'.format(name))
+                return False
+
+        return True
+
+    def debug_build(self, message):
+        if self.build_check:
+            print(message)
+
     def process(self, sim_input: simInput, data: list, intr: bool, it, run_elf, num_data_sections=6):
         section_size = len(data) // num_data_sections
 
@@ -65,15 +294,7 @@ class rvPreProcessor():
         version = sim_input.get_template()
         test_template = self.template + '/rv64-{}.S'.format(templates[version])
 
-        if intr: DINTR = ['-DINTERRUPT']
-        else: DINTR = []
-        extra_args = DINTR + [ '-I', '{}/include/p'.format(self.template) ]
-        if version in [ V_U ]:
-            rand = data[0] & 0xffffffff
-            extra_args = DINTR + [ '-DENTROPY=0x{:08x}'.format(rand), '-std=gnu99', '-O2',
-                                   '-I', '{}/include/v'.format(self.template),
-                                   '{}/include/v/string.c'.format(self.template),
-                                   '{}/include/v/vm.c'.format(self.template) ]
+        extra_args = self.get_extra_args(version, data, intr)
 
         si_name = self.base + '/tests/.input_{}{}.si'.format(it, sim_input.name_suffix)
         asm_name = self.base + '/tests/.input_{}{}.S'.format(it, sim_input.name_suffix)
@@ -103,63 +324,45 @@ class rvPreProcessor():
         template_lines = fd.readlines()
         fd.close()
 
-        assembly = []
-        for line in template_lines:
-            assembly.append(line)
-            if '_fuzz_prefix:' in line:
-                for inst in prefix_insts:
-                    assembly.append(inst + ';\n')
-
-            if '_fuzz_main:' in line:
-                for inst in insts:
-                    assembly.append(inst + ';\n')
-
-            if '_fuzz_suffix:' in line:
-                for inst in suffix_insts:
-                    a=random.randint(0,7) #this is for rounding illegal mode
-                    #print(inst)
-                    if "fnmadd.s" in inst and a == 6: #add fnmadd with illegal frm field 
-                        assembly.append(".word 0xa106e5cf" + ';\n')
-                    assembly.append(inst + ';\n')
-
-            for n in range(num_data_sections):
-                start = n * section_size
-                end = start + section_size
-                if '_random_data{}'.format(n) in line:
-                    k = 0
-                    for i in range(start, end, 2):
-                        label = ''
-                        if i > start + 2 and i < end - 4:
-                            label = 'd_{}_{}:'.format(n, k)
-                            k += 1
-
-                        assembly.append('{:<16}.dword 0x{:016x}, 0x{:016x}\n'.\
-                                        format(label, data[i], data[i+1]))
-
-        fd = open(asm_name, 'w')
-        fd.writelines(assembly)
-        fd.close()
-
-        cc_args = self.cc_args + extra_args + [ asm_name, '-o', elf_name ]
-
+        region_insts = { '_fuzz_prefix:': prefix_insts,
+                         '_fuzz_main:': insts,
+                         '_fuzz_suffix:': self.get_suffix_lines(suffix_insts) }
+
+        text_image = None
+        if self.fast_build and version not in [ V_U ] and not run_elf:
+            built = self.fast_process(version, intr, sim_input, template_lines, region_insts, data,
+                                      num_data_sections, asm_name, elf_name)
+            if built:
+                (elf, symbols, text_image) = built
+                if self.build_check and \
+                   not self.check_build(elf, asm_name, elf_name + '.chk', extra_args):
+                    self.num_check_fail += 1
+                    text_image = None
+                    print('[PreProcessor] In-process build of {} differs from gcc, '
+                          'falling back'.format(asm_name))
 
         cc_ret = -1
-        if run_elf:
-            copyfile(run_elf, elf_name)
+        if text_image:
+            self.num_fast += 1
             cc_ret = 0
+        else:
+            if self.fast_build: self.num_fallback += 1
 
-        while True and run_elf==None:
-            cc_ret = subprocess.call(cc_args)
-            # if cc_ret == -9: cc process is killed by OS due to memory usage
-            if cc_ret != -9: break
+            fd = open(asm_name, 'w')
+            fd.writelines(self.get_assembly(template_lines, region_insts, data, num_data_sections))
+            fd.close()
 
-        if cc_ret == 0:
-            if run_elf==None:
-                subprocess.call(cc_args)
+            if run_elf:
+                copyfile(run_elf, elf_name)
+                cc_ret = 0
+            else:
+                cc_ret = self.compile(asm_name, elf_name, extra_args)
 
-            elf2hex_args = self.elf2hex_args + [ elf_name, '--output', hex_name]
-            subprocess.call(elf2hex_args)
-            symbols= self.get_symbols(elf_name, sym_name)
+        if cc_ret == 0:
+            if not text_image:
+                elf2hex_args = self.elf2hex_args + [ elf_name, '--output', hex_name]
+                subprocess.call(elf2hex_args)
+                symbols= self.get_symbols(elf_name, sym_name)
 
             if intr:
                 fuzz_main = symbols['_fuzz_main']
@@ -175,7 +378,7 @@ class rvPreProcessor():
 
 
             isa_input = isaInput(elf_name, isa_intr_name)
-            rtl_input = rtlInput(hex_name, rtl_intr_name, data, symbols, max_cycles)
+            rtl_input = rtlInput(hex_name, rtl_intr_name, data, symbols, max_cycles, text_image)
         else:
             isa_input = None
             rtl_input = None
@@ -0,0 +1,80 @@
+import random
+
+# Per report weight of the past statistics of a group
+DECAY     = 0.99
+# Every operator keeps at least this probability
+MIN_PROB  = 0.02
+# Prior yield per PRIOR_TIME seconds of an operator without statistics
+PRIOR_GAIN = 1.0
+PRIOR_TIME = 10.0
+
+""" Mutation operator scheduler
+Multi-armed bandit over groups of operators (the phase, word operators of
+mutate_words, ...). Every input records the operators used to build it,
+the yield of its run (new blocks + new transitions) and its wall time are
+shared among them by use count. An operator is picked with its base
+probability scaled by its decayed yield per second, so the probabilities
+move to the productive operators as the campaign goes on.
+"""
+class opScheduler():
+    def __init__(self, groups):
+        # group -> { op: base probability }
+        self.base = groups
+        # group -> { op: [ selections, yield, seconds ] }
+        self.stats = { group: { op: [0.0, 0.0, 0.0] for op in ops }
+                       for (group, ops) in groups.items() }
+        self.probs = {}
+        for group in groups:
+            self.update(group)
+
+    def rate(self, group, op):
+        (num, gain, seconds) = self.stats[group][op]
+        return (gain + PRIOR_GAIN) / (seconds + PRIOR_TIME)
+
+    def update(self, group):
+        ops = list(self.base[group])
+        weights = [ self.base[group][op] * self.rate(group, op) for op in ops ]
+        total = sum(weights)
+
+        probs = [ max(w / total, MIN_PROB) for w in weights ]
+        total = sum(probs)
+        self.probs[group] = (ops, [ p / total for p in probs ])
+
+    def pick(self, group):
+        return self.picks(group, 1)[0]
+
+    def picks(self, group, k):
+        (ops, probs) = self.probs[group]
+        return random.choices(ops, probs, k=k)
+
+    def report(self, ops, gain, seconds):
+        """ ops: { (group, op): uses } of an input, gain: its yield """
+        uses = {}
+        for ((group, op), num) in ops.items():
+            uses[group] = uses.get(group, 0) + num
+
+        for (group, total) in uses.items():
+            for stat in self.stats[group].values():
+                for i in range(len(stat)):
+                    stat[i] *= DECAY
+
+        for ((group, op), num) in ops.items():
+            share = num / uses[group]
+            stat = self.stats[group][op]
+            stat[0] += num
+            stat[1] += gain * share
+            stat[2] += seconds * share
+
+        for group in uses:
+            self.update(group)
+
+    def dump(self, name):
+        fd = open(name, 'w')
+        fd.write('{:<8}\t{:<10}\t{:<10}\t{:<10}\t{:<10}\t{:<10}\n'.
+                 format('group', 'op', 'selected', 'yield', 'seconds', 'prob'))
+        for (group, (ops, probs)) in self.probs.items():
+            for (op, prob) in zip(ops, probs):
+                (num, gain, seconds) = self.stats[group][op]
+                fd.write('{:<8}\t{:<10}\t{:<10.1f}\t{:<10.2f}\t{:<10.1f}\t{:<10.4f}\n'.
+                         format(group, op, num, gain, seconds, prob))
+        fd.close()
@@ -218,6 +218,177 @@ def read_spike_trace(path, full_trace):
       yield (instr, False)
 
 
+class SpikeCommit(object):
+  """One instruction line of the spike log
+
+  csrs holds the bracketed CSR values as printed by spike. Records inside
+  the comparison window (see read_spike_commits) also carry the commit
+  information: (reg, value, is_csr) writes, privilege mode and the illegal
+  flag.
+  """
+
+  __slots__ = ('pc', 'binary', 'csrs', 'disasm', 'instr_str', 'writes',
+               'mode', 'illegal', 'in_trace')
+
+  def __init__(self, line):
+    (head, rest) = line.split('[', 1)
+    (vals, disasm) = rest.split(']', 1)
+    tokens = head.split()
+    self.pc = tokens[2][2:] if len(tokens) > 2 else ''
+    self.binary = tokens[3][3:-1] if len(tokens) > 3 else ''
+    self.csrs = tuple(vals.split(','))
+    self.disasm = disasm.rstrip()
+    self.instr_str = ''
+    self.writes = []
+    self.mode = ''
+    self.illegal = False
+    self.in_trace = False
+
+  def accept(self, match):
+    """Take the trace fields from a CORE_RE match"""
+    self.pc = match.group('addr')
+    self.binary = match.group('bin')
+    self.instr_str = match.group('instr').replace('pc + ', '').replace('pc - ', '-')
+    self.in_trace = True
+
+  @property
+  def wdata(self):
+    """Value of the first write, None if the instruction wrote nothing"""
+    return self.writes[0][1] if self.writes else None
+
+  def to_entry(self, full_trace):
+    """Convert to a RiscvInstructionTraceEntry as read_spike_instr would"""
+    instr = RiscvInstructionTraceEntry()
+    instr.pc = self.pc
+    instr.instr_str = self.instr_str
+    instr.binary = self.binary
+    instr.mstatus = self.csrs[0][2:]
+    (instr.frm, instr.fflags, instr.mcause, instr.scause, instr.medeleg,
+     instr.mcounteren, instr.scounteren) = self.csrs[1:8]
+    instr.mode = self.mode
+    for (reg, val, csr) in self.writes:
+      instr.gpr.append((reg if csr else gpr_to_abi(reg)) + ':' + val)
+
+    if full_trace:
+      opcode = self.instr_str.split(' ')[0]
+      operand = self.instr_str[len(opcode):].replace(' ', '')
+      instr.instr, instr.operand = \
+        convert_pseudo_instr(opcode, operand, instr.binary)
+      process_instr(instr)
+
+    return instr
+
+
+def read_spike_commits(path):
+  """Read a Spike simulation log at <path> in a single pass.
+
+  Yields a SpikeCommit for every instruction line ('[' lines) of the log in
+  order, so the CSR transition extraction can consume the same stream. The
+  instructions read_spike_trace() would yield have in_trace set and carry
+  their commit data; the trampoline, anything after the first ecall and
+  lines not matching CORE_RE are yielded with in_trace cleared.
+
+  The commit line regexes are the ones of read_spike_trace(), each only
+  tried on lines that can match it.
+  """
+
+  end_trampoline_re = re.compile(r'core.*: 0x0*1010 ')
+
+  in_trampoline = True
+  stopped = False
+  pending = None
+  instr = None
+
+  with open(path, 'r') as handle:
+    for line in handle:
+      core_line = '[' in line
+      if core_line:
+        if pending is not None:
+          yield pending
+        pending = SpikeCommit(line)
+
+      if stopped:
+        continue
+
+      if in_trampoline:
+        if end_trampoline_re.match(line):
+          in_trampoline = False
+        continue
+
+      instr_match = CORE_RE.match(line) if core_line else None
+      if instr_match:
+        # Entering INSTR from either state; a finished instruction was
+        # already yielded as pending
+        pending.accept(instr_match)
+        instr = pending
+        if instr.instr_str == 'ecall':
+          # Kept in the trace without commit data, as read_spike_trace does
+          instr = None
+          stopped = True
+        continue
+
+      if instr is None:
+        continue
+
+      if 'trap_illegal_instruction' in line:
+        instr.illegal = True
+        instr = None
+        continue
+
+      commit_match = RD_RE.match(line)
+      if commit_match:
+        instr.writes.append((commit_match.group('reg').replace(' ', ''),
+                             commit_match.group('val'), False))
+        instr.mode = commit_match.group('pri')
+
+      if ' mem ' in line:
+        store_match = MEM_RE.match(line)
+        if store_match:
+          instr.mode = store_match.group('pri')
+
+      if ') c' in line:
+        csr_match = CSR_RE.match(line)
+        if csr_match:
+          instr.writes.append((csr_match.group('csr'), csr_match.group('val'), True))
+          instr.mode = csr_match.group('pri')
+
+      if line.rstrip('\n').endswith(')'):
+        other_match = OTHER_RE.match(line)
+        if other_match:
+          instr.mode = other_match.group('pri')
+
+    if pending is not None:
+      yield pending
+
+
+def split_spike_trace(commits, trace):
+  """Pass commits through, appending the in_trace ones to trace"""
+  for commit in commits:
+    if commit.in_trace:
+      trace.append(commit)
+    yield commit
+
+
+def write_spike_commits(commits, csv, full_trace = 1):
+  """Write the in_trace records of commits to a trace CSV at csv, the same
+  file process_spike_sim_log writes. Returns the number of instructions
+  written.
+  """
+  instrs_out = 0
+  with open(csv, "w") as csv_fd:
+    trace_csv = RiscvInstructionTraceCsv(csv_fd)
+    trace_csv.start_new_trace()
+    for commit in commits:
+      if not commit.in_trace:
+        continue
+      if not (full_trace or commit.writes or commit.instr_str in ['wfi', 'ecall']):
+        continue
+      trace_csv.write_trace_entry(commit.to_entry(full_trace))
+      instrs_out += 1
+
+  return instrs_out
+
+
 def process_spike_sim_log(spike_log, csv, full_trace = 1):
   """Process SPIKE simulation log.
 
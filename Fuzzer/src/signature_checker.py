@@ -114,13 +114,14 @@ class sigChecker():
 
         return intr_prv, epc
 
-    def check(self, symbols):
+    def check(self, symbols, isa_sigfile=None):
+        if not isa_sigfile: isa_sigfile = self.isa_sigfile
 
         (xreg_idxes, freg_idxes, csr_idxes, data_symbols, data_idx_start) = \
             self.read_symbols(symbols)
 
         (isa_xreg_vals, isa_freg_vals, isa_csr_vals, isa_data_vals) = \
-            self.read_sig(self.isa_sigfile, xreg_idxes, freg_idxes,
+            self.read_sig(isa_sigfile, xreg_idxes, freg_idxes,
                           csr_idxes, data_symbols, data_idx_start)
 
         (rtl_xreg_vals, rtl_freg_vals, rtl_csr_vals, rtl_data_vals) = \
@@ -0,0 +1,103 @@
+import os
+import struct
+
+TRNS_ALL  = 0
+TRNS_PRIV = 1
+TRNS_FUNC = 2
+
+ID_BITS = 16
+LANE_BITS = 64
+
+# kind, number of CSR fields per side, length of the instruction name
+RECORD_HDR = struct.Struct('<BBH')
+
+""" Transition database
+Seen CSR transitions (instruction, CSRs before, CSRs after) as hash sets of
+packed integer keys: every CSR value takes a 64 bit lane and the instruction
+name an interned id in the low bits. New transitions can be appended to a
+binary log, which is reloaded on open and followed (sync) by every forked
+worker appending to the same file.
+"""
+class transitionDB():
+    def __init__(self):
+        self.trns = { TRNS_ALL: set(), TRNS_PRIV: set(), TRNS_FUNC: set() }
+        self.instr_ids = {}
+
+        self.log = None
+        self.fd = None
+        self.offset = 0
+
+    def instr_id(self, instr):
+        if instr not in self.instr_ids:
+            assert len(self.instr_ids) < (1 << ID_BITS), 'Too many transition instructions'
+            self.instr_ids[instr] = len(self.instr_ids)
+        return self.instr_ids[instr]
+
+    def pack(self, instr, vals):
+        key = 0
+        for val in reversed(vals):
+            key = (key << LANE_BITS) | val
+        return (key << ID_BITS) | self.instr_id(instr)
+
+    def add(self, kind, instr, prev, cur):
+        """ prev, cur: CSR values as hex strings, True if the transition is new """
+        vals = [ int(val, 16) for val in prev + cur ]
+        key = self.pack(instr, vals)
+        if key in self.trns[kind]:
+            return False
+
+        self.trns[kind].add(key)
+        if self.fd is not None:
+            self.append(kind, instr, len(prev), vals)
+        return True
+
+    def append(self, kind, instr, num_fields, vals):
+        name = instr.encode()
+        record = RECORD_HDR.pack(kind, num_fields, len(name)) + name + \
+            struct.pack('<{}Q'.format(len(vals)), *vals)
+        # O_APPEND and a single write keep the records of the workers whole
+        os.write(self.fd, record)
+
+    def open(self, log):
+        self.log = log
+        self.fd = os.open(log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.offset = 0
+        return self.sync()
+
+    def sync(self):
+        """ Load the records appended to the log since the last sync,
+        returns the number of records loaded """
+        if self.log is None:
+            return 0
+
+        fd = open(self.log, 'rb')
+        fd.seek(self.offset)
+        data = fd.read()
+        fd.close()
+
+        num = 0
+        pos = 0
+        while pos + RECORD_HDR.size <= len(data):
+            (kind, num_fields, name_len) = RECORD_HDR.unpack_from(data, pos)
+            end = pos + RECORD_HDR.size + name_len + 16 * num_fields
+            # A record of another worker may still be in flight
+            if end > len(data): break
+
+            name = data[pos + RECORD_HDR.size:pos + RECORD_HDR.size + name_len].decode()
+            vals = struct.unpack_from('<{}Q'.format(2 * num_fields), data,
+                                      pos + RECORD_HDR.size + name_len)
+            self.trns[kind].add(self.pack(name, vals))
+            pos = end
+            num += 1
+
+        self.offset += pos
+        return num
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.log = None
+
+    def __len__(self):
+        return sum([ len(keys) for keys in self.trns.values() ])
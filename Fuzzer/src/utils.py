@@ -1,12 +1,11 @@
 import os
 import shutil
-import psutil
 import signal
-import csv
-from threading import Timer
 import struct
 import binascii
 import math
+import numpy as np
+from collections import deque
 from pathlib import Path
 #from subprocess import STDOUT, check_output, check_call, Popen
 import subprocess
@@ -15,17 +14,17 @@ import sys
 
 from ISASim.host import rvISAhost
 from RTLSim.host import rvRTLhost
+from RTLSim.native_host import rvNativeHost
 
 from src.preprocessor import rvPreProcessor
 from src.signature_checker import sigChecker
 from src.mutator import simInput, rvMutator
 from src.multicore_manager import proc_state, procManager
+from src.transition_db import transitionDB, TRNS_ALL, TRNS_PRIV, TRNS_FUNC
 
 ISA_TIME_LIMIT = 1
 
-comb_t = []
-comb_priv = []
-comb_func = []
+trns_db = transitionDB()
 instrs = []
 
 reg_map = {
@@ -107,32 +106,86 @@ ignore_list = ['csrw    minstret', 'mret', 'sret', 'ebreak', 'csrw    mepc', 'cs
 #ignore_list = []
 def get_FS(mstatus):
     return ((int(mstatus, 16)>>13)&3)
-def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
+def rtl_fields(rtl_line, toplevel):
+    """ (pc, instr, wdata, mode, mstatus, frm, fflags, mcause, scause, medeleg,
+    mcounteren, scounteren) of a split RTL trace line, frm and fflags are
+    None on Rocket which does not trace them """
+    if toplevel=='BoomTile':
+        return (rtl_line[2][10:], rtl_line[3][2:], rtl_line[4][2:], rtl_line[1],
+                rtl_line[5], rtl_line[6], rtl_line[7].zfill(2), rtl_line[8][-1],
+                rtl_line[9][-1], rtl_line[10], rtl_line[11], rtl_line[12])
+    else:
+        return (rtl_line[2][4:], rtl_line[3][2:], rtl_line[4][2:], rtl_line[1],
+                rtl_line[5], None, None, rtl_line[6][-1],
+                rtl_line[7][-1], rtl_line[8], rtl_line[9], rtl_line[10])
+
+def align_rtl_trace(rtl_lines, rtl_trace_start, pcs_isa, toplevel):
+    """ RTL trace row of every ISA commit: DELAYED writebacks are skipped and,
+    on Rocket, an EXCEPTION line for another pc. Stops at the first commit
+    without a (well-formed) RTL row and returns the error with the rows
+    before it """
+    rows = []
+    exceptions = []
+    fields = []
+    start = rtl_trace_start
+    try:
+        for j in range(len(pcs_isa)):
+            while "DELAYED" in rtl_lines[start+j]: #skip all delayed values
+                start = start + 1
+            exception = "EXCEPTION" in rtl_lines[start+j]
+            if exception and toplevel=='RocketTile':
+                if rtl_lines[start+j].split()[2][4:]!=pcs_isa[j]:
+                    start = start + 1
+            fields.append(rtl_fields(rtl_lines[start+j].split(), toplevel))
+            rows.append(start+j)
+            exceptions.append(exception)
+    except Exception as e:
+        return (rows, exceptions, fields, e)
+
+    return (rows, exceptions, fields, None)
+
+def index_delayed_wb(rtl_lines):
+    """ Delayed writebacks of the RTL trace per register (rN/fN), each an
+    ordered queue of (line, wdata) """
+    delayed = {}
+    for (k, line) in enumerate(rtl_lines):
+        if 'DELAYED' not in line: continue
+        (dst, _, val) = line.partition('=')
+        dst = dst.split()
+        val = val.split()
+        if len(dst) < 2 or not val: continue
+        delayed.setdefault(dst[1], deque()).append((k, val[0]))
+    return delayed
+
+def find_delayed_wb(delayed, reg, i):
+    """ First delayed writeback of reg after line i, None if there is none.
+    Lookups come with increasing i, so passed entries are dropped """
+    queue = delayed.get(reg)
+    while queue and queue[0][0] <= i:
+        queue.popleft()
+    if queue:
+        return queue[0][1]
+    return None
+
+def trace_compare(isa_trace, rtl_log, toplevel, strategy=''):
 
     rtl_f = open(rtl_log, 'r')
     rtl_lines = rtl_f.readlines()
     rtl_f.close() 
-    rtl_trace_idx = 1 # skip the first line with headers
     rtl_trace_len = len(rtl_lines)
-    rtl_pc_start = ''   
     mismatch = False
     not_found = False
-    isa_idx_offset = 0
     delayed_result_not_found = False
     return_val = 0
-    init_value = True
+    num_delayed = 0
     rtl_trace_start = 0
     hdr = ''
     isa_m_str = ''
     rtl_m_str = ''
-    mode_isa = ''
     lr_addr = 0
     sc_addr = 0
-    wdata_p = 0
     lrsc_exception = False
-    exception = False
     initial = True
-    instr_str_p = ''
     for x in range(10):
         if 'DELAYED' in rtl_lines[x]: continue
         if toplevel=='BoomTile':
@@ -143,100 +196,87 @@ def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
         #if rtl_lines[x].split()[2][10:]=='80000000':
             rtl_trace_start = x
             break
-    isa_f = open(isa_csv, 'r') 
     try:
     #if True:
-        isa_csv = csv.reader(isa_f)
-        next(isa_csv, None)
-        isa_csv = list(isa_csv)
         if rtl_trace_len == 1: #only the header is available
             print("ERROR: Empty RTL trace file - ",rtl_log)
-            isa_f.close()
-            return -1
-         
-        for j in range(len(isa_csv[isa_idx_offset:])): # skip the first line with headers
-            line = isa_csv[isa_idx_offset+j]
-            #print(line)
-            #if ('ecall') in line:
-            #    print("[COMPARISON PASSED]")
-            #    isa_f.close()
-            #    break
-            #pc,instr,gpr,csr,binary,mode,instr_str,operand,pad
-            #print(line)
-            pc_isa = line[0][8:]
-            instr_isa = line[4]
-            line[2] = line[2].split(';')[0]
-            if len(line[2].split(':')) < 2:# for no write back value, set it to zeros
-                wdata_isa = '0000000000000000'
-            else:
-                wdata_isa = line[2].split(':')[1]
-            pmode_isa = mode_isa
-            mode_isa = line[5]
-            instr_str_isa = line[6]
-            mstatus_isa = line[9].zfill(16)
-            frm_isa = line[10].zfill(1)
-            fflags_isa = line[11].zfill(2)
-            mcause_isa = line[12].zfill(2)
-            scause_isa = line[13].zfill(2)
-            medeleg_isa = line[14].zfill(16)
-            mcounteren_isa = line[15].zfill(8)
-            scounteren_isa = line[16].zfill(8)
-            mcause_isa = mcause_isa[-1]
-            scause_isa = scause_isa[-1]
-            if mode_isa == '':
-                mode_isa = pmode_isa
-            #dcsr_isa = line[11].zfill(8)
-            while "DELAYED" in rtl_lines[rtl_trace_start+j]: #skip all delayed values
-                rtl_trace_start = rtl_trace_start + 1
+            return (-1, num_delayed)
+
+        # ISA columns, mode carries over commits without a mode
+        pcs_isa = [ commit.pc[8:] for commit in isa_trace ]
+        modes_isa = []
+        mode_isa = ''
+        for commit in isa_trace:
+            mode_isa = commit.mode or mode_isa
+            modes_isa.append(mode_isa)
+
+        (rows, exceptions, rtl_cols, error) = \
+            align_rtl_trace(rtl_lines, rtl_trace_start, pcs_isa, toplevel)
+        delayed = index_delayed_wb(rtl_lines)
+        n = len(rows)
+        isa_trace = isa_trace[:n]
+
+        instrs_isa = [ commit.binary for commit in isa_trace ]
+        wdatas_isa = [ commit.wdata or '0000000000000000' for commit in isa_trace ]
+        instr_strs_isa = [ commit.instr_str for commit in isa_trace ]
+        ops_isa = [ instr_str.split()[0] if instr_str.split() else '' for instr_str in instr_strs_isa ]
+        csrs_isa = [ (commit.csrs[0][2:].zfill(16), commit.csrs[1].zfill(1), commit.csrs[2].zfill(2),
+                      commit.csrs[3].zfill(2)[-1], commit.csrs[4].zfill(2)[-1], commit.csrs[5].zfill(16),
+                      commit.csrs[6].zfill(8), commit.csrs[7].zfill(8)) for commit in isa_trace ]
+
+        # Vectorized raw comparison, the waivers below only run on rows that
+        # differ or that a waiver/diagnostic may change
+        def column(values):
+            return np.array(values, dtype=str)
+
+        ne = column(instrs_isa) != column([ f[1] for f in rtl_cols ])
+        ne |= column(wdatas_isa) != column([ f[2] for f in rtl_cols ])
+        ne |= column(modes_isa[:n]) != column([ f[3] for f in rtl_cols ])
+        for (k, f) in [ (0, 4), (3, 7), (4, 8), (5, 9), (6, 10), (7, 11) ]:
+            ne |= column([ c[k] for c in csrs_isa ]) != column([ fields[f] for fields in rtl_cols ])
+        if toplevel=='BoomTile':
+            ne |= column([ c[2] for c in csrs_isa ]) != column([ f[6] for f in rtl_cols ])
+
+        ne |= column(pcs_isa[:n]) != column([ f[0] for f in rtl_cols ])
+        ne |= np.array(exceptions, dtype=bool)
+        ne |= np.array([ 'deadbeef' in f[2] for f in rtl_cols ], dtype=bool)
+        ne |= np.array([ op in ['j', 'ret', 'lr.w', 'lr.d'] for op in ops_isa ], dtype=bool)
+
+        def isa_wdata(j):
+            """ wdata_isa after the csrw and mip waivers """
+            if ops_isa[j] in ['csrw', 'csrwi']:
+                return '0000000000000000'
+            if 'csrr    sp, mip' in instr_strs_isa[j].rstrip() and wdatas_isa[j]=='0000000000000080' and rtl_cols[j][2]=='0000000000000000':
+                return rtl_cols[j][2]
+            return wdatas_isa[j]
+
+        for j in np.flatnonzero(ne).tolist():
+            pc_isa = pcs_isa[j]
+            instr_isa = instrs_isa[j]
+            wdata_isa = wdatas_isa[j]
+            mode_isa = modes_isa[j]
+            instr_str_isa = instr_strs_isa[j]
+            (mstatus_isa, frm_isa, fflags_isa, mcause_isa, scause_isa,
+             medeleg_isa, mcounteren_isa, scounteren_isa) = csrs_isa[j]
+            wdata_p = isa_wdata(j-1) if j > 0 else 0
+            instr_str_p = instr_strs_isa[j-1] if j > 0 else ''
+
             if instr_str_isa.split()[0] in ['lr.w', 'lr.d']:
                 lrsc_exception = False
                 lr_addr = int(wdata_p, 16)
-            if "EXCEPTION" in rtl_lines[rtl_trace_start+j]:
-                exception = True
+            exception = exceptions[j]
+            if exception:
                 lrsc_exception = True
-                if toplevel=='RocketTile':
-                    if rtl_lines[rtl_trace_start+j].split()[2][4:]!=pc_isa:
-                        rtl_trace_start = rtl_trace_start + 1
-                #if rtl_lines[rtl_trace_start+j].split()[2][10:]!=pc_isa: #Only for BOOM for now
-                #    rtl_trace_start = rtl_trace_start + 1
-            else:
-                exception = False
-
-            i = rtl_trace_start+j
+
+            i = rows[j]
             rtl_line = rtl_lines[i].split()
-            if toplevel=='BoomTile':
-                pc_rtl = rtl_line[2][10:]
-            elif toplevel=='RocketTile':
-                pc_rtl = rtl_line[2][4:]
-            #print("PC",pc_rtl, toplevel)
-            #pc_rtl = rtl_lines[rtl_trace_start+j].split()[2][10:]
-            #print("PC ISA: {}, RTL: {}".format(pc_isa, pc_rtl))
-            instr_rtl = rtl_line[3][2:]
-            wdata_rtl = rtl_line[4][2:]
-            mode_rtl = rtl_line[1]
+            (pc_rtl, instr_rtl, wdata_rtl, mode_rtl, mstatus_rtl, frm_rtl, fflags_rtl,
+             mcause_rtl, scause_rtl, medeleg_rtl, mcounteren_rtl, scounteren_rtl) = rtl_cols[j]
             if toplevel=='RocketTile':
-                mstatus_rtl = rtl_line[5]
-            #if toplevel=='BoomTile':
                 frm_rtl = frm_isa
                 fflags_rtl = fflags_isa
-                mcause_rtl = rtl_line[6][-1]
-                scause_rtl = rtl_line[7][-1]
-                medeleg_rtl = rtl_line[8]
-                mcounteren_rtl = rtl_line[9]
-                scounteren_rtl = rtl_line[10]
-            else:
-                mstatus_rtl = rtl_line[5]
-                frm_rtl = rtl_line[6]
-                fflags_rtl = rtl_line[7].zfill(2)
-                mcause_rtl = rtl_line[8][-1]
-                scause_rtl = rtl_line[9][-1]
-                medeleg_rtl = rtl_line[10]
-                mcounteren_rtl = rtl_line[11]
-                scounteren_rtl = rtl_line[12]
-                #dcsr_rtl = rtl_line[6]
             if pc_isa!=pc_rtl:
                 print("PC MISMATCH: ISA - {}, RTL - {}".format(pc_isa,pc_rtl))
-                isa_f.close()
                 return_val = -1
                 if scause_rtl=='f' and mcause_isa=='6':
                     print("Bug 14: Rocket exception priority is incorrect when store page fault and store misaligned address exceptions are generated")
@@ -262,16 +302,13 @@ def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
                 else:
                     isa_wb_reg = 'r'+str(reg_map[reg])
                 #print(isa_wb_reg)
-                for k in range(i+1, rtl_trace_len):
-                    if 'DELAYED' in rtl_lines[k]:
-                        #print(rtl_lines[k].split('=')[0].split()[1])
-                        if (rtl_lines[k].split('=')[0].split()[1]==isa_wb_reg):
-                            wdata_rtl= rtl_lines[k].split('=')[1].split()[0].rstrip()
-                            #print("DELAYED result: ",wdata_rtl, rtl_lines[k].split('=')[0].split()[1])
-                            break
-                    if k == rtl_trace_len-1: 
-                        delayed_result_not_found = True
-                        break
+                num_delayed += 1
+                wdata_delayed = find_delayed_wb(delayed, isa_wb_reg, i)
+                if wdata_delayed is not None:
+                    wdata_rtl = wdata_delayed
+                    #print("DELAYED result: ",wdata_rtl, isa_wb_reg)
+                elif i+1 < rtl_trace_len:
+                    delayed_result_not_found = True
             if ( instr_isa!=instr_rtl or wdata_isa!=wdata_rtl or mode_isa!=mode_rtl or mstatus_isa!=mstatus_rtl or fflags_isa!=fflags_rtl or mcause_rtl!= mcause_isa or scause_rtl!=scause_isa or medeleg_rtl!=medeleg_isa or mcounteren_rtl!=mcounteren_isa or scounteren_rtl!=scounteren_isa):
                 mismatch = True
                 #if mstatus_isa=='0000000a00000000' and init_value: # Skip init value check
@@ -382,26 +419,20 @@ def trace_compare(isa_csv, rtl_log, toplevel, strategy=''):
                 #break
             if not_found:
                 print("INSTRUCTION NOT FOUND: {}\n\t\t\tPC\t\t\tINSTR\t\tMODE\tWDATA \nISA:\t\t{}\t{}\t{}\t\t{}\n".format(instr_str_isa,pc_isa,instr_isa,mode_isa,wdata_isa))
-                isa_f.close()
                 break
             if return_val==-2:
-                isa_f.close()
                 break
-            #if j==len(isa_csv[isa_idx_offset:])-1 and not mismatch and initial:
-            #    print("[COMPARISON PASSED]")
-            wdata_p = wdata_isa 
-            instr_str_p = instr_str_isa
-            #k = k + 1
-    except:
-        print("ERROR: Trace comparison did not complete")
-    isa_f.close()
-    return return_val
+        else:
+            if error:
+                raise error
+    except Exception as e:
+        print("ERROR: Trace comparison did not complete ({})".format(e))
+    return (return_val, num_delayed)
 
-def extract_transitions(i_file, out, it, ALL_CSR, FP_CSR):
-	fd = open(i_file, "r")
+def extract_transitions(commits, out, it, ALL_CSR, FP_CSR):
 	fdb = open(out+"/transition.db","a")	
-	lines = fd.readlines()
-	fd.close()
+	# Transitions other workers appended to the shared log
+	trns_db.sync()
 	init = True
 	count = 0
 	duplic = []
@@ -410,13 +441,10 @@ def extract_transitions(i_file, out, it, ALL_CSR, FP_CSR):
 	csr = ''
 	j = 0
 	skip = False
-	for l in lines:
-		if '[' not in l:
-			continue
+	for commit in commits: # every instruction line of the spike log
 		count = count + 1
-		vals = l.split('[')[1].split(']')[0]
-		instr = l.split('[')[1].split(']')[1].rstrip()
-		vals = vals.split(',')
+		vals = commit.csrs
+		instr = commit.disasm
 		mstatus = vals[0]
 		frm = vals[1]
 		fflags = vals[2]
@@ -461,26 +489,23 @@ def extract_transitions(i_file, out, it, ALL_CSR, FP_CSR):
 			pmpcfg = vals[39]
 			pmpaddr = vals[40]
 		
-		pc = l.split()[2]
+		pc = commit.pc
 
 		if init:
 			init = False
 		elif ALL_CSR:
 			if (mstatus_p != mstatus) or (frm_p != frm) or (fflags_p != fflags) or (mcause_p != mcause) or (scause_p != scause) or (medeleg_p != medeleg) or (mcounteren_p != mcounteren) or (scounteren_p != scounteren) or (dcsr_p != dcsr) or (misa_p != misa) or (mhartid_p != mhartid) or (mip_p != mip) or (mie_p != mie) or (mideleg_p != mideleg) or (mepc_p != mepc) or (mtval_p != mtval) or (mtvec_p != mtvec) or (mscratch_p != mscratch) or (sstatus_p != sstatus) or (sip_p != sip) or (sie_p != sie) or (sepc_p != sepc) or (stval_p != stval) or (sscratch_p != sscratch) or (satp_p != satp) or (stvec_p != stvec) or (dpc_p != dpc) or (tselect_p != tselect) or (tdata1_p != tdata1) or (tdata2_p != tdata2) or (tdata3_p != tdata3) or (mcountinhibit_p != mcountinhibit) or (cycle_p != cycle) or (instret_p != instret) or (mhpmevent_p != mhpmevent) or (mhpmcounter_p != mhpmcounter) or (vstart_p != vstart) or (vxsat_p != vxsat) or (vxrm_p != vxrm) or (pmpcfg_p != pmpcfg) or (pmpaddr_p != pmpaddr):
-				comp = mstatus+frm+fflags+mcause+scause+medeleg+mcounteren+scounteren+dcsr+misa+mhartid+mip+mie+mideleg+mepc+mtval+mtvec+mscratch+sstatus+sip+sie+sepc+stval+sscratch+satp+stvec+dpc+tselect+tdata1+tdata2+tdata3+mcountinhibit+cycle+instret+mhpmevent+mhpmcounter+vstart+vxsat+vxrm+pmpcfg+pmpaddr
-				comp_p = mstatus_p+frm_p+fflags_p+mcause_p+scause_p+medeleg_p+mcounteren_p+scounteren_p+dcsr_p+misa_p+mhartid_p+mip_p+mie_p+mideleg_p+mepc_p+mtval_p+mtvec_p+mscratch_p+sstatus_p+sip_p+sie_p+sepc_p+stval_p+sscratch_p+satp_p+stvec_p+dpc_p+tselect_p+tdata1_p+tdata2_p+tdata3_p+mcountinhibit_p+cycle_p+instret_p+mhpmevent_p+mhpmcounter_p+vstart_p+vxsat_p+vxrm_p+pmpcfg_p+pmpaddr_p
+				comp = (mstatus,frm,fflags,mcause,scause,medeleg,mcounteren,scounteren,dcsr,misa,mhartid,mip,mie,mideleg,mepc,mtval,mtvec,mscratch,sstatus,sip,sie,sepc,stval,sscratch,satp,stvec,dpc,tselect,tdata1,tdata2,tdata3,mcountinhibit,cycle,instret,mhpmevent,mhpmcounter,vstart,vxsat,vxrm,pmpcfg,pmpaddr)
+				comp_p = (mstatus_p,frm_p,fflags_p,mcause_p,scause_p,medeleg_p,mcounteren_p,scounteren_p,dcsr_p,misa_p,mhartid_p,mip_p,mie_p,mideleg_p,mepc_p,mtval_p,mtvec_p,mscratch_p,sstatus_p,sip_p,sie_p,sepc_p,stval_p,sscratch_p,satp_p,stvec_p,dpc_p,tselect_p,tdata1_p,tdata2_p,tdata3_p,mcountinhibit_p,cycle_p,instret_p,mhpmevent_p,mhpmcounter_p,vstart_p,vxsat_p,vxrm_p,pmpcfg_p,pmpaddr_p)
 				instr_t = instr_p.split()[0].strip()
-				if (instr_t, comp_p, comp) not in comb_t:
-					comb_t.append((instr_t, comp_p, comp))
+				if trns_db.add(TRNS_ALL, instr_t, comp_p, comp):
 					j += 1
 		elif (mstatus_p != mstatus) or (frm_p != frm) or (fflags_p != fflags) or (mcause_p != mcause) or (scause_p != scause) or (medeleg_p != medeleg) or (mcounteren_p != mcounteren) or (scounteren_p != scounteren): #or (dcsr_p != dcsr):
 			t = (pc_p + '\t' + mstatus_p +','+frm_p+','+fflags_p+','+mcause_p+','+scause_p+','+medeleg_p+','+mcounteren_p+','+scounteren_p+' '+instr_p, pc + '\t' + mstatus +','+frm+','+fflags+','+mcause+','+scause+','+medeleg+','+mcounteren+','+scounteren+' '+instr)
-			comb = mstatus+frm+fflags+mcause+scause+medeleg+mcounteren+scounteren
-			comb_p = mstatus_p+frm_p+fflags_p+mcause_p+scause_p+medeleg_p+mcounteren_p+scounteren_p
-			comb_pr   = mstatus+mcause+scause+medeleg+mcounteren+scounteren
-			comb_pr_p = mstatus_p+mcause_p+scause_p+medeleg_p+mcounteren_p+scounteren_p
-			comb_f   = str((int(mstatus,16)>>13) & 3) +frm+fflags
-			comb_f_p = str((int(mstatus_p,16)>>13) & 3) +frm_p+fflags_p
+			comb_pr   = (mstatus,mcause,scause,medeleg,mcounteren,scounteren)
+			comb_pr_p = (mstatus_p,mcause_p,scause_p,medeleg_p,mcounteren_p,scounteren_p)
+			comb_f   = (str((int(mstatus,16)>>13) & 3),frm,fflags)
+			comb_f_p = (str((int(mstatus_p,16)>>13) & 3),frm_p,fflags_p)
 			instr_t = instr_p.split()[0].strip()
 			csr = ''
 			skip = False
@@ -513,25 +538,22 @@ def extract_transitions(i_file, out, it, ALL_CSR, FP_CSR):
 			#	transitions.append(t)
 			if not skip:
 				# Privileged CSR transition check - only considered when FP_CSR is not set
-				if (not FP_CSR) and (instr_t, comb_pr_p, comb_pr) not in comb_priv and comb_pr_p!=comb_pr:
-					comb_priv.append((instr_t, comb_pr_p, comb_pr))
+				if (not FP_CSR) and comb_pr_p!=comb_pr and trns_db.add(TRNS_PRIV, instr_t, comb_pr_p, comb_pr):
 					priv_trns = True
 					print("PRIVILEGE",instr_t,file=fdb)
-					print(comb_pr_p,file=fdb)
-					print(comb_pr,file=fdb)
+					print(''.join(comb_pr_p),file=fdb)
+					print(''.join(comb_pr),file=fdb)
 					j += 1
 
 				# FP CSR transition check
-				if (instr_t, comb_f_p, comb_f) not in comb_func and comb_f_p!=comb_f:
-					comb_func.append((instr_t, comb_f_p, comb_f))
+				if comb_f_p!=comb_f and trns_db.add(TRNS_FUNC, instr_t, comb_f_p, comb_f):
 					func_trns = True
 					print("FLOAT",instr_t,file=fdb)
-					print(comb_f_p,file=fdb)
-					print(comb_f,file=fdb)
+					print(''.join(comb_f_p),file=fdb)
+					print(''.join(comb_f),file=fdb)
 					j += 1
 
 				if priv_trns or func_trns:
-					comb_t.append((instr_t, comb_p, comb))
 					transitions.append(t)
 
 			#j = j + 1
@@ -829,33 +851,16 @@ def save_err(out: str, proc_num: int, manager: procManager, stop_code: int, it):
                     out + '/err/err_{}_{}.si'.format(status, it))
 
 
-def isa_timeout(out, stop, proc_num, it):
-    if not os.path.isdir(out + '/isa_timeout'):
-        os.makedirs(out + '/isa_timeout')
-
-    #shutil.copy(out + '/tests/.input_{}.elf'.format(it), out + '/isa_timeout/timeout_{}.elf'.format(it))
-    #shutil.copy(out + '/tests/.input_{}.S'.format(it), out + '/isa_timeout/timeout_{}.S'.format(it))
-
-    ps = psutil.Process()
-    children = ps.children(recursive=True)
-    for child in children:
-        try: os.kill(child.pid, signal.SIGKILL) # SIGKILL
-        except: continue
-
-    stop[0] = proc_state.ERR_ISA_TIMEOUT
-
 def run_isa_test(isaHost, isa_input, stop, out, proc_num, assert_intr=False, log='spike.log', name=''):
     ret = proc_state.NORMAL
-   
-    timer = Timer(ISA_TIME_LIMIT, isa_timeout, [out, stop, proc_num, name])
-    timer.start()
-    isa_ret = isaHost.run_test(isa_input, assert_intr, log)
-    timer.cancel()
-
-    if stop[0] == proc_state.ERR_ISA_TIMEOUT:
-        stop[0] = proc_state.NORMAL
-        ret = proc_state.ERR_ISA_TIMEOUT
-    elif isa_ret != 0:
+
+    # Only the spike of this test is killed on timeout
+    try:
+        isa_ret = isaHost.run_test(isa_input, assert_intr, log, timeout=ISA_TIME_LIMIT)
+    except subprocess.TimeoutExpired:
+        return proc_state.ERR_ISA_TIMEOUT
+
+    if isa_ret != 0:
         stop[0] = proc_state.ERR_ISA_ASSERT
         ret = proc_state.ERR_ISA_ASSERT
 
@@ -882,14 +887,17 @@ def save_mismatch(base, proc_num, out, sim_input: simInput, data: list, num, it)
 
     shutil.copy(elf, out + '/elf/id_{}.elf'.format(num))
     shutil.copy(asm, out + '/asm/id_{}.S'.format(num))
-    shutil.copy(hexfile, out + '/hex/id_{}.hex'.format(num))
+    if os.path.isfile(hexfile):
+        shutil.copy(hexfile, out + '/hex/id_{}.hex'.format(num))
 
-def setup(dut, toplevel, template, out, proc_num, debug, minimizing=False, no_guide=False):
+def setup(dut, toplevel, template, out, proc_num, debug, minimizing=False, no_guide=False,
+          fast_build=False, build_check=False, spike_server=False, native=False):
     mutator = rvMutator(corpus_size=1000, no_guide=no_guide, top_module=toplevel)
 
     cc = 'riscv64-unknown-elf-gcc'
     elf2hex = 'riscv64-unknown-elf-elf2hex'
-    preprocessor = rvPreProcessor(cc, elf2hex, template, out, proc_num)
+    preprocessor = rvPreProcessor(cc, elf2hex, template, out, proc_num,
+                                  fast_build, build_check)
 
     spike = os.environ['SPIKE']
     isa_sigfile = out + '/.isa_sig_{}.txt'.format(proc_num)
@@ -898,8 +906,9 @@ def setup(dut, toplevel, template, out, proc_num, debug, minimizing=False, no_gu
     if debug: spike_arg = ['-l']
     else: spike_arg = []
 
-    isaHost = rvISAhost(spike, spike_arg, isa_sigfile)
-    rtlHost = rvRTLhost(dut, toplevel, rtl_sigfile, debug=debug)
+    isaHost = rvISAhost(spike, spike_arg, isa_sigfile, server=spike_server)
+    if native: rtlHost = rvNativeHost(toplevel, rtl_sigfile, out, debug=debug)
+    else: rtlHost = rvRTLhost(dut, toplevel, rtl_sigfile, debug=debug)
 
     checker = sigChecker(isa_sigfile, rtl_sigfile, debug, minimizing)
 
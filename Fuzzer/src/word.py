@@ -1,4 +1,5 @@
 import os
+import re
 import random
 
 from riscv_definitions import *
@@ -15,7 +16,37 @@ PREFIX = '_p'
 MAIN   = '_l'
 SUFFIX = '_s'
 
+""" Instruction templates
+Parsed once per template string: (mnemonic, operand tokens), where a memory
+operand 'imm6(xreg1)' is kept as an (offset, base) pair
+"""
+inst_templates = {}
+mem_token = re.compile(r'^(.*)\((\w+)\)$')
+
+def parse_template(inst):
+    tup = inst_templates.get(inst)
+    if tup is None:
+        tokens = inst.split(None, 1)
+        operands = []
+        if len(tokens) > 1:
+            for op in tokens[1].split(','):
+                op = op.strip()
+                m = mem_token.match(op)
+                if m: operands.append((m.group(1).strip(), m.group(2)))
+                else: operands.append(op)
+        tup = (tokens[0] if tokens else None, operands)
+        inst_templates[inst] = tup
+
+    return tup
+
 class Word():
+    # Corpus entries share their words with the inputs mutated from them:
+    # insts, opvals and the operand lists are never modified in place, a
+    # word that changes gets new ones (see copy, repop_label)
+    __slots__ = ('label', 'tpe', 'insts', 'len_insts', 'xregs', 'fregs', 'imms',
+                 'symbols', 'operands', 'populated', 'part', 'opvals',
+                 'ret_insts', 'encoding')
+
     def __init__(self, label: int, insts: list, tpe=NONE, xregs=[], fregs=[], imms=[], symbols=[], populated=False):
         self.label = label
         self.tpe = tpe
@@ -29,7 +60,19 @@ class Word():
         self.operands = xregs + fregs + [ imm[0] for imm in imms ] + symbols
 
         self.populated = populated
+        self.part = MAIN
+        self.opvals = {}
+
+        # Text and machine words are produced on demand from insts/opvals
         self.ret_insts = []
+        self.encoding = None
+
+    def copy(self):
+        """ Copy sharing insts, opvals and the cached text/encoding """
+        word = Word.__new__(Word)
+        for attr in Word.__slots__:
+            setattr(word, attr, getattr(self, attr))
+        return word
 
     def pop_inst(self, inst, opvals):
         for (op, val) in opvals.items():
@@ -37,61 +80,103 @@ class Word():
 
         return inst
 
+    def pop_operand(self, op):
+        if op.__class__ == tuple:
+            return '{}({})'.format(self.opvals.get(op[0], op[0]),
+                                   self.opvals.get(op[1], op[1]))
+        return self.opvals.get(op, op)
+
     def populate(self, opvals, part=MAIN):
         for op in self.operands:
             assert op in opvals.keys(), \
                 '{} is not in label {} Word opvals'.format(op, self.label)
 
-        pop_insts = []
-        for inst in self.insts:
-            p_inst = self.pop_inst(inst, opvals)
-            pop_insts.append(p_inst)
-
-        ret_insts = [ '{:<8}{:<42}'.format(part + str(self.label) + ':',
-                                           pop_insts.pop(0)) ]
-
-        for i in range(len(pop_insts)):
-            ret_insts.append('{:8}{:<42}'.format('', pop_insts.pop(0)))
-
+        self.opvals = opvals
+        self.part = part
         self.populated = True
-        self.ret_insts = ret_insts
+        self.ret_insts = []
+        self.encoding = None
 
     def reset_label(self, new_label, part):
         old_label = self.label
         self.label = new_label
 
         if self.populated:
-            self.ret_insts[0] = '{:8}{:<42}'.format(part + str(self.label) + ':',
-                                                    self.ret_insts[0][8:])
+            self.part = part
+            self.ret_insts = []
             return (old_label, new_label)
         else:
             return None
 
     def repop_label(self, label_map, max_label, part):
-        if self.populated:
-            for i in range(len(self.ret_insts)):
-                inst = self.ret_insts[i]
-                tmps = inst.split(', ' + part)
+        if not self.populated:
+            return
 
-                if len(tmps) > 1:
-                    label = tmps[1].split(' ')[0]
+        opvals = dict(self.opvals)
+        for op in self.symbols:
+            val = opvals[op]
+            if val.startswith(part):
+                old = int(val[len(part):])
+                new = label_map.get(old, random.randint(self.label + 1, max_label))
+                opvals[op] = part + '{}'.format(new)
 
-                    old = int(label)
-                    new = label_map.get(old, random.randint(self.label + 1, max_label))
+        # Words read back from .si files carry the labels in their text
+        insts = list(self.insts)
+        for i in range(len(insts)):
+            inst = insts[i]
+            tmps = inst.split(', ' + part)
 
-                    new_inst = inst[8:].replace(part + '{}'.format(old), part + '{}'.format(new))
-                    inst = '{:<8}{:<50}'.format(inst[0:8], new_inst)
+            if len(tmps) > 1:
+                label = tmps[1].split(' ')[0]
 
-                    self.ret_insts[i] = inst
-        else:
-            return
+                old = int(label)
+                new = label_map.get(old, random.randint(self.label + 1, max_label))
+
+                insts[i] = inst.replace(part + '{}'.format(old), part + '{}'.format(new))
+
+        self.ret_insts = []
+        # The encoding does not depend on the label of the word itself
+        if opvals != self.opvals or insts != self.insts:
+            self.opvals = opvals
+            self.insts = insts
+            self.encoding = None
 
     def get_insts(self):
         assert self.populated, \
             'Word is not populated'
 
+        if not self.ret_insts:
+            pop_insts = [ self.pop_inst(inst, self.opvals) for inst in self.insts ]
+
+            ret_insts = [ '{:<8}{:<42}'.format(self.part + str(self.label) + ':',
+                                               pop_insts[0]) ]
+            for inst in pop_insts[1:]:
+                ret_insts.append('{:8}{:<42}'.format('', inst))
+
+            self.ret_insts = ret_insts
+
         return self.ret_insts
 
+    def get_encoding(self, assembler):
+        """ Machine words of the word as (32-bit word, fixup) pairs,
+        label references are left to the assembler as fixups """
+        assert self.populated, \
+            'Word is not populated'
+
+        if self.encoding is None:
+            encoding = []
+            for inst in self.insts:
+                (mnemonic, operands) = parse_template(inst)
+                operands = [ self.pop_operand(op) for op in operands ]
+                encoding += assembler.encode_insn(mnemonic, operands)
+
+            self.encoding = encoding
+
+        return self.encoding
+
+    def get_entry(self, assembler):
+        return (self.part + str(self.label), self.get_encoding(assembler))
+
 def word_jal(opcode, syntax, xregs, fregs, imms, symbols):
     tpe = CF_J
     insts = [ syntax ]
@@ -7,6 +7,11 @@ Also, coverage map has to be restored.
 
 It simply instruments store, and restore coverage map to
 input verilog file using hierarchy.txt.
+
+All covMaps are saved to a single covmap.hex, packed 8 bits per byte
+(LSB first), each covMap starting on a byte boundary. Every byte is a
+line of two hex digits: $fwrite of a raw NUL byte is dropped by the
+simulators writing through fputs, which would shift the rest of the map.
 """
 
 import sys
@@ -113,6 +118,7 @@ def main():
                     nfd.write('  integer i;\n')
                     nfd.write('  integer fd;\n')
                     nfd.write('  integer c;\n')
+                    nfd.write('  reg [7:0] b;\n')
                     nfd.write('  reg [8*100:1] out;\n')
                     nfd.write('  initial begin\n')
                     nfd.write('    if ($value$plusargs("OUT=%s", out)) begin\n')
@@ -121,29 +127,39 @@ def main():
                     nfd.write('  end\n')
                     nfd.write('  always @(posedge clock) begin\n')
                     nfd.write('    if (cov_restore) begin\n')
-                    
+                    nfd.write('      fd = $fopen({out, "/covmap/covmap.hex"}, "r");\n')
+                    nfd.write('      if (fd == 0)\n')
+                    nfd.write('        $display("No saved covmap, starting from zero");\n')
+                    nfd.write('      else begin\n')
+
                     for (path, size) in covPathSize:
                         if size != 0:
-                            nfd.write('      fd = $fopen({out, "/covmap/%s.dat"}, "r");\n' % path)
-                            nfd.write('      if (fd == 0)\n')
-                            nfd.write('        $display("No saved %s, starting from zero", "{}");\n'.format(path))
-                            nfd.write('      else begin\n')
                             nfd.write('        for (i=0; i<%d; i=i+1) begin\n' % size)
-                            nfd.write('          c = $fgetc(fd);\n');
-                            nfd.write('          %s[i] = c[0];\n' % path)
+                            nfd.write('          if (i % 8 == 0) begin\n')
+                            nfd.write('            c = $fscanf(fd, "%h\\n", b);\n')
+                            nfd.write('            if (c != 1) b = 0;\n')
+                            nfd.write('          end\n')
+                            nfd.write('          %s[i] = b[i %% 8];\n' % path)
                             nfd.write('        end\n')
-                            nfd.write('        $fclose(fd);\n')
-                            nfd.write('      end\n')
 
+                    nfd.write('        $fclose(fd);\n')
+                    nfd.write('      end\n')
                     nfd.write('    end\n')
                     nfd.write('    if (cov_store) begin\n')
+                    nfd.write('      fd = $fopen({{{out, "/covmap-"}, `toAscii(proc_num)}, "/covmap.hex"}, "w");\n')
 
                     for (path, size) in covPathSize:
                         if size != 0:
-                            nfd.write('      fd = $fopen({{{out, "/covmap-"}, `toAscii(proc_num)}, "/%s.dat"}, "w");\n' % path)
-                            nfd.write('      for (i=0; i<%d; i=i+1)\n' % size)
-                            nfd.write('        $fwrite(fd, "%0b", {}[i]);\n'.format(path))
-                            nfd.write('      $fclose(fd);\n')
+                            nfd.write('      b = 0;\n')
+                            nfd.write('      for (i=0; i<%d; i=i+1) begin\n' % size)
+                            nfd.write('        b[i %% 8] = %s[i];\n' % path)
+                            nfd.write('        if (i %% 8 == 7 || i == %d) begin\n' % (size - 1))
+                            nfd.write('          $fwrite(fd, "%h\\n", b);\n')
+                            nfd.write('          b = 0;\n')
+                            nfd.write('        end\n')
+                            nfd.write('      end\n')
+
+                    nfd.write('      $fclose(fd);\n')
                     nfd.write('    end\n')
                     nfd.write('  end\n')
                     nfd.write('`endif\n')